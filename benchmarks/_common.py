@@ -0,0 +1,61 @@
+'''Shared setup for the offline benchmark scripts.
+
+The service modules under `src/` import each other as top-level modules and build
+`Settings()` at import time, so the benchmarks put `src/` on the path and fill in
+placeholder credentials for anything not configured in the environment or `.env`.
+'''
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = ROOT_DIR / 'src'
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+
+_OFFLINE_ENV = {
+    'KAFKA_BOOTSTRAP_SERVERS': 'localhost:9092',
+    'KAFKA_TOPIC': 'news-benchmark',
+    'KAFKA_USERNAME': 'offline',
+    'KAFKA_PASSWORD': 'offline',
+    'KAFKA_SECURITY_PROTOCOL': 'PLAINTEXT',
+    'KAFKA_SASL_MECHANISM': 'PLAIN',
+    'KAFKA_ACKS': 'all',
+    'NEWSAPI_KEY': 'offline',
+    'NEWSDATAIO_KEY': 'offline',
+    'NEWS_TOPIC': 'offline',
+    'GOOGLE_API_KEY': 'offline',
+    'QDRANT_COLLECTION_NAME': 'news-benchmark',
+    'QDRANT_ENDPOINT': ':memory:',
+    'QDRANT_API_KEY': 'offline',
+    'QDRANT_CLUSTER': 'offline',
+    'GROQ_API_KEY': 'offline',
+    'GROQ_MODEL_ID': 'offline',
+    'PAGE_CACHE_DIR': '',  # set it to replay article pages cached by a real run
+}
+
+for key, value in _OFFLINE_ENV.items():
+    os.environ.setdefault(key, value)
+
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+
+def percentile(values: list, pct: float) -> float:
+    '''Nearest-rank percentile of `values` (0 for an empty list)'''
+    if not values: return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+@contextmanager
+def timer(timings: list):
+    '''Append the elapsed wall time of the block, in milliseconds, to `timings`'''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((time.perf_counter() - start) * 1000)
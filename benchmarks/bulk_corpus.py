@@ -0,0 +1,97 @@
+'''Bulk export and load of the collection, versus streaming it through the flow again.
+
+Usage:
+    python benchmarks/bulk_corpus.py [--points=20000] [--url=:memory:] [--target_url=:memory:]
+        [--batch_size=256] [--workers=4] [--legacy_every=7] [--embed_ms=0]
+
+The fixture snapshot is embedded as in `retrieval_eval.py` and its chunks are
+repeated under new doc ids, with random vectors, up to `points` in the current
+index's collection at `url`. `bulk.export` writes it to a temporary directory and
+`bulk.load` loads it into the empty Qdrant at `target_url`, as when bootstrapping
+a new environment. One point in `legacy_every`, in scroll order, keeps only the
+payload of the points written before `published_ts`/`doc_id`/`chunk_id` existed,
+so parts mix both kinds and start with a legacy point. Reports points/s and
+on-disk size of the export, checks that both sides return the same top hits and
+payloads, and with `embed_ms` the time re-embedding every chunk one call at a
+time would take instead.
+'''
+import logging
+import os
+import tempfile
+import time
+
+import fire
+import numpy as np
+
+import _common
+from fakes import HashEmbedder
+from fixture_server import load_articles
+from retrieval_eval import embed_snapshot
+
+os.environ['QDRANT_COLLECTION_NAME'] = 'news-bulk-benchmark'
+
+
+def main(points: int = 20000, url: str = ':memory:', target_url: str = ':memory:', batch_size: int = 256,
+         workers: int = 4, legacy_every: int = 7, embed_ms: float = 0.0):
+    '''Report export and load throughput and the size of the exported corpus'''
+
+    logging.disable(logging.INFO)
+
+    from qdrant_client import QdrantClient, models
+
+    import bulk
+    from config.setting import Settings
+    from vector_database import QdrantVectorOutput, point_id
+
+    settings = Settings()
+    dim = settings.GOOGLE_VECTOR_SIZE
+    chunks = embed_snapshot(load_articles(), HashEmbedder(dim=dim))
+    rng = np.random.default_rng(0)
+
+    source = QdrantClient(url)
+    output = QdrantVectorOutput(client=source, sharded=False)
+    output.build('bulk', 0, 1)  # creates the collection, its payload indexes and the alias
+    collection = output.index_collection
+    for start in range(0, points, 1000):
+        size = min(1000, points - start)
+        docs = [chunks[(start + i) % len(chunks)] for i in range(size)]
+        doc_ids = [f'{doc.doc_id}-{start + i}' for i, doc in enumerate(docs)]
+        source.upsert(collection, wait=True, points=models.Batch(
+            ids=[point_id(doc_id, doc.chunk_id) for doc_id, doc in zip(doc_ids, docs)],
+            vectors=rng.normal(size=(size, dim)).astype(np.float32).tolist(),
+            payloads=[{**doc.metadata, 'doc_id': doc_id, 'chunk_id': doc.chunk_id}
+                      for doc_id, doc in zip(doc_ids, docs)]))
+    if legacy_every:  # in scroll order, so the first point of a part is a legacy one
+        ids = [p.id for page in bulk._pages(source, collection, 1000) for p in page]
+        source.delete_payload(collection, keys=['published_ts', 'doc_id', 'chunk_id'],
+                              points=ids[::legacy_every], wait=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        bulk.export(directory, client=source)
+        export_seconds = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+
+        target = QdrantClient(target_url)
+        start = time.perf_counter()
+        bulk.load(directory, batch_size=batch_size, workers=workers, client=target)
+        load_seconds = time.perf_counter() - start
+
+    vector = rng.normal(size=dim).tolist()
+    hits = lambda client: [p.id for p in client.query_points(settings.QDRANT_COLLECTION_NAME, query=vector,
+                                                            limit=10).points]
+    loaded = target.count(settings.QDRANT_COLLECTION_NAME, exact=True).count
+    payloads = lambda client: {p.id: p.payload for page in bulk._pages(client, settings.QDRANT_COLLECTION_NAME, 1000)
+                               for p in page}
+    print(f'\n{"step":<8}{"points":>9}{"seconds":>9}{"points/s":>10}')
+    print(f'{"export":<8}{points:>9}{export_seconds:>9.2f}{points / export_seconds:>10.0f}')
+    print(f'{"load":<8}{loaded:>9}{load_seconds:>9.2f}{loaded / load_seconds:>10.0f}')
+    print(f'\n{size / 2**20:.1f} MiB exported ({size / points:.0f} bytes/point, {dim}-d float32 vectors), '
+          f'same top 10 after load: {hits(source) == hits(target)}, '
+          f'same payloads: {payloads(source) == payloads(target)}')
+    if embed_ms:
+        print(f're-embedding {points} chunks at {embed_ms} ms each: {points * embed_ms / 1000 / 60:.1f} min')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
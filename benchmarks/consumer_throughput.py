@@ -0,0 +1,114 @@
+'''Consumer decode + validation throughput, per message versus micro-batched.
+
+Usage:
+    python benchmarks/consumer_throughput.py [--messages=20000] [--batch_sizes=100,500,1000]
+    python benchmarks/consumer_throughput.py --brokers=localhost:9092 --topic=news [--batch_sizes=...]
+
+Offline, a recorded topic is built from the fixture articles serialized exactly as
+`KafkaProducerSwarm` sends them and replayed through a bytewax `TestingSource`
+into the decode step: one message per item with the previous path (`json.loads` +
+`BaseDocument.from_json`) and with `process_messages`, then as micro-batches
+with `process_batch` at each batch size.
+
+With `--brokers` the topic is replayed from the beginning through
+`KafkaBatchSource` in a bytewax dataflow (input -> `process_batch`), once per batch
+size, and msgs/s covers consuming, decoding and validating until the end of the topic.
+'''
+import json
+import logging
+import time
+from uuid import uuid4
+
+import fire
+
+import _common
+from fixture_server import load_articles, raw_documents
+
+
+def recorded_topic(messages: int) -> list:
+    from bytewax.connectors.kafka import KafkaSourceMessage
+    from config.pydantic_models import BaseDocument
+
+    payloads = [BaseDocument(**raw).to_kafka_payload() for raw in raw_documents(load_articles())]
+    topic = []
+    for offset in range(messages):
+        payload = {**payloads[offset % len(payloads)], 'article_id': str(uuid4())}
+        topic.append(KafkaSourceMessage(key=None, value=json.dumps(payload).encode('utf-8'),
+                                        topic='news-benchmark', partition=0, offset=offset))
+    return topic
+
+
+def _legacy(message) -> list:
+    from config.pydantic_models import BaseDocument
+    return [BaseDocument.from_json(json.loads(message.value.decode('utf-8')))]
+
+
+def _run(source, step) -> tuple:
+    '''Run input -> `step` through bytewax, return (documents, seconds)'''
+    from bytewax.dataflow import Dataflow
+    from bytewax.testing import run_main
+    import bytewax.operators as op
+
+    documents = [0]
+
+    def count(step_id: str, document) -> None:
+        documents[0] += 1
+
+    dataflow = Dataflow('consumer-throughput')
+    stream = op.flat_map('decode', op.input('kafka_input', dataflow, source), step)
+    op.inspect('count', stream, count)
+    start = time.perf_counter()
+    run_main(dataflow)
+    return documents[0], time.perf_counter() - start
+
+
+def _replay_offline(messages: int, batch_sizes: list) -> list:
+    from bytewax.testing import TestingSource
+    from consumer import process_batch, process_messages
+
+    topic = recorded_topic(messages)
+    rows = []
+    for name, step in (('per message, json', _legacy), ('per message, orjson', process_messages)):
+        rows.append((name, *_run(TestingSource(topic), step), messages))
+    for batch_size in batch_sizes:
+        batches = [topic[i:i + batch_size] for i in range(0, len(topic), batch_size)]
+        rows.append((f'batch {batch_size}', *_run(TestingSource(batches), process_batch), messages))
+    return rows
+
+
+def _replay_kafka(brokers: str, topic: str, batch_sizes: list) -> list:
+    from confluent_kafka import OFFSET_BEGINNING
+
+    from consumer import KafkaBatchSource, kafka_consumer_config, process_batch
+
+    config = {**kafka_consumer_config(), 'bootstrap.servers': brokers}
+    rows = []
+    for batch_size in batch_sizes:
+        consumed = [0]
+
+        def step(messages: list) -> list:
+            consumed[0] += len(messages)
+            return process_batch(messages)
+
+        source = KafkaBatchSource([brokers], [topic], tail=False, starting_offset=OFFSET_BEGINNING,
+                                  add_config=config, batch_size=batch_size)
+        rows.append((f'kafka batch {batch_size}', *_run(source, step), consumed[0]))
+    return rows
+
+
+def main(messages: int = 20_000, batch_sizes=(100, 500, 1000), brokers: str = None, topic: str = None):
+    '''Report consumer msgs/s for the per-message and micro-batched decode paths'''
+
+    logging.disable(logging.INFO)
+    if isinstance(batch_sizes, (int, str)):
+        batch_sizes = [int(size) for size in str(batch_sizes).split(',')]
+
+    rows = _replay_kafka(brokers, topic, batch_sizes) if brokers else _replay_offline(messages, batch_sizes)
+
+    print(f'{"path":<22}{"messages":>10}{"documents":>11}{"seconds":>9}{"msgs/s":>11}')
+    for name, documents, seconds, count in rows:
+        print(f'{name:<22}{count:>10}{documents:>11}{seconds:>9.2f}{count / seconds:>11.0f}')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
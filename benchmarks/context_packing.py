@@ -0,0 +1,123 @@
+'''Prompt size and latency of the summary context: all top-k articles vs. MMR packing.
+
+Usage:
+    python benchmarks/context_packing.py [--queries=20] [--candidates=24] [--with_llm=False]
+
+Each fixture query gets a deterministic candidate set shaped like real search
+results: several chunks of the same article (same url and content), syndicated
+copies of one story under different urls, and distinct related articles.
+With `--with_llm` the rendered prompts are also streamed through Groq to measure
+time to first token and total generation time (needs GROQ_API_KEY/GROQ_MODEL_ID).
+'''
+import time
+import random
+
+import fire
+import numpy as np
+
+import _common
+from _common import percentile, timer
+
+from jinja2 import Environment, FileSystemLoader
+from context_builder import build_context, estimate_tokens
+
+
+FIXTURE_QUERIES = [
+    'latest AI chips', 'arsenal transfer news', 'nigeria fuel subsidy', 'openai funding round',
+    'premier league results', 'apple iphone launch', 'central bank interest rates',
+    'electric vehicle sales', 'lagos flooding', 'champions league draw',
+]
+
+_VOCABULARY = ('market model league season government company growth report players '
+               'investors chip launch policy minister fans revenue update data court '
+               'election transfer deal startup security network energy').split()
+
+
+def _article(rng: random.Random, sentences: int) -> str:
+    return ' '.join(
+        ' '.join(rng.choice(_VOCABULARY) for _ in range(rng.randint(12, 24))).capitalize() + '.'
+        for _ in range(sentences)
+    )
+
+
+def make_candidates(query_index: int, n_candidates: int, dim: int = 768) -> list:
+    '''Deterministic search results for one fixture query, best score first'''
+    rng = random.Random(query_index)
+    np_rng = np.random.default_rng(query_index)
+    centroid = np_rng.normal(size=dim)
+
+    candidates = []
+    while len(candidates) < n_candidates:
+        n = len(candidates)
+        vector = centroid + np_rng.normal(scale=1.0, size=dim)
+        content, url = _article(rng, rng.randint(20, 60)), f'https://news.example/{query_index}/{n}'
+        copies = rng.choice([1, 1, 2, 3])  # extra chunks / syndicated copies of the same story
+        for copy in range(copies):
+            candidates.append({
+                'content': content,
+                'title': f'Story {n}',
+                'original': url if copy % 2 == 0 else f'{url}-syndicated',
+                'image': None,
+                'date': '2025-10-06 10:00:00',
+                'vector': (vector + np_rng.normal(scale=0.01, size=dim)).tolist(),
+            })
+
+    candidates = candidates[:n_candidates]
+    for i, doc in enumerate(candidates):
+        doc['score'] = 0.85 - 0.01 * i
+        doc['source_num'] = i + 1
+    return candidates
+
+
+def _stream_llm(prompt: str, query: str) -> tuple:
+    from langchain_groq import ChatGroq
+    from config.setting import Settings
+
+    settings = Settings()
+    llm = ChatGroq(model=settings.GROQ_MODEL_ID, api_key=settings.GROQ_API_KEY, temperature=0.1)
+    start = time.perf_counter()
+    first_token = None
+    for chunk in llm.stream([('system', prompt), ('human', query)]):
+        if chunk.content and first_token is None:
+            first_token = time.perf_counter() - start
+    return (first_token or 0.0) * 1000, (time.perf_counter() - start) * 1000
+
+
+def main(queries: int = 20, candidates: int = 24, top_k: int = 8, with_llm: bool = False):
+    '''Report prompt tokens and prompt build latency for the baseline and packed contexts'''
+
+    env = Environment(loader=FileSystemLoader(str(_common.SRC_DIR / 'prompts')))
+    template = env.get_template('summary_prompt.j2')
+
+    results = {'baseline': {'tokens': [], 'build_ms': [], 'ttft_ms': [], 'total_ms': []},
+               'packed': {'tokens': [], 'build_ms': [], 'ttft_ms': [], 'total_ms': []}}
+
+    for i in range(queries):
+        query = FIXTURE_QUERIES[i % len(FIXTURE_QUERIES)]
+        pool = make_candidates(i, candidates)
+
+        for name in results:
+            with timer(results[name]['build_ms']):
+                docs = pool[:top_k] if name == 'baseline' else build_context(pool)
+                prompt = template.render(
+                    query=query,
+                    documents=[{'content': d['content'], 'source_num': d['source_num']} for d in docs])
+            results[name]['tokens'].append(estimate_tokens(prompt))
+            if with_llm:
+                ttft, total = _stream_llm(prompt, query)
+                results[name]['ttft_ms'].append(ttft)
+                results[name]['total_ms'].append(total)
+
+    print(f'{"context":<10}{"tokens p50":>12}{"tokens p99":>12}{"build p50 ms":>14}'
+          f'{"ttft p50 ms":>13}{"total p50 ms":>14}')
+    for name, r in results.items():
+        print(f'{name:<10}{percentile(r["tokens"], 50):>12}{percentile(r["tokens"], 99):>12}'
+              f'{percentile(r["build_ms"], 50):>14.2f}{percentile(r["ttft_ms"], 50):>13.1f}'
+              f'{percentile(r["total_ms"], 50):>14.1f}')
+
+    baseline, packed = sum(results['baseline']['tokens']), sum(results['packed']['tokens'])
+    print(f'\nprompt-token reduction: {100 * (1 - packed / baseline):.1f}%')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
@@ -0,0 +1,142 @@
+'''Deterministic local stand-ins for the external services used by the pipeline.'''
+import hashlib
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+
+import numpy as np
+
+
+_TOKEN = re.compile(r'\w+')
+
+
+class HashEmbedder:
+    '''Drop-in for `GoogleTextEmbedder`: hashed bag-of-words vectors, unit normalized.
+
+    Texts sharing words get similar vectors, so retrieval over fixture articles
+    behaves sensibly. `latency` simulates the embedding API round trip.'''
+
+    def __init__(self, dim: int = 768, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.model_id = 'hash-embedder'
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in _TOKEN.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], 'little') % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def __call__(self, text: str, task_type: str = 'RETRIEVAL_DOCUMENT') -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+    def embed_batch(self, texts: List[str], task_type: str = 'RETRIEVAL_DOCUMENT') -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+
+class FakeMessage:
+    '''What confluent_kafka hands to delivery callbacks'''
+
+    def __init__(self, topic: str, value: bytes, key: Optional[bytes] = None, headers: Optional[list] = None):
+        self._topic, self._value, self._key, self._headers = topic, value, key, headers
+
+    def topic(self) -> str:
+        return self._topic
+
+    def value(self) -> bytes:
+        return self._value
+
+    def key(self) -> Optional[bytes]:
+        return self._key
+
+    def headers(self) -> Optional[list]:
+        return self._headers
+
+    def partition(self) -> int:
+        return 0
+
+    def offset(self) -> int:
+        return 0
+
+
+class FakeProducer:
+    '''In-memory `confluent_kafka.Producer`: keeps produced messages and acks them on poll/flush.
+
+    `delivery_rate` (messages/s) simulates a slow broker: a message is only acked
+    once its turn has come. With `max_queue`, `produce` raises `BufferError` while
+    that many messages wait for their ack, like librdkafka's local queue.'''
+
+    def __init__(self, max_queue: Optional[int] = None, delivery_rate: Optional[float] = None):
+        self.messages: List[FakeMessage] = []
+        self._pending: List[tuple] = []
+        self._lock = threading.Lock()
+        self.max_queue = max_queue
+        self.delivery_rate = delivery_rate
+        self._next_due = 0.0
+
+    def produce(self, topic: str, value: bytes = None, key: bytes = None, headers: list = None,
+                callback=None, on_delivery=None, **kwargs):
+        message = FakeMessage(topic, value, key, headers)
+        with self._lock:
+            if self.max_queue is not None and len(self._pending) >= self.max_queue:
+                raise BufferError('Local: Queue full')
+            due = 0.0
+            if self.delivery_rate:
+                due = self._next_due = max(time.monotonic(), self._next_due) + 1 / self.delivery_rate
+            self.messages.append(message)
+            self._pending.append((callback or on_delivery, message, due))
+
+    def poll(self, timeout: float = 0) -> int:
+        if self.delivery_rate and timeout and self._pending:
+            time.sleep(min(max(self._pending[0][2] - time.monotonic(), 0), timeout))
+        now = time.monotonic()
+        with self._lock:
+            done = 0
+            while done < len(self._pending) and self._pending[done][2] <= now:
+                done += 1
+            delivered, self._pending = self._pending[:done], self._pending[done:]
+        for callback, message, _ in delivered:
+            if callback:
+                callback(None, message)
+        return len(delivered)
+
+    def flush(self, timeout: float = -1) -> int:
+        while self._pending:
+            self.poll(1)
+        return 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+class FakeStreamingLLM:
+    '''Chat model stand-in: streams a canned, cited answer word by word.
+
+    `first_token_latency` and `token_latency` simulate the provider's timing.'''
+
+    def __init__(self, first_token_latency: float = 0.0, token_latency: float = 0.0, words: int = 120):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.words = words
+
+    def stream(self, messages):
+        prompt = messages[0][1]
+        sources = sorted(set(re.findall(r'document \[(\d+)\]', prompt)), key=int) or ['1']
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        for i in range(self.words):
+            if self.token_latency and i:
+                time.sleep(self.token_latency)
+            word = 'news'
+            if i % 20 == 19:
+                word += f' [{sources[(i // 20) % len(sources)]}].'
+            yield SimpleNamespace(content=word + ' ')
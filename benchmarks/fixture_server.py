@@ -0,0 +1,175 @@
+'''Local HTTP server replaying the news feeds and article pages from `fixtures/articles.json`.
+
+Each source gets an RSS feed at `/feed/<source>.xml` shaped like the real one
+(guid, pubDate, dc:creator, description and content:encoded), and every entry
+links to `/article/<source>/<n>.html` with the body wrapped in the div the
+scraper for that source looks for. Pages carry an ETag and answer a matching
+If-None-Match with 304. `copies` repeats each fixture article under
+new ids to grow the feeds; `page_delay` adds a fixed latency to article pages.
+'''
+import hashlib
+import json
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from uuid import NAMESPACE_URL, uuid5
+
+from _common import FIXTURES_DIR
+
+
+# settings field each source feed url is configured by
+SOURCE_SETTINGS = {
+    'techcrunch': 'TECHCRUNCH_URL',
+    'Theverge': 'THEVERGE_URL',
+    'channelstv': 'CHANNELSTV_URL',
+    'arise': 'ARISE_URL',
+    'art_tech': 'ARTS_URL',
+    'cbssports': 'CBS_URL',
+}
+
+# div the scraper reads the article body from, for sources that fetch the page
+BODY_CLASSES = {
+    'techcrunch': 'entry-content wp-block-post-content is-layout-constrained wp-block-post-content-is-layout-constrained',
+    'cbssports': 'Article-bodyContent',
+}
+
+
+def load_articles(path: str = None) -> List[dict]:
+    with open(path or FIXTURES_DIR / 'articles.json') as f:
+        return json.load(f)
+
+
+def raw_documents(articles: List[dict], markup: bool = False) -> List[dict]:
+    '''`BaseDocument` keyword arguments for the articles, as a scraper would hand them over.
+
+    The body is the extracted page text, or the feed's `content:encoded` markup with `markup`.'''
+    documents = []
+    for n, article in enumerate(articles):
+        url = f'https://news.example/{article["source"]}/{n}?utm_source=rss'
+        if markup:
+            content = ''.join(f'<p>{escape(p)}</p>\n' for p in article['paragraphs'])
+        else:
+            content = '\n\n'.join(article['paragraphs'])
+        documents.append(dict(
+            article_id=str(uuid5(NAMESPACE_URL, url)),  # Qdrant point ids must be UUIDs
+            title=article['title'],
+            url=url,
+            published_at=article['published'],
+            source_name=article['source'],
+            image_url=f'https://news.example/images/{n}.jpg',
+            content=content,
+            description=article['summary'],
+            author=article['author'],
+        ))
+    return documents
+
+
+class FixtureServer:
+    '''Serves the fixture feeds and pages on 127.0.0.1 from a background thread'''
+
+    def __init__(self, copies: int = 1, page_delay: float = 0.0):
+        self.copies = copies
+        self.page_delay = page_delay
+        self.articles: Dict[str, List[dict]] = {}
+        for article in load_articles():
+            self.articles.setdefault(article['source'], []).append(article)
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def feed_urls(self) -> Dict[str, str]:
+        '''Settings field -> local feed url, to export before `Settings()` is built'''
+        return {setting: f'{self.base_url}/feed/{source}.xml' for source, setting in SOURCE_SETTINGS.items()}
+
+    def entries(self, source: str) -> List[tuple]:
+        return [(n, article, copy)
+                for copy in range(self.copies)
+                for n, article in enumerate(self.articles.get(source, []))]
+
+    def __enter__(self) -> 'FixtureServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def render_feed(self, source: str) -> str:
+        items = []
+        for n, article, copy in self.entries(source):
+            index = copy * len(self.articles[source]) + n
+            body = ''.join(f'<p>{escape(p)}</p>' for p in article['paragraphs'])
+            content = f'<figure><img src="{self.base_url}/img/{source}/{index}.jpg"/></figure>{body}'
+            suffix = f' ({copy})' if copy else ''
+            items.append(f'''
+    <item>
+      <title>{escape(article['title'] + suffix)}</title>
+      <link>{self.base_url}/article/{source}/{index}.html</link>
+      <guid isPermaLink="false">{self.base_url}/?p={source}-{index}</guid>
+      <pubDate>{article['published']}</pubDate>
+      <dc:creator><![CDATA[{article['author']}]]></dc:creator>
+      <description><![CDATA[{article['summary']}]]></description>
+      <content:encoded><![CDATA[{content}]]></content:encoded>
+    </item>''')
+        return f'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/" xmlns:dc="http://purl.org/dc/elements/1.1/">
+  <channel>
+    <title>{source}</title>
+    <link>{self.base_url}</link>
+    <description>{source} fixture feed</description>{''.join(items)}
+  </channel>
+</rss>'''
+
+    def render_page(self, source: str, index: int) -> str:
+        articles = self.articles[source]
+        article = articles[index % len(articles)]
+        body = ''.join(f'<p>{escape(p)}</p>' for p in article['paragraphs'])
+        body_class = BODY_CLASSES.get(source, 'article-body')
+        return (f'<html><head><title>{escape(article["title"])}</title></head><body>'
+                f'<nav><p>Menu</p></nav><h1>{escape(article["title"])}</h1>'
+                f'<div class="{body_class}">{body}</div><footer><p>Footer</p></footer></body></html>')
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = self.path.strip('/').split('/')
+                try:
+                    if parts[0] == 'feed':
+                        body, content_type = server.render_feed(parts[1].removesuffix('.xml')), 'application/rss+xml'
+                    elif parts[0] == 'article':
+                        if server.page_delay:
+                            time.sleep(server.page_delay)
+                        index = int(parts[2].removesuffix('.html'))
+                        body, content_type = server.render_page(parts[1], index), 'text/html'
+                    else:
+                        raise KeyError(self.path)
+                except (KeyError, IndexError, ValueError):
+                    self.send_error(404)
+                    return
+                payload = body.encode('utf-8')
+                etag = f'"{hashlib.md5(payload).hexdigest()}"'
+                if parts[0] == 'article' and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                if parts[0] == 'article':
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,104 @@
+'''Import-time regression check for the service entry points.
+
+Usage:
+    python benchmarks/import_time.py [--runs=5] [--update=False]
+
+Each entry point is imported in a fresh interpreter under `python -X importtime`,
+from `src/` like the cron job and the containers do. The best of `runs` is
+compared with the budget in `import_budget.json`, and the check also fails when an
+entry point pulls in a module it should only load lazily. Use `--update` after an
+intended change to reset the budgets to 1.5x the current timings.
+'''
+import json
+import os
+import re
+import subprocess
+import sys
+
+import fire
+
+import _common
+from _common import SRC_DIR
+
+
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_budget.json')
+
+# entry point -> (modules its process imports, modules it must not import at startup)
+ENTRY_POINTS = {
+    'producer': (['producer'],
+                 ['unstructured', 'langchain_text_splitters', 'google.generativeai', 'transformers',
+                  'dateutil.parser', 'qdrant_client', 'bytewax', 'numpy']),
+    'flow': (['flow'],
+             ['streamlit', 'langchain_groq', 'transformers', 'unstructured']),
+    'app': (['streamlit', 'search', 'summary'],
+            ['bytewax', 'confluent_kafka', 'unstructured', 'langchain_text_splitters', 'langchain_groq']),
+}
+
+_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def _import_profile(modules: list) -> dict:
+    '''Module -> (cumulative µs, depth) for one cold import of `modules`'''
+    code = '; '.join(f'import {m}' for m in modules) if modules else 'pass'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=SRC_DIR,
+                            env=os.environ.copy(), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'importing {modules} failed:\n{result.stderr[-2000:]}')
+    profile = {}
+    for match in _LINE.finditer(result.stderr):
+        profile[match.group(4)] = (int(match.group(2)), len(match.group(3)) // 2)
+    return profile
+
+
+def measure(modules: list, startup: set) -> tuple:
+    '''Milliseconds spent importing `modules` (interpreter startup excluded) and the modules loaded'''
+    profile = _import_profile(modules)
+    total = sum(us for name, (us, depth) in profile.items() if depth == 0 and name not in startup)
+    return total / 1000, set(profile)
+
+
+def main(runs: int = 5, update: bool = False):
+    '''Fail (exit 1) when an entry point imports slower than its budget or loads a lazy dependency'''
+
+    startup = set(_import_profile([]))
+    budgets = {}
+    if os.path.exists(BUDGET_FILE):
+        with open(BUDGET_FILE) as f:
+            budgets = json.load(f)
+
+    failures, measured = [], {}
+    print(f'{"entry point":<12}{"best ms":>10}{"budget ms":>11}  top imports')
+    for entry, (modules, forbidden) in ENTRY_POINTS.items():
+        timings, loaded = [], set()
+        for _ in range(runs):
+            ms, loaded = measure(modules, startup)
+            timings.append(ms)
+        best = min(timings)
+        measured[entry] = best
+
+        profile = _import_profile(modules)
+        top = sorted(((us, name) for name, (us, depth) in profile.items() if depth == 1), reverse=True)[:3]
+        budget = budgets.get(entry)
+        print(f'{entry:<12}{best:>10.0f}{budget or 0:>11.0f}  '
+              + ', '.join(f'{name} {us / 1000:.0f}ms' for us, name in top))
+
+        if budget and best > budget:
+            failures.append(f'{entry}: {best:.0f}ms exceeds the {budget:.0f}ms budget')
+        leaked = sorted(m for m in forbidden if m in loaded)
+        if leaked:
+            failures.append(f'{entry}: imports {", ".join(leaked)} at startup')
+
+    if update:
+        with open(BUDGET_FILE, 'w') as f:
+            json.dump({entry: round(ms * 1.5) for entry, ms in measured.items()}, f, indent=2)
+        print(f'budgets written to {BUDGET_FILE}')
+        return
+
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
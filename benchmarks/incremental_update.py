@@ -0,0 +1,153 @@
+'''Embedding calls spent on edited articles, incremental versus full re-embedding.
+
+Usage:
+    python benchmarks/incremental_update.py [--chunk_size=200] [--chunk_overlap=0] [--sharded]
+
+The fixture articles go through the dataflow three times in one process, against
+the same in-memory Qdrant: as first published, then edited (the last paragraph
+corrected, an update appended as for a live blog, the summary amended and the
+publication date moved 8 days later) and then resent unchanged. Beforehand every
+article is stored as one point under its doc id, the way articles were indexed
+before they were chunked. Each round reports the chunks of the articles, the
+chunks actually embedded (a full re-embedding would embed them all) and the
+points in the collection, and checks that every article is indexed with exactly
+the chunks of its latest version, each with its latest metadata, and nothing
+else: no pre-chunking point, with `--sharded` no copy in the shard of the old
+date. Articles are short, so the chunk size is lowered to get several chunks per
+article.
+
+Chunk boundaries follow character counts, so an edit re-embeds the chunk it falls
+in and every chunk after it: appended updates and late corrections are cheap, a
+correction in the first paragraph re-embeds most of the article.
+'''
+import contextlib
+import io
+import json
+import logging
+import os
+from datetime import timedelta
+from email.utils import format_datetime, parsedate_to_datetime
+
+import fire
+
+import _common
+from fakes import FakeProducer, HashEmbedder
+from fixture_server import load_articles, raw_documents
+
+
+class CountingEmbedder(HashEmbedder):
+    def __init__(self, dim: int):
+        super().__init__(dim=dim)
+        self.calls = 0
+
+    def __call__(self, text: str, task_type: str = 'RETRIEVAL_DOCUMENT') -> list:
+        self.calls += 1
+        return super().__call__(text, task_type)
+
+
+def edited(articles: list) -> list:
+    '''A correction in the last paragraph and an update appended to every article'''
+    updated = []
+    for article in articles:
+        *paragraphs, last = article['paragraphs']
+        paragraphs = [*paragraphs, last.replace(' the ', ' this ', 1) + ' (corrected)',
+                      f'Update: {article["source"]} confirmed the details of this report later in the day.']
+        published = parsedate_to_datetime(article['published']) + timedelta(days=8)
+        updated.append({**article, 'paragraphs': paragraphs, 'summary': f'{article["summary"]} (updated)',
+                        'published': format_datetime(published)})
+    return updated
+
+
+def messages(articles: list) -> list:
+    from bytewax.connectors.kafka import KafkaSourceMessage
+    from config.pydantic_models import BaseDocument
+
+    return [KafkaSourceMessage(key=None, value=json.dumps(BaseDocument(**raw).to_kafka_payload()).encode('utf-8'),
+                               topic='news-benchmark', partition=0, offset=offset)
+            for offset, raw in enumerate(raw_documents(articles))]
+
+
+def refined(articles: list) -> list:
+    from config.pydantic_models import BaseDocument, RefinedDocument
+
+    return [RefinedDocument.from_base(BaseDocument(**raw)) for raw in raw_documents(articles)]
+
+
+def expected_chunks(articles: list) -> dict:
+    '''doc_id -> (chunk_ids, metadata) of the articles as they are now'''
+    from config.pydantic_models import ChuckedDocument
+
+    return {doc.doc_id: ({chunk.chunk_id for chunk in ChuckedDocument.from_refined(doc, None)}, doc.metadata)
+            for doc in refined(articles)}
+
+
+def indexed_points(client, collections: list) -> dict:
+    '''doc_id (None for pre-chunking points) -> [payload] of every point of the collections'''
+    points = {}
+    for collection in collections:
+        offset = None
+        while True:
+            page, offset = client.scroll(collection, limit=1000, offset=offset, with_vectors=False)
+            for point in page:
+                points.setdefault(point.payload.get('doc_id'), []).append(point.payload)
+            if offset is None:
+                break
+    return points
+
+
+def main(chunk_size: int = 200, chunk_overlap: int = 0, sharded: bool = False):
+    '''Report chunks embedded per round and check the collection holds only the latest chunks'''
+
+    os.environ['GOOGLE_CHUNCK_MAX_INPUT_LENGTH'] = str(chunk_size)
+    os.environ['GOOGLE_CHUNCK_OVERLAP'] = str(chunk_overlap)
+    os.environ['QDRANT_SHARDING'] = 'weekly' if sharded else 'none'
+    logging.disable(logging.INFO)
+
+    from bytewax.testing import TestingSource, run_main
+    from qdrant_client import QdrantClient, models
+
+    from config.setting import Settings
+    from dead_letter import DeadLetterQueue
+    from vector_database import QdrantVectorOutput, QdrantVectorSink, list_shards, shard_name
+    import flow
+
+    settings = Settings()
+    client = QdrantClient(':memory:')
+    embedder = CountingEmbedder(dim=settings.GOOGLE_VECTOR_SIZE)
+    dead_letter = DeadLetterQueue(FakeProducer())
+    original = load_articles()
+
+    base = QdrantVectorOutput(client=client).index_collection
+    for doc in refined(original):  # indexed before chunking: one point, id=doc_id, no doc_id payload
+        collection = shard_name(base, doc.metadata.get('published_ts')) if sharded else base
+        QdrantVectorSink(client, collection, sharded=False)
+        client.upsert(collection, wait=True, points=[models.PointStruct(
+            id=doc.doc_id, vector=embedder._embed(doc.full_text), payload=doc.metadata)])
+
+    print(f'{"round":<12}{"chunks":>8}{"embedded":>10}{"points":>8}')
+    for name, articles in (('published', original), ('edited', edited(original)),
+                           ('resent', edited(original))):
+        output = QdrantVectorOutput(client=client, dead_letter=dead_letter)
+        dataflow = flow.build(source=TestingSource([messages(articles)]), sink=output,
+                              embedding_model=embedder, dead_letter=dead_letter)
+        embedder.calls = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_main(dataflow)
+
+        expected = expected_chunks(articles)
+        collections = list_shards(client, output.index_collection) if sharded else [output.index_collection]
+        indexed = indexed_points(client, collections)
+        assert None not in indexed, f'{name}: {len(indexed[None])} pre-chunking points left'
+        for doc_id, (chunk_ids, metadata) in expected.items():
+            payloads = indexed.get(doc_id, [])
+            assert sorted(p['chunk_id'] for p in payloads) == sorted(chunk_ids), \
+                f'{name}: {doc_id} is not indexed with its latest chunks'
+            assert all({k: p.get(k) for k in metadata} == metadata for p in payloads), \
+                f'{name}: {doc_id} has chunks with the metadata of a previous version'
+        chunks = sum(len(chunk_ids) for chunk_ids, _ in expected.values())
+        points = sum(client.count(collection, exact=True).count for collection in collections)
+        print(f'{name:<12}{chunks:>8}{embedder.calls:>10}{points:>8}')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
@@ -0,0 +1,81 @@
+'''Per-message cost of logging on the calling (processing) thread.
+
+Usage:
+    python benchmarks/logging_overhead.py [--messages=50000]
+
+Compares the previous setup (stream + file handlers called synchronously, message
+built with an f-string) with the queue-based handler from `utils.logger`, with and
+without `extra=SAMPLED`, and with the message below the logger level. Output goes
+to os.devnull and a temporary file so terminal speed does not skew the numbers.
+The queued variants also report how long the writer thread needed to drain.
+'''
+import logging
+import os
+import queue
+import tempfile
+import time
+
+import fire
+
+import _common
+from utils.logger import DroppingQueueHandler, JsonFormatter, SamplingFilter, SAMPLED
+
+
+_TEXT_FORMAT = '%(name)s - %(levelname)s - %(message)s - Line: %(lineno)d'
+
+
+def _sinks(tmp_dir: str) -> list:
+    stream = logging.StreamHandler(open(os.devnull, 'w'))
+    stream.setFormatter(logging.Formatter(_TEXT_FORMAT))
+    file = logging.FileHandler(os.path.join(tmp_dir, 'bench.log'))
+    file.setFormatter(JsonFormatter())
+    return [stream, file]
+
+
+def _logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f'bench.{name}')
+    logger.propagate = False
+    logger.handlers = [handler] if not isinstance(handler, list) else handler
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def main(messages: int = 50_000):
+    '''Report caller-side ns per log call for each logging setup'''
+
+    payload = {'title': 'Arsenal beat rivals to go top', 'url': 'https://news.example/1', 'content': 'x' * 2000}
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy = _logger('legacy', _sinks(tmp_dir))
+        start = time.perf_counter()
+        for i in range(messages):
+            legacy.info(f"Produced event to topic news: key = {i:12} value = {payload}")
+        results.append(('sync handlers, f-string', time.perf_counter() - start, 0.0))
+
+        for name, extra in (('queue handler', None), ('queue handler, sampled', SAMPLED)):
+            log_queue = queue.Queue(maxsize=messages + 1)
+            handler = DroppingQueueHandler(log_queue)
+            handler.addFilter(SamplingFilter(per_second=1))
+            listener = logging.handlers.QueueListener(log_queue, *_sinks(tmp_dir))
+            listener.start()
+            logger = _logger(name.replace(' ', '_'), handler)
+            start = time.perf_counter()
+            for i in range(messages):
+                logger.info("Produced event to topic %s [%s] @ %s", 'news', 0, i, extra=extra)
+            caller = time.perf_counter() - start
+            listener.stop()  # waits for the queue to drain
+            results.append((name, caller, time.perf_counter() - start))
+
+        disabled = _logger('disabled', _sinks(tmp_dir))
+        start = time.perf_counter()
+        for i in range(messages):
+            disabled.debug("Received message from Kafka: offset=%s", i)
+        results.append(('below level (debug)', time.perf_counter() - start, 0.0))
+
+    print(f'{"setup":<26}{"ns/msg (caller)":>17}{"drain s":>10}')
+    for name, caller, drained in results:
+        print(f'{name:<26}{caller / messages * 1e9:>17.0f}{drained:>10.2f}')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
@@ -0,0 +1,60 @@
+'''Article page fetch latency with and without the local page cache.
+
+Usage:
+    python benchmarks/page_cache.py [--copies=20] [--page_delay=0.05] [--rounds=3]
+
+Every article page of the fixture feeds is fetched from `FixtureServer`, which
+adds `page_delay` per page like a remote site would: once with plain
+`requests.get`, then through a `PageCache` in a temporary directory while it is
+cold (download, compress, store), when every page is revalidated (304 from the
+server, body read from disk) and offline (disk only, as when replaying a selector
+change). Reports pages/s, p50/p99 per page and the on-disk size of the cache.
+'''
+import logging
+import tempfile
+
+import fire
+import requests
+
+import _common
+from _common import percentile, timer
+from fixture_server import FixtureServer
+
+
+def main(copies: int = 20, page_delay: float = 0.05, rounds: int = 3):
+    '''Report per-page fetch latency for the network, a cold, a revalidated and an offline cache'''
+
+    logging.disable(logging.INFO)
+
+    from utils.page_cache import PageCache
+
+    with FixtureServer(copies=copies, page_delay=page_delay) as server, tempfile.TemporaryDirectory() as directory:
+        urls = [f'{server.base_url}/article/{source}/{copy * len(articles) + n}.html'
+                for source, articles in server.articles.items()
+                for n, _, copy in server.entries(source)]
+        online = PageCache(directory, max_age=0)
+        offline = PageCache(directory, offline=True)
+        paths = [
+            ('network', 1, lambda url: requests.get(url).content),
+            ('cache: cold', 1, lambda url: online.get(url).content),
+            ('cache: revalidated', rounds, lambda url: online.get(url).content),
+            ('cache: offline', rounds, lambda url: offline.get(url).content),
+        ]
+        print(f'{"path":<20}{"pages":>7}{"pages/s":>10}{"p50 ms":>9}{"p99 ms":>9}')
+        for name, repeat, fetch in paths:
+            timings = []
+            for _ in range(repeat):
+                for url in urls:
+                    with timer(timings):
+                        fetch(url)
+            total = sum(timings) / 1000
+            print(f'{name:<20}{len(timings):>7}{len(timings) / total:>10.1f}'
+                  f'{percentile(timings, 50):>9.2f}{percentile(timings, 99):>9.2f}')
+
+        stats = online.stats()
+        print(f"\n{stats['pages']} pages, {stats['blobs']} distinct bodies, {stats['raw_bytes'] / 1024:.0f} KiB raw, "
+              f"{stats['bytes'] / 1024:.0f} KiB on disk, page_delay={page_delay}s")
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
@@ -0,0 +1,206 @@
+'''Offline end-to-end benchmark: scrape -> produce -> flow -> sink -> query.
+
+Usage:
+    python benchmarks/pipeline.py [--copies=1] [--page_delay=0] [--embed_latency=0]
+        [--llm_first_token=0] [--llm_token=0] [--save=results.json]
+        [--baseline=results.json] [--tolerance=0.2]
+
+Everything runs locally: the fixture feeds and article pages are served by
+`FixtureServer`, Kafka is replaced by `FakeProducer` and a bytewax `TestingSource`,
+embeddings come from `HashEmbedder`, Qdrant runs as `QdrantClient(':memory:')`
+and the answer is streamed by `FakeStreamingLLM`. The latency options simulate
+the network services so their share of each stage can be studied.
+
+Every stage reports items, items/s and p50/p99 latency per item. With
+`--baseline` the run exits non-zero when a stage's throughput drops by more than
+`tolerance` compared with a previously `--save`d run.
+'''
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+import fire
+
+import _common
+from _common import FIXTURES_DIR, percentile, timer
+from fakes import FakeProducer, FakeStreamingLLM, HashEmbedder
+from fixture_server import FixtureServer
+
+
+class StageReport:
+    '''Per-item latencies and wall time of one pipeline stage'''
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.seconds = 0.0
+        self.latencies = []
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {'items': self.items, 'seconds': round(self.seconds, 4),
+                'items_per_s': round(self.throughput, 2),
+                'p50_ms': round(percentile(self.latencies, 50), 3),
+                'p99_ms': round(percentile(self.latencies, 99), 3)}
+
+
+def _print_reports(reports: list) -> None:
+    print(f'\n{"stage":<22}{"items":>8}{"total s":>10}{"items/s":>11}{"p50 ms":>10}{"p99 ms":>10}')
+    for report in reports:
+        r = report.as_dict()
+        print(f'{report.name:<22}{r["items"]:>8}{r["seconds"]:>10.3f}{r["items_per_s"]:>11.1f}'
+              f'{r["p50_ms"]:>10.3f}{r["p99_ms"]:>10.3f}')
+
+
+def _compare(results: dict, baseline_path: str, tolerance: float) -> list:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for stage, previous in baseline.items():
+        current = results.get(stage)
+        if current and previous['items_per_s'] and \
+                current['items_per_s'] < previous['items_per_s'] * (1 - tolerance):
+            regressions.append(f'{stage}: {current["items_per_s"]:.1f} items/s '
+                               f'vs baseline {previous["items_per_s"]:.1f}')
+    return regressions
+
+
+def main(copies: int = 1, page_delay: float = 0.0, embed_latency: float = 0.0,
+         llm_first_token: float = 0.0, llm_token: float = 0.0,
+         save: str = None, baseline: str = None, tolerance: float = 0.2, quiet: bool = True):
+    '''Run every pipeline stage offline and report per-stage throughput and latency'''
+
+    if quiet:
+        logging.disable(logging.INFO)
+
+    with FixtureServer(copies=copies, page_delay=page_delay) as server:
+        os.environ.update(server.feed_urls())  # before the service modules build Settings()
+
+        from qdrant_client import QdrantClient
+        from bytewax.connectors.kafka import KafkaSourceMessage
+        from bytewax.testing import TestingSource, run_main
+
+        from config.setting import Settings
+        from config.pydantic_models import RefinedDocument, ChuckedDocument, EmbedDocument
+        from consumer import process_messages
+        from dead_letter import DeadLetterQueue
+        from fetch_news import NewsFetcher
+        from producer import KafkaProducerSwarm
+        from vector_database import QdrantVectorOutput, QdrantVectorSink
+        from summary import retrieve_context, generate_summary
+        import flow
+
+        settings = Settings()
+        embedder = HashEmbedder(dim=settings.GOOGLE_VECTOR_SIZE, latency=embed_latency)
+        reports = []
+
+        # 1. scrape the fixture feeds and pages
+        scrape = StageReport('scrape (per source)')
+        start = time.perf_counter()
+        for fetch in NewsFetcher().sources:
+            with timer(scrape.latencies):
+                documents = fetch()
+            scrape.items += len(documents)
+        scrape.seconds = time.perf_counter() - start
+        reports.append(scrape)
+
+        # 2. scrape again and produce through the swarm into the in-memory producer
+        produce = StageReport('scrape+produce (swarm)')
+        producer = FakeProducer()
+        swarm = KafkaProducerSwarm(producer, settings.KAFKA_TOPIC, NewsFetcher().feeds)
+        start = time.perf_counter()
+        swarm.run()
+        produce.seconds = time.perf_counter() - start
+        produce.items = len(producer.messages)
+        reports.append(produce)
+
+        messages = [KafkaSourceMessage(key=m.key(), value=m.value(), topic=m.topic())
+                    for m in producer.messages]
+
+        # 3. each flow step on its own, one item at a time
+        client = QdrantClient(':memory:')
+        sink = QdrantVectorSink(client, settings.QDRANT_COLLECTION_NAME)
+        steps = [StageReport(name) for name in ('flow: decode+validate', 'flow: refine',
+                                                'flow: chunk', 'flow: embed', 'flow: upsert')]
+        decode, refine, chunk, embed, upsert = steps
+        for message in messages:
+            with timer(decode.latencies):
+                bases = process_messages(message)
+            for base in bases:
+                with timer(refine.latencies):
+                    refined = RefinedDocument.from_base(base)
+                with timer(chunk.latencies):
+                    chunks = ChuckedDocument.from_refined(refined, embedder)
+                for chunked in chunks:
+                    with timer(embed.latencies):
+                        embedded = EmbedDocument.from_chunked(chunked, embedder)
+                    with timer(upsert.latencies):
+                        sink.write_batch([embedded])
+        for step in steps:
+            step.items = len(step.latencies)
+            step.seconds = sum(step.latencies) / 1000
+        reports.extend(steps)
+
+        # 4. the whole dataflow through bytewax
+        dataflow_report = StageReport('flow: end to end')
+        client = QdrantClient(':memory:')
+        dead_letter = DeadLetterQueue(FakeProducer())
+        batch_size = settings.KAFKA_CONSUMER_BATCH_SIZE
+        batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+        dataflow = flow.build(source=TestingSource(batches),
+                              sink=QdrantVectorOutput(client=client, dead_letter=dead_letter),
+                              embedding_model=embedder, dead_letter=dead_letter)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_main(dataflow)
+        dataflow_report.seconds = time.perf_counter() - start
+        dataflow_report.items = len(messages)
+        reports.append(dataflow_report)
+        points = client.count(settings.QDRANT_COLLECTION_NAME).count
+
+        # 5. query: search + context packing, then the streamed answer
+        with open(FIXTURES_DIR / 'queries.json') as f:
+            queries = [q['query'] for q in json.load(f)]
+        retrieve = StageReport('query: retrieve')
+        first_token = StageReport('query: first token')
+        answer = StageReport('query: full answer')
+        llm = FakeStreamingLLM(first_token_latency=llm_first_token, token_latency=llm_token)
+        for query in queries:
+            query_start = time.perf_counter()
+            with timer(retrieve.latencies):
+                content = retrieve_context(query, client=client, embedder=embedder)
+            first = None
+            for _ in generate_summary(query, content, llm=llm):
+                if first is None:
+                    first = time.perf_counter()
+                    first_token.latencies.append((first - query_start) * 1000)
+            answer.latencies.append((time.perf_counter() - query_start) * 1000)
+        for report in (retrieve, first_token, answer):
+            report.items = len(report.latencies)
+            report.seconds = sum(report.latencies) / 1000
+        reports.extend([retrieve, first_token, answer])
+
+    _print_reports(reports)
+    print(f'\n{scrape.items} articles -> {produce.items} messages -> {points} points in Qdrant')
+
+    results = {report.name: report.as_dict() for report in reports}
+    if save:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        regressions = _compare(results, baseline, tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
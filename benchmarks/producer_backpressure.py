@@ -0,0 +1,54 @@
+'''Producer memory and run time of a large catch-up run against a slow broker.
+
+Usage:
+    python benchmarks/producer_backpressure.py [--copies=200] [--delivery_rate=2000]
+        [--max_queue=100] [--in_flight=0,64]
+
+The fixture feeds are served `copies` times over by `FixtureServer` and the
+`KafkaProducerSwarm` produces them into a `FakeProducer` that acks at most
+`delivery_rate` messages per second and raises `BufferError` while `max_queue`
+messages wait for their ack. Each `in_flight` limit (0 = unbounded) reports the
+run time, the messages produced, the waits for the full queue and the peak
+Python memory (tracemalloc) of the run.
+'''
+import logging
+import os
+import time
+import tracemalloc
+
+import fire
+
+import _common
+from fakes import FakeProducer
+from fixture_server import FixtureServer
+
+
+def main(copies: int = 200, delivery_rate: float = 2000, max_queue: int = 100, in_flight: tuple = (0, 64)):
+    '''Report run time, messages, queue-full waits and peak memory per in-flight limit'''
+
+    logging.disable(logging.WARNING)
+    limits = [int(in_flight)] if isinstance(in_flight, int) else [int(n) for n in in_flight]
+
+    with FixtureServer(copies=copies) as server:
+        os.environ.update(server.feed_urls())
+
+        from fetch_news import NewsFetcher
+        from producer import KafkaProducerSwarm
+
+        print(f'{"in flight":<11}{"messages":>9}{"seconds":>9}{"waits":>8}{"peak MiB":>10}')
+        for limit in limits:
+            producer = FakeProducer(max_queue=max_queue, delivery_rate=delivery_rate)
+            swarm = KafkaProducerSwarm(producer, 'news-benchmark', NewsFetcher().feeds,
+                                       max_in_flight=limit or 10**9)
+            tracemalloc.start()
+            start = time.perf_counter()
+            swarm.run()
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f'{limit or "unbounded":<11}{len(producer.messages):>9}{seconds:>9.2f}'
+                  f'{swarm.queue_full_waits:>8}{peak / 2**20:>10.1f}')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
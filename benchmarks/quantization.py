@@ -0,0 +1,96 @@
+'''Memory footprint, recall@8 and latency of the collection storage/quantization options.
+
+Usage:
+    python benchmarks/quantization.py [--url=http://localhost:6333] [--points=100000]
+        [--queries=200] [--limit=8] [--oversampling=2.0]
+
+Builds one collection per configuration from the same synthetic, clustered
+GOOGLE_VECTOR_SIZE-d corpus, using `collection_config` and `search_params` as the
+sink and the app do. Recall@k is measured against exact brute-force cosine
+neighbours computed with numpy. Memory is an estimate of what the configuration
+keeps resident: original vectors unless on disk, quantized vectors when pinned
+in RAM, and the HNSW graph links.
+'''
+import time
+
+import fire
+import numpy as np
+
+import _common
+from _common import percentile, timer
+
+from qdrant_client import QdrantClient
+from vector_database import collection_config, settings
+from search import search_params
+
+
+CONFIGS = {
+    'float32 ram':       dict(quantization='none', on_disk=False),
+    'float32 disk':      dict(quantization='none', on_disk=True),
+    'int8 + disk orig':  dict(quantization='scalar', on_disk=True),
+    'int8 ram':          dict(quantization='scalar', on_disk=False),
+    'binary + disk orig': dict(quantization='binary', on_disk=True),
+}
+
+
+def synthetic_corpus(points: int, dim: int, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    '''Unit-norm vectors drawn around random topic centroids, like news embeddings'''
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=points)
+    vectors = centroids[labels] + rng.normal(scale=0.8, size=(points, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def estimated_memory_mb(points: int, dim: int, quantization: str, on_disk: bool,
+                        always_ram: bool = True, hnsw_m: int = settings.QDRANT_HNSW_M) -> float:
+    resident = 0 if on_disk else points * dim * 4
+    if quantization != 'none' and always_ram:
+        resident += points * dim if quantization == 'scalar' else points * dim // 8
+    resident += points * hnsw_m * 2 * 4  # level-0 links
+    return resident / 2 ** 20
+
+
+def _wait_until_indexed(client: QdrantClient, name: str, timeout: float = 600) -> None:
+    deadline = time.time() + timeout
+    while client.get_collection(name).status != 'green' and time.time() < deadline:
+        time.sleep(0.5)
+
+
+def main(url: str = 'http://localhost:6333', points: int = 100_000, queries: int = 200,
+         limit: int = 8, oversampling: float = settings.QDRANT_SEARCH_OVERSAMPLING, batch_size: int = 2000):
+    '''Report memory, recall@k and search latency for every collection configuration'''
+
+    client = QdrantClient(url)
+    dim = settings.GOOGLE_VECTOR_SIZE
+    corpus = synthetic_corpus(points, dim)
+    query_vectors = synthetic_corpus(queries, dim, seed=1)
+    exact = np.argsort(-(query_vectors @ corpus.T), axis=1)[:, :limit]
+
+    print(f'{"config":<20}{"est. RAM MB":>12}{"recall@" + str(limit):>10}{"p50 ms":>9}{"p99 ms":>9}')
+    for name, config in CONFIGS.items():
+        collection = f'news-benchmark-{name.replace(" ", "-").replace("+", "")}'
+        if client.collection_exists(collection):
+            client.delete_collection(collection)
+        client.create_collection(collection, **collection_config(vector_size=dim, **config))
+        for start in range(0, points, batch_size):
+            client.upload_collection(collection, vectors=corpus[start:start + batch_size],
+                                     ids=range(start, min(start + batch_size, points)), wait=True)
+        _wait_until_indexed(client, collection)
+
+        params = search_params(quantization=config['quantization'], oversampling=oversampling)
+        timings, hits = [], 0
+        for i, vector in enumerate(query_vectors):
+            with timer(timings):
+                result = client.query_points(collection, query=vector.tolist(), limit=limit,
+                                             search_params=params)
+            hits += len({p.id for p in result.points} & set(exact[i].tolist()))
+
+        memory = estimated_memory_mb(points, dim, config['quantization'], config['on_disk'])
+        print(f'{name:<20}{memory:>12.1f}{hits / (queries * limit):>10.3f}'
+              f'{percentile(timings, 50):>9.2f}{percentile(timings, 99):>9.2f}')
+        client.delete_collection(collection)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
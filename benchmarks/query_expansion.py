@@ -0,0 +1,79 @@
+'''Latency of expanded queries: one batched round trip versus one search per variant.
+
+Usage:
+    python benchmarks/query_expansion.py [--url=:memory:] [--rounds=20] [--articles=...] [--queries=...]
+
+The fixture snapshot is indexed as in `retrieval_eval.py` (hash embedder, query
+vectors precomputed). Every labelled query is searched three ways: the query
+alone, its `expand_query` variants in one `query_batch_points` request (what
+`query_vectordatabase` does), and the same variants as sequential `query_points`
+calls, both fused with `rank_fusion`. Reports p50/p99 latency. Against a Qdrant
+server `--url` the sequential path pays one network round trip per variant.
+'''
+import json
+import logging
+import os
+
+import fire
+
+import _common
+from _common import FIXTURES_DIR, percentile, timer
+from fakes import HashEmbedder
+from fixture_server import load_articles
+from retrieval_eval import PrecomputedQueries, embed_snapshot
+
+os.environ['QDRANT_COLLECTION_NAME'] = 'news-expansion-benchmark'
+
+
+def main(url: str = ':memory:', rounds: int = 20, limit: int = 8, articles: str = None, queries: str = None):
+    '''Report p50/p99 search latency of the plain, batched-expanded and sequential-expanded query'''
+
+    logging.disable(logging.INFO)
+
+    from qdrant_client import QdrantClient
+
+    from config.setting import Settings
+    from query_expansion import expand_query
+    from search import embed_queries, query_vectordatabase, rank_fusion
+    from vector_database import QdrantVectorSink
+
+    settings = Settings()
+    collection = settings.QDRANT_COLLECTION_NAME
+    model = HashEmbedder(dim=settings.GOOGLE_VECTOR_SIZE)
+    with open(queries or FIXTURES_DIR / 'queries.json') as f:
+        labelled = [item['query'] for item in json.load(f)]
+    embedder = PrecomputedQueries(model, labelled)
+
+    client = QdrantClient(url)
+    if client.collection_exists(collection):
+        client.delete_collection(collection)
+    QdrantVectorSink(client, collection, sharded=False).write_batch(embed_snapshot(load_articles(articles), model))
+
+    def sequential(query: str) -> list:
+        rankings = [client.query_points(collection, query=vector, limit=limit, with_payload=True).points
+                    for vector in embed_queries(embedder, expand_query(query))]
+        return rank_fusion(rankings, limit)
+
+    paths = {
+        'query only': lambda q: query_vectordatabase(q, limit=limit, recency_weight=0.0, expand=False,
+                                                     client=client, embedder=embedder),
+        'expanded, batched': lambda q: query_vectordatabase(q, limit=limit, recency_weight=0.0, expand=True,
+                                                            client=client, embedder=embedder),
+        'expanded, sequential': sequential,
+    }
+    variants = sum(len(expand_query(q)) for q in labelled) / len(labelled)
+    print(f'{"path":<22}{"p50 ms":>9}{"p99 ms":>9}')
+    for name, search in paths.items():
+        search(labelled[0])  # warm up
+        timings = []
+        for _ in range(rounds):
+            for query in labelled:
+                with timer(timings):
+                    search(query)
+        print(f'{name:<22}{percentile(timings, 50):>9.2f}{percentile(timings, 99):>9.2f}')
+    print(f'\n{variants:.1f} variants per query, {len(labelled)} queries x {rounds} rounds, url={url}')
+    client.delete_collection(collection)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
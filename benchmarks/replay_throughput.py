@@ -0,0 +1,80 @@
+'''Flow ingestion throughput when replaying a recorded topic.
+
+Usage:
+    python benchmarks/replay_throughput.py [--messages=2000] [--recorded_rate=200] [--speeds=0,1,4]
+        [--embed_latency=0] [--log=recorded.jsonl.zst]
+
+Without `--log`, a topic is recorded with `TopicRecorder` from the fixture articles
+(serialized as in `consumer_throughput.py`, unique ids so every message is chunked,
+embedded and upserted), `recorded_rate` messages per second apart. Each speed
+then replays it through the whole dataflow (`ReplaySource` -> `flow.build`, with
+`HashEmbedder` and `QdrantClient(':memory:')`): 0 as fast as the flow consumes,
+which is its maximum sustainable ingestion rate, and N at N times the recorded
+pace. Reports wall time and msgs/s next to the recorded duration over the speed:
+a paced replay running much longer than that means the flow falls behind.
+'''
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+
+import fire
+
+import _common
+from consumer_throughput import recorded_topic
+from fakes import FakeProducer, HashEmbedder
+
+
+def main(messages: int = 2000, recorded_rate: float = 200, speeds: tuple = (0, 1, 4),
+         embed_latency: float = 0.0, log: str = None, quiet: bool = True):
+    '''Replay a recorded topic through the flow at each speed and report its throughput'''
+
+    if quiet:
+        logging.disable(logging.INFO)
+
+    from bytewax.testing import run_main
+    from qdrant_client import QdrantClient
+
+    from config.setting import Settings
+    from dead_letter import DeadLetterQueue
+    from topic_log import ReplaySource, TopicRecorder, read_log
+    from vector_database import QdrantVectorOutput
+    import flow
+
+    settings = Settings()
+    embedder = HashEmbedder(dim=settings.GOOGLE_VECTOR_SIZE, latency=embed_latency)
+    speeds = [float(speeds)] if isinstance(speeds, (int, float)) else [float(s) for s in speeds]
+
+    with tempfile.TemporaryDirectory() as directory:
+        if log is None:
+            log = os.path.join(directory, 'recorded.jsonl.zst')
+            start = time.time()
+            with TopicRecorder(log) as recorder:
+                for i, message in enumerate(recorded_topic(messages)):
+                    recorder.write(message.value, topic=message.topic, ts=start + i / recorded_rate)
+        records = list(read_log(log))
+        span = records[-1]['ts'] - records[0]['ts'] if records else 0.0
+        print(f"{len(records)} recorded messages over {span:.1f}s, {os.path.getsize(log) / 1024:.0f} KiB compressed")
+
+        print(f'\n{"speed":<8}{"messages":>9}{"points":>8}{"wall s":>9}{"paced s":>9}{"msgs/s":>9}')
+        for speed in speeds:
+            flow.deduplicates_check._state.clear()  # each replay starts like a fresh flow process
+            client = QdrantClient(':memory:')
+            dead_letter = DeadLetterQueue(FakeProducer())
+            dataflow = flow.build(source=ReplaySource(log, speed=speed),
+                                  sink=QdrantVectorOutput(client=client, dead_letter=dead_letter),
+                                  embedding_model=embedder, dead_letter=dead_letter)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_main(dataflow)
+            seconds = time.perf_counter() - start
+            points = client.count(settings.QDRANT_COLLECTION_NAME).count
+            paced = f'{span / speed:.2f}' if speed > 0 else '-'
+            name = f'{speed:g}x' if speed > 0 else 'max'
+            print(f'{name:<8}{len(records):>9}{points:>8}{seconds:>9.2f}{paced:>9}{len(records) / seconds:>9.1f}')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
@@ -0,0 +1,76 @@
+'''Prompt size, context recall and cost of the local re-ranking stage.
+
+Usage:
+    python benchmarks/rerank.py [--candidates=24] [--embedder=hash] [--articles=...] [--queries=...]
+
+The fixture snapshot is indexed as in `retrieval_eval.py`. For every labelled query
+the `candidates` search results are packed by `build_context` as they come, and
+again after `rerank`. Reports the documents and estimated tokens that reach the
+summary prompt, the share of relevant articles among them (precision) and kept
+(recall), and p50/p99 rerank time.
+'''
+import logging
+
+import fire
+
+import _common
+from _common import FIXTURES_DIR, percentile, timer
+from fakes import HashEmbedder
+from fixture_server import load_articles
+from retrieval_eval import PrecomputedQueries, embed_snapshot
+
+
+def main(candidates: int = 24, embedder: str = 'hash', articles: str = None, queries: str = None):
+    '''Report prompt documents, tokens, precision/recall and rerank ms with and without the rerank stage'''
+
+    import json
+
+    logging.disable(logging.INFO)
+
+    from qdrant_client import QdrantClient
+
+    from config.setting import Settings
+    from context_builder import build_context, estimate_tokens
+    from reranker import rerank
+    from search import query_vectordatabase
+    from vector_database import QdrantVectorSink
+
+    settings = Settings()
+    if embedder == 'hash':
+        model = HashEmbedder(dim=settings.GOOGLE_VECTOR_SIZE)
+    else:
+        from embedding import GoogleTextEmbedder
+        model = GoogleTextEmbedder()
+
+    with open(queries or FIXTURES_DIR / 'queries.json') as f:
+        labelled = json.load(f)
+    client = QdrantClient(':memory:')
+    QdrantVectorSink(client, settings.QDRANT_COLLECTION_NAME, sharded=False).write_batch(
+        embed_snapshot(load_articles(articles), model))
+    query_embedder = PrecomputedQueries(model, [item['query'] for item in labelled])
+
+    rows = {'top-k': [], 'reranked': []}
+    timings = []
+    for item in labelled:
+        results = query_vectordatabase(item['query'], limit=candidates, with_vectors=True,
+                                       client=client, embedder=query_embedder)
+        with timer(timings):
+            reranked = rerank(item['query'], results)
+        relevant = set(item['relevant'])
+        for name, packed in (('top-k', build_context(results)), ('reranked', build_context(reranked))):
+            titles = {doc['title'] for doc in packed}
+            rows[name].append((len(packed), sum(estimate_tokens(doc['content']) for doc in packed),
+                               len(titles & relevant) / len(packed) if packed else 0.0,
+                               len(titles & relevant) / len(relevant)))
+
+    n = len(labelled)
+    print(f'{"context":<10}{"docs":>7}{"tokens":>9}{"precision":>11}{"recall":>8}')
+    for name, values in rows.items():
+        docs, tokens, precision, recall = (sum(column) / n for column in zip(*values))
+        print(f'{name:<10}{docs:>7.1f}{tokens:>9.0f}{precision:>11.3f}{recall:>8.3f}')
+    print(f'\nrerank p50 {percentile(timings, 50):.3f} ms, p99 {percentile(timings, 99):.3f} ms '
+          f'over {candidates} candidates, {n} queries, embedder={embedder}')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
@@ -0,0 +1,178 @@
+'''Retrieval quality and search latency of `query_vectordatabase` over a frozen news snapshot.
+
+Usage:
+    python benchmarks/retrieval_eval.py [--k=5] [--url=:memory:] [--embedder=hash]
+        [--articles=fixtures/articles.json] [--queries=fixtures/queries.json]
+        [--configs="float32,int8 rescored"] [--save=results.json]
+
+The snapshot articles go through the same validate -> refine -> chunk -> embed
+steps and `QdrantVectorSink` as the dataflow, once per configuration, into a
+collection created with that configuration's `collection_config`. Every labelled
+query (`{"query": ..., "relevant": [titles]}`) is then answered by
+`query_vectordatabase` with `limit=k`, with query expansion only where the
+configuration says `expand`. Results are ranked per article (chunks of
+the same article count once) and scored with recall@k, MRR and nDCG@k against
+the relevant titles. Latency covers the search only: query vectors are embedded
+before the timed loop.
+
+`--embedder=hash` uses the offline `HashEmbedder`, good for comparing search
+settings; `--embedder=google` uses the configured embedding model, which is what
+quality numbers should be quoted from. Local mode (`:memory:`) ignores
+quantization and HNSW settings, so compare those against a Qdrant server `--url`.
+'''
+import json
+import logging
+import math
+import os
+
+import fire
+
+import _common
+from _common import FIXTURES_DIR, percentile, timer
+from fakes import HashEmbedder
+from fixture_server import load_articles, raw_documents
+
+# never evaluate into a collection configured in .env
+os.environ['QDRANT_COLLECTION_NAME'] = 'news-retrieval-eval'
+
+
+CONFIGS = {
+    'float32':          dict(quantization='none', recency_weight=0.0),
+    'float32 recency':  dict(quantization='none'),
+    'float32 expanded': dict(quantization='none', recency_weight=0.0, expand=True),
+    'int8 rescored':    dict(quantization='scalar', recency_weight=0.0),
+    'int8 no rescore':  dict(quantization='scalar', recency_weight=0.0, rescore=False),
+    'binary rescored':  dict(quantization='binary', recency_weight=0.0),
+}
+
+
+def recall_at_k(ranked: list, relevant: set, k: int) -> float:
+    return len(set(ranked[:k]) & relevant) / len(relevant) if relevant else 0.0
+
+
+def reciprocal_rank(ranked: list, relevant: set) -> float:
+    for rank, item in enumerate(ranked, start=1):
+        if item in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranked: list, relevant: set, k: int) -> float:
+    '''Binary-gain nDCG: each relevant item at rank r adds 1/log2(r + 1)'''
+    dcg = sum(1.0 / math.log2(rank + 1) for rank, item in enumerate(ranked[:k], start=1) if item in relevant)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+
+def article_ranking(results: list) -> list:
+    '''Titles in result order, each article once'''
+    return list(dict.fromkeys(result['title'] for result in results))
+
+
+class PrecomputedQueries:
+    '''Embedder returning query vectors computed up front, so timings cover the search only.
+    The `expand_query` variants of every query are precomputed too.'''
+
+    def __init__(self, embedder, queries: list):
+        from query_expansion import expand_query
+
+        texts = {text for query in queries for text in [query, *expand_query(query)]}
+        self._vectors = {text: embedder(text, task_type='RETRIEVAL_QUERY') for text in texts}
+
+    def __call__(self, text: str, task_type: str = 'RETRIEVAL_QUERY') -> list:
+        return self._vectors[text]
+
+    def embed_batch(self, texts: list, task_type: str = 'RETRIEVAL_QUERY') -> list:
+        return [self._vectors[text] for text in texts]
+
+
+def embed_snapshot(articles: list, embedder) -> list:
+    '''Run the snapshot through the dataflow's document steps, up to the embedded chunks'''
+    from config.pydantic_models import BaseDocument, RefinedDocument, ChuckedDocument, EmbedDocument
+
+    embedded = []
+    for raw in raw_documents(articles):
+        refined = RefinedDocument.from_base(BaseDocument(**raw))
+        for chunked in ChuckedDocument.from_refined(refined, embedder):
+            embedded.append(EmbedDocument.from_chunked(chunked, embedder))
+    return embedded
+
+
+def evaluate(client, labelled: list, embedder, k: int, config: dict) -> dict:
+    from search import query_vectordatabase, search_params
+
+    params = search_params(quantization=config['quantization'], rescore=config.get('rescore', True),
+                           hnsw_ef=config.get('hnsw_ef'))
+    search_kwargs = {key: config[key] for key in ('recency_weight',) if key in config}
+    search = lambda query: query_vectordatabase(query, limit=k, params=params, client=client, embedder=embedder,
+                                                expand=config.get('expand', False), **search_kwargs)
+
+    search(labelled[0]['query'])  # warm up
+    recalls, reciprocal_ranks, ndcgs, timings = [], [], [], []
+    for item in labelled:
+        with timer(timings):
+            results = search(item['query'])
+        ranked, relevant = article_ranking(results), set(item['relevant'])
+        recalls.append(recall_at_k(ranked, relevant, k))
+        reciprocal_ranks.append(reciprocal_rank(ranked, relevant))
+        ndcgs.append(ndcg_at_k(ranked, relevant, k))
+
+    n = len(labelled)
+    return {f'recall@{k}': round(sum(recalls) / n, 4), 'mrr': round(sum(reciprocal_ranks) / n, 4),
+            f'ndcg@{k}': round(sum(ndcgs) / n, 4),
+            'p50_ms': round(percentile(timings, 50), 3), 'p99_ms': round(percentile(timings, 99), 3)}
+
+
+def main(k: int = 5, url: str = ':memory:', embedder: str = 'hash', articles: str = None,
+         queries: str = None, configs=None, save: str = None, quiet: bool = True):
+    '''Report recall@k, MRR, nDCG@k and p50/p99 search latency per retrieval configuration'''
+
+    if quiet:
+        logging.disable(logging.INFO)
+
+    from qdrant_client import QdrantClient
+
+    from config.setting import Settings
+    from vector_database import QdrantVectorSink, collection_config
+
+    settings = Settings()
+    if embedder == 'hash':
+        model = HashEmbedder(dim=settings.GOOGLE_VECTOR_SIZE)
+    elif embedder == 'google':
+        from embedding import GoogleTextEmbedder
+        model = GoogleTextEmbedder()
+    else:
+        raise ValueError(f"Unknown embedder '{embedder}', expected 'hash' or 'google'")
+
+    with open(queries or FIXTURES_DIR / 'queries.json') as f:
+        labelled = json.load(f)
+    if isinstance(configs, str):
+        configs = configs.split(',')
+    selected = {name: CONFIGS[name] for name in (configs or CONFIGS)}
+
+    snapshot = embed_snapshot(load_articles(articles), model)
+    query_embedder = PrecomputedQueries(model, [item['query'] for item in labelled])
+    collection = settings.QDRANT_COLLECTION_NAME
+
+    results = {}
+    print(f'{"config":<18}{"recall@" + str(k):>10}{"MRR":>8}{"nDCG@" + str(k):>9}{"p50 ms":>9}{"p99 ms":>9}')
+    for name, config in selected.items():
+        client = QdrantClient(url)
+        if client.collection_exists(collection):
+            client.delete_collection(collection)
+        client.create_collection(collection, **collection_config(quantization=config['quantization']))
+        QdrantVectorSink(client, collection).write_batch(snapshot)
+
+        r = results[name] = evaluate(client, labelled, query_embedder, k, config)
+        print(f'{name:<18}{r[f"recall@{k}"]:>10.3f}{r["mrr"]:>8.3f}{r[f"ndcg@{k}"]:>9.3f}'
+              f'{r["p50_ms"]:>9.2f}{r["p99_ms"]:>9.2f}')
+        client.delete_collection(collection)
+
+    print(f'\n{len(snapshot)} chunks, {len(labelled)} labelled queries, embedder={embedder}')
+    if save:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
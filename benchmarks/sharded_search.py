@@ -0,0 +1,100 @@
+'''Search latency of weekly shards with fan-out versus one large collection.
+
+Usage:
+    python benchmarks/sharded_search.py [--url=http://localhost:6333] [--points=1000000]
+        [--days=90] [--queries=200] [--recent=4] [--recreate=False]
+
+Loads the same `points` random GOOGLE_VECTOR_SIZE-d vectors, with `published_ts`
+spread uniformly over the last `days`, once into a single collection and once
+into weekly shards (`shard_name`), both created through `QdrantVectorSink` so they
+carry the production payload indexes. Each search mode then runs against the
+single collection and, through `fanout_query`, against the shards
+`shards_for_window` picks: the `recent` newest ones without a time window, the
+overlapping ones with a window, or all of them. Reports p50/p99 latency and
+the number of shards searched. Use `--url=:memory:` for a quick small run;
+local mode searches exhaustively, so only a server shows HNSW behaviour.
+'''
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import fire
+import numpy as np
+
+import _common
+from _common import percentile, timer
+
+from qdrant_client import QdrantClient
+from vector_database import QdrantVectorSink, list_shards, shard_name, shards_for_window, settings
+from search import build_filter, fanout_query
+
+
+COLLECTION = 'news-benchmark-single'
+BASE = 'news-benchmark-sharded'
+
+
+def _load(client: QdrantClient, points: int, dim: int, days: int, batch_size: int = 2000) -> None:
+    rng = np.random.default_rng(0)
+    now = int(time.time())
+    for start in range(0, points, batch_size):
+        size = min(batch_size, points - start)
+        vectors = rng.normal(size=(size, dim)).astype(np.float32)
+        timestamps = [int(ts) for ts in now - rng.integers(0, days * 86400, size=size)]
+        client.upload_collection(COLLECTION, vectors=vectors, ids=range(start, start + size),
+                                 payload=[{'published_ts': ts} for ts in timestamps], wait=True)
+
+        shards = {}
+        for offset, ts in enumerate(timestamps):
+            shards.setdefault(shard_name(BASE, ts), []).append(offset)
+        for shard, offsets in shards.items():
+            QdrantVectorSink(client, shard, sharded=False)
+            client.upload_collection(shard, vectors=vectors[offsets], ids=[start + i for i in offsets],
+                                     payload=[{'published_ts': timestamps[i]} for i in offsets], wait=True)
+
+
+def main(url: str = 'http://localhost:6333', points: int = 1_000_000, days: int = 90,
+         queries: int = 200, limit: int = 8, recent: int = settings.QDRANT_SEARCH_SHARDS,
+         recreate: bool = False):
+    '''Report search latency on one collection and on fanned-out weekly shards'''
+
+    logging.disable(logging.INFO)
+    client = QdrantClient(url)
+    dim = settings.GOOGLE_VECTOR_SIZE
+    existing = client.count(COLLECTION).count if client.collection_exists(COLLECTION) else 0
+    if recreate or existing != points:
+        for name in [COLLECTION, *list_shards(client, BASE)]:
+            if client.collection_exists(name):
+                client.delete_collection(name)
+        QdrantVectorSink(client, COLLECTION, sharded=False)
+        load_start = time.perf_counter()
+        _load(client, points, dim, days)
+        print(f'loaded {points} points twice in {time.perf_counter() - load_start:.1f}s')
+
+    shards = list_shards(client, BASE)
+    now = datetime.now(timezone.utc)
+    modes = {  # name -> (max_age_hours, shards searched)
+        f'recent {recent} shards': (None, shards_for_window(shards, recent=recent)),
+        'all shards': (None, shards),
+        'last 24h': (24, shards_for_window(shards, now - timedelta(hours=24))),
+        'last 7d': (24 * 7, shards_for_window(shards, now - timedelta(days=7))),
+    }
+
+    rng = np.random.default_rng(1)
+    print(f'{"mode":<18}{"shards":>7}{"single p50":>12}{"p99":>8}{"sharded p50":>13}{"p99":>8}')
+    for name, (max_age_hours, searched) in modes.items():
+        query_filter = build_filter(max_age_hours=max_age_hours) if max_age_hours else None
+        single, sharded = [], []
+        for _ in range(queries):
+            vector = rng.normal(size=dim).tolist()
+            with timer(single):
+                fanout_query(client, [COLLECTION], limit, query=vector, query_filter=query_filter,
+                             with_payload=True)
+            with timer(sharded):
+                fanout_query(client, searched, limit, query=vector, query_filter=query_filter,
+                             with_payload=True)
+        print(f'{name:<18}{len(searched):>7}{percentile(single, 50):>12.2f}{percentile(single, 99):>8.2f}'
+              f'{percentile(sharded, 50):>13.2f}{percentile(sharded, 99):>8.2f}')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
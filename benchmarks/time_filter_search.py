@@ -0,0 +1,83 @@
+'''Latency of time-window filtered and recency-scored search on a large collection.
+
+Usage:
+    python benchmarks/time_filter_search.py [--url=http://localhost:6333] [--points=1000000]
+        [--days=90] [--queries=200] [--recreate=False]
+
+Loads `points` random GOOGLE_VECTOR_SIZE-d vectors with `published_ts` spread uniformly over the last
+`days` into a Qdrant server (use `--url=:memory:` for a quick small run). The
+collection is created through `QdrantVectorSink`, so it carries the same payload
+index as production. Reports p50/p99 latency per search mode.
+'''
+import time
+
+import fire
+import numpy as np
+
+import _common
+from _common import percentile, timer
+
+from qdrant_client import QdrantClient, models
+from vector_database import QdrantVectorSink, settings
+from search import build_filter, recency_query
+
+
+COLLECTION = 'news-benchmark-time'
+
+
+def _load(client: QdrantClient, points: int, dim: int, days: int, batch_size: int = 2000) -> None:
+    rng = np.random.default_rng(0)
+    now = int(time.time())
+    for start in range(0, points, batch_size):
+        size = min(batch_size, points - start)
+        vectors = rng.normal(size=(size, dim)).astype(np.float32)
+        timestamps = now - rng.integers(0, days * 86400, size=size)
+        client.upload_collection(
+            collection_name=COLLECTION,
+            vectors=vectors,
+            payload=[{'published_ts': int(ts)} for ts in timestamps],
+            ids=range(start, start + size),
+            wait=True,
+        )
+
+
+def main(url: str = 'http://localhost:6333', points: int = 1_000_000,
+         days: int = 90, queries: int = 200, limit: int = 8, recreate: bool = False):
+    '''Report search latency with and without time filters and recency scoring'''
+
+    client = QdrantClient(url)
+    dim = settings.GOOGLE_VECTOR_SIZE
+    if recreate and client.collection_exists(COLLECTION):
+        client.delete_collection(COLLECTION)
+
+    existing = client.count(COLLECTION).count if client.collection_exists(COLLECTION) else 0
+    if existing != points:
+        if existing:
+            client.delete_collection(COLLECTION)
+        QdrantVectorSink(client, COLLECTION)
+        load_start = time.perf_counter()
+        _load(client, points, dim, days)
+        print(f'loaded {points} points in {time.perf_counter() - load_start:.1f}s')
+
+    rng = np.random.default_rng(1)
+    modes = {
+        'unfiltered': lambda v: dict(query=v),
+        'last 24h': lambda v: dict(query=v, query_filter=build_filter(max_age_hours=24)),
+        'last 7d': lambda v: dict(query=v, query_filter=build_filter(max_age_hours=24 * 7)),
+        'recency decay': lambda v: recency_query(v, 0.1, 48, candidates=100),
+        'decay + 7d': lambda v: recency_query(v, 0.1, 48, candidates=100,
+                                              query_filter=build_filter(max_age_hours=24 * 7)),
+    }
+
+    print(f'{"mode":<16}{"p50 ms":>10}{"p99 ms":>10}')
+    for name, build_args in modes.items():
+        timings = []
+        for _ in range(queries):
+            vector = rng.normal(size=dim).tolist()
+            with timer(timings):
+                client.query_points(COLLECTION, limit=limit, with_payload=True, **build_args(vector))
+        print(f'{name:<16}{percentile(timings, 50):>10.2f}{percentile(timings, 99):>10.2f}')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
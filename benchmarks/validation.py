@@ -0,0 +1,74 @@
+'''Cost of `BaseDocument` validation per article, dominated by text cleaning.
+
+Usage:
+    python benchmarks/validation.py [--rounds=200]
+
+The fixture articles are validated in the two shapes the scrapers hand over:
+`scraped` (body text already extracted from the page, as for techcrunch and
+cbssports) and `feed html` (the body as the `content:encoded` markup of the feed).
+Each is timed with the previous cleaning, which ran every field through
+BeautifulSoup, and with the current one, which only parses fields that contain
+markup. Both must produce identical documents.
+'''
+import html
+import re
+import time
+import warnings
+
+import fire
+
+import _common
+from fixture_server import load_articles, raw_documents
+
+
+def _legacy_clean_full(text: str) -> str:
+    from utils.data_clean import remove_html_tags
+    if not text: return ""
+    return re.sub(r'\s+', ' ', html.unescape(remove_html_tags(text))).strip()
+
+
+def _legacy_clean_url(text: str) -> str:
+    from utils.data_clean import remove_html_tags
+    return re.sub(r'\s+', ' ', remove_html_tags(text)).strip() if text else ""
+
+
+def _time(documents: list, rounds: int) -> tuple:
+    from config.pydantic_models import BaseDocument
+
+    validated = [BaseDocument(**raw) for raw in documents]  # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for raw in documents:
+            BaseDocument(**raw)
+    seconds = time.perf_counter() - start
+    return seconds / (rounds * len(documents)) * 1e6, validated
+
+
+def main(rounds: int = 200):
+    '''Report µs per validated document with the legacy and the current cleaning'''
+
+    import config.pydantic_models as models
+
+    from bs4 import MarkupResemblesLocatorWarning
+    warnings.filterwarnings('ignore', category=MarkupResemblesLocatorWarning)  # legacy parser on url fields
+
+    articles = load_articles()
+    current = (models.clean_full, models.clean_url)
+    print(f'{"input":<12}{"legacy µs/doc":>16}{"current µs/doc":>17}{"speedup":>10}')
+    for name, markup in (('scraped', False), ('feed html', True)):
+        documents = raw_documents(articles, markup)
+
+        models.clean_full, models.clean_url = _legacy_clean_full, _legacy_clean_url
+        try:
+            legacy_us, legacy_docs = _time(documents, rounds)
+        finally:
+            models.clean_full, models.clean_url = current
+        current_us, current_docs = _time(documents, rounds)
+
+        assert [d.model_dump() for d in legacy_docs] == [d.model_dump() for d in current_docs], \
+            f'{name}: cleaned output differs from the legacy cleaning'
+        print(f'{name:<12}{legacy_us:>16.1f}{current_us:>17.1f}{legacy_us / current_us:>9.1f}x')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
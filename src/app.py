@@ -1,13 +1,13 @@
 import os
 import sys
 import re
+import time
+from typing import Optional
 import streamlit as st 
-from qdrant_client import QdrantClient
-from embedding import GoogleTextEmbedder
 from config.setting import Settings
-from utils.data_clean import clean_full
-from jinja2 import environment,FileSystemLoader
-from langchain_groq import ChatGroq
+from search import facet_counts, build_filter
+from summary import retrieve_context, generate_summary
+from utils.logger import setup_logger
 
 
 from dotenv import load_dotenv
@@ -15,79 +15,13 @@ load_dotenv()
 
 
 settings = Settings()
-
-
-qdrant = QdrantClient(settings.QDRANT_ENDPOINT,
-                      api_key=settings.QDRANT_API_KEY,)
+logger = setup_logger()
 
 st.title('News Search Engine And Summarizer')
 
 st.write('This is a real-time RAG system that allows you to search for news articles and get summaries.')
 
 
-def get_prompt(filename: str) -> str:
-    '''
-    Load the prompt template from the given file path.
-    '''
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # This is /app/src
-    PROMPT_DIR = os.path.join(BASE_DIR, "prompts")         # This is /app/src/prompts
-    env  = environment.Environment(loader=FileSystemLoader(PROMPT_DIR))
-    Template = env.get_template(filename)
-    return Template
-
-
-def query_vectordatabase(query: str):
-    '''
-    Search for news articles in the Qdrant database using the query.
-    '''
-
-    embedder  = GoogleTextEmbedder()
-    embed_query = embedder(query)
-    results = qdrant.query_points(
-        collection_name=settings.QDRANT_COLLECTION_NAME,
-        query=embed_query,
-        limit=8,
-        with_payload=True
-    )
-
-    
-    return [
-        {   'content': clean_full(res.payload['content']),
-            "score": res.score,
-            "title": res.payload["title"],
-            "image": res.payload["image_url"],
-            "date": res.payload["published_at"],
-            "original": res.payload["url"],
-            "source_num" : i + 1
-        }
-        for i, res in enumerate(results.points)
-    ]
-    
-
-def generate_summary(query: str) -> str:
-    '''
-    Generate a summary of the news articles using the query.
-    '''
-
-
-    content = query_vectordatabase(query)
-    print(content)
-    docu = [{"content":doc['content'],"source_num" : doc['source_num']} for doc in content]
-    prompt_template = get_prompt('summary_prompt.j2')
-    prompt = prompt_template.render(query=query, documents=docu)
-
-    llm = ChatGroq(model=settings.GROQ_MODEL_ID,api_key=settings.GROQ_API_KEY, temperature=0.1)
-    message = [
-        ("system",prompt),
-        ("human", query)
-    ]
-
-    for chunk in llm.stream(message):
-        if chunk.content:
-            yield chunk.content,content
-
-    
-
 def link_citations(text,source_map):
     '''Replace inline citations in the text with clickable links.
     '''
@@ -104,25 +38,91 @@ def extract_used_citations(text: str) -> set:
     return set(map(int, re.findall(r'\[(\d+)\]', text)))
 
 
+class CitationLinker:
+    '''Links the citations of a streamed answer as the chunks arrive.
+
+    Each piece of text is linked once; only a trailing, possibly incomplete
+    citation such as `[1` is held back until the next chunk completes it.'''
+
+    _open_citation = re.compile(r'\[\d*$')
+
+    def __init__(self, source_map: dict):
+        self.source_map = source_map
+        self.text = ''
+        self._linked = ''
+        self._pending = ''
+
+    def feed(self, chunk: str) -> str:
+        '''Add a chunk and return the answer rendered so far'''
+        self.text += chunk
+        self._pending += chunk
+        match = self._open_citation.search(self._pending)
+        cut = match.start() if match else len(self._pending)
+        self._linked += link_citations(self._pending[:cut], self.source_map)
+        self._pending = self._pending[cut:]
+        return self._linked + self._pending
+
+
+@st.cache_data(ttl=300)
+def get_facets(key: str, max_age_hours: Optional[float] = None) -> dict:
+    '''Facet counts for the filter widgets, refreshed every 5 minutes.'''
+    return facet_counts(key, build_filter(max_age_hours))
+
+
+
+TIME_WINDOWS = {'Any time': None, 'Past 24 hours': 24, 'Past week': 24 * 7, 'Past month': 24 * 30}
 
 query = st.text_input("Ask something about current news")
+time_window = st.selectbox("Published", list(TIME_WINDOWS))
+
+category_counts = get_facets('category', TIME_WINDOWS[time_window])
+source_counts = get_facets('source_name', TIME_WINDOWS[time_window])
+categories = st.multiselect("Categories", list(category_counts),
+                            format_func=lambda c: f"{c} ({category_counts[c]})")
+sources = st.multiselect("Sources", list(source_counts),
+                         format_func=lambda s: f"{s} ({source_counts[s]})")
 
 if query:
-    response_stream = generate_summary(query)
+    query_start = time.perf_counter()
+    with st.spinner("Searching news..."):
+        content = retrieve_context(query, max_age_hours=TIME_WINDOWS[time_window],
+                                   categories=categories, sources=sources)
+    retrieval_time = time.perf_counter() - query_start
 
-    final_output = ""
-    source_links = {}
+    source_links = {doc["source_num"]: 
+                    {'url' : doc["original"],
+                     'title': doc['title']} 
+                     for doc in content}
 
-    with st.spinner("Generating answer..."):
-        for chunk, sources in response_stream:
-            final_output += chunk
-            source_links = {doc["source_num"]: 
-                            {'url' : doc["original"],
-                             'title': doc['title']} 
-                             for doc in sources}
+    with st.expander(f"📰 {len(source_links)} articles retrieved"):
+        for num, ls in source_links.items():
+            st.markdown(f"[{num}]: [{ls['title']}]({ls['url']})", unsafe_allow_html=True)
 
     st.subheader("🧠 Answer")
-    st.markdown(link_citations(final_output, source_links), unsafe_allow_html=True)
+    answer = st.empty()
+    linker = CitationLinker(source_links)
+    time_to_first_token = None
+    generation_start = time.perf_counter()
+    for chunk in generate_summary(query, content):
+        if time_to_first_token is None:
+            time_to_first_token = time.perf_counter() - query_start
+        answer.markdown(linker.feed(chunk), unsafe_allow_html=True)
+    generation_time = time.perf_counter() - generation_start
+    final_output = linker.text
+
+    if time_to_first_token is None:
+        # nothing streamed (empty or failed answer): no time to first token to report
+        logger.warning(
+            f"Query latency: retrieval={retrieval_time:.3f}s no tokens streamed "
+            f"generation={generation_time:.3f}s documents={len(content)}"
+        )
+        st.caption(f"No answer streamed after {generation_time:.2f}s")
+    else:
+        logger.info(
+            f"Query latency: retrieval={retrieval_time:.3f}s time_to_first_token={time_to_first_token:.3f}s "
+            f"generation={generation_time:.3f}s documents={len(content)}"
+        )
+        st.caption(f"First token after {time_to_first_token:.2f}s · answer generated in {generation_time:.2f}s")
 
 
 
@@ -134,5 +134,3 @@ if query:
         }
     for num, ls in filtered_sources.items():
         st.markdown(f"[{num}]: [{ls['title']}]({ls['url']})", unsafe_allow_html=True)
-
-
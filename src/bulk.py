@@ -0,0 +1,201 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional, List, Iterator, Dict
+
+import fire
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client import models
+
+from config.setting import Settings
+from utils.logger import setup_logger
+from vector_database import (QdrantVectorSink, current_index_spec, index_collection, resolve_alias, list_shards,
+                             shard_name, swap_alias)
+
+
+logger = setup_logger()
+settings = Settings()
+
+MANIFEST = 'manifest.json'
+
+
+def source_collections(client: QdrantClient, alias: str) -> List[str]:
+    '''The collections of the current index: its weekly shards, or the one behind the alias'''
+    if settings.QDRANT_SHARDING == 'weekly':
+        return list_shards(client, current_index_spec().collection_name(alias))
+    name = resolve_alias(client, alias) or alias
+    return [name] if client.collection_exists(name) else []
+
+
+def _pages(client: QdrantClient, collection_name: str, page_size: int) -> Iterator[List[models.Record]]:
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name, limit=page_size, offset=offset,
+                                       with_payload=True, with_vectors=True)
+        if points:
+            yield points
+        if offset is None:
+            return
+
+
+def _write_part(directory: str, number: int, ids: list, vectors: List[np.ndarray], payloads: List[dict]) -> dict:
+    '''One part: `part-N.npy` with the float32 vectors, `part-N.parquet` with `point_id`
+    and one column per payload field, row i of one matching row i of the other'''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    name = f'part-{number:05d}'
+    np.save(os.path.join(directory, f'{name}.npy'), np.concatenate(vectors))
+    # every field of the part, not only those of its first point: older points lack the newer fields
+    fields = list(dict.fromkeys(key for payload in payloads for key in payload))
+    table = pa.table({'point_id': ids, **{key: [payload.get(key) for payload in payloads] for key in fields}})
+    pq.write_table(table, os.path.join(directory, f'{name}.parquet'), compression='zstd')
+    return {'name': name, 'points': len(ids)}
+
+
+def _client() -> QdrantClient:
+    return QdrantClient(url=settings.QDRANT_ENDPOINT, api_key=settings.QDRANT_API_KEY)
+
+
+def export(directory: str, collection: Optional[str] = None, page_size: int = 1000, part_size: int = 20000,
+           client: Optional[QdrantClient] = None) -> dict:
+    '''
+    Export the vectors and payloads of the collection to Parquet/NumPy parts.
+
+    Points are read with scroll pagination, `page_size` at a time, and written every
+    `part_size` points: the vectors as a float32 `(points, size)` array in
+    `part-N.npy`, the payload fields as columns of `part-N.parquet` (zstd) next to
+    `point_id`. `manifest.json` records the index the vectors belong to, the
+    vector size and the parts with their source collection. With weekly sharding
+    every shard of the current index is exported.
+
+    Args:
+        directory (str): created if needed; existing parts are overwritten.
+        collection (str, optional): export this collection instead of the current index.
+        page_size (int): points per scroll request.
+        part_size (int): points per part at least, the last part of a collection holds the rest.
+        client: defaults to the configured Qdrant.
+    '''
+    client = client or _client()
+    collections = [collection] if collection else source_collections(client, settings.QDRANT_COLLECTION_NAME)
+    if not collections:
+        raise ValueError(f"No collection to export for '{settings.QDRANT_COLLECTION_NAME}'.")
+    os.makedirs(directory, exist_ok=True)
+
+    start = time.perf_counter()
+    parts, vector_size = [], None
+    for name in collections:
+        vector_size = client.get_collection(name).config.params.vectors.size
+        ids, vectors, payloads, count = [], [], [], 0
+        for page in _pages(client, name, page_size):
+            ids.extend(point.id for point in page)
+            vectors.append(np.asarray([point.vector for point in page], dtype=np.float32))
+            payloads.extend(point.payload or {} for point in page)
+            if len(ids) >= part_size:
+                parts.append({**_write_part(directory, len(parts), ids, vectors, payloads), 'collection': name})
+                count += len(ids)
+                ids, vectors, payloads = [], [], []
+        if ids:
+            parts.append({**_write_part(directory, len(parts), ids, vectors, payloads), 'collection': name})
+            count += len(ids)
+        logger.info("Exported %d points of '%s'.", count, name)
+
+    manifest = {
+        'index': None if collection else current_index_spec().model_dump(),
+        'vector_size': vector_size,
+        'sharding': settings.QDRANT_SHARDING if not collection else 'none',
+        'exported_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'parts': parts,
+    }
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    points = sum(part['points'] for part in parts)
+    seconds = time.perf_counter() - start
+    print(f"Exported {points} points from {len(collections)} collection(s) to '{directory}' "
+          f"in {len(parts)} parts, {seconds:.1f}s ({points / seconds if seconds else 0:.0f} points/s).")
+    return manifest
+
+
+def _read_part(directory: str, part: dict):
+    import pyarrow.parquet as pq
+
+    vectors = np.load(os.path.join(directory, f"{part['name']}.npy"), mmap_mode='r')
+    rows = pq.read_table(os.path.join(directory, f"{part['name']}.parquet")).to_pylist()
+    return vectors, rows
+
+
+def load(directory: str, collection: Optional[str] = None, batch_size: int = 256, workers: int = 4,
+         client: Optional[QdrantClient] = None) -> int:
+    '''
+    Bulk-load an `export` into Qdrant, without re-embedding.
+
+    Each part is upserted in batches of `batch_size` points by `workers` threads,
+    under the exported point ids, so loading twice leaves the same points. By
+    default the points go to the collection of the current index, created with the
+    configured vector settings and payload indexes, and the alias is created when
+    missing; with weekly sharding each point goes to the shard of its
+    `published_ts`, whatever the layout it was exported from. Payload fields that
+    are null in the Parquet columns are left out.
+
+    Args:
+        directory (str): written by `export`.
+        collection (str, optional): load into this collection instead, e.g. to load
+            vectors of another index.
+        batch_size (int): points per upsert request.
+        workers (int): concurrent upsert requests, 1 with a local-mode client.
+        client: defaults to the configured Qdrant.
+    '''
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    client = client or _client()
+    if client.init_options.get('location') == ':memory:' or client.init_options.get('path'):
+        workers = 1  # the local mode does not support concurrent writes
+    alias = settings.QDRANT_COLLECTION_NAME
+    spec = current_index_spec()
+    if collection is None and manifest['index'] != spec.model_dump():
+        raise ValueError(f"The export holds vectors of {manifest['index']}, the current index is "
+                         f"{spec.model_dump()}: pass --collection to load it elsewhere.")
+
+    sharded = collection is None and settings.QDRANT_SHARDING == 'weekly'
+    target = collection or (spec.collection_name(alias) if sharded else index_collection(client, alias, spec))
+    ready = set()  # collections created, with their payload indexes
+
+    def upsert(name: str, ids: list, vectors: np.ndarray, payloads: List[dict]) -> int:
+        client.upsert(name, points=models.Batch(ids=ids, vectors=vectors.tolist(), payloads=payloads), wait=True)
+        return len(ids)
+
+    start = time.perf_counter()
+    loaded = 0
+    with ThreadPoolExecutor(workers, thread_name_prefix='bulk-load') as executor:
+        for part in manifest['parts']:
+            vectors, rows = _read_part(directory, part)
+            futures = []
+            for i in range(0, len(rows), batch_size):
+                batches: Dict[str, List[int]] = {}
+                for j in range(i, min(i + batch_size, len(rows))):
+                    name = shard_name(target, rows[j].get('published_ts')) if sharded else target
+                    batches.setdefault(name, []).append(j)
+                for name, rows_of_batch in batches.items():
+                    if name not in ready:
+                        QdrantVectorSink(client, name, vector_size=manifest['vector_size'], sharded=False)
+                        ready.add(name)
+                    payloads = [{k: v for k, v in rows[j].items() if k != 'point_id' and v is not None}
+                                for j in rows_of_batch]
+                    futures.append(executor.submit(upsert, name, [rows[j]['point_id'] for j in rows_of_batch],
+                                                   vectors[rows_of_batch], payloads))
+            loaded += sum(future.result() for future in futures)  # one part in memory at a time
+            logger.info("Loaded %s: %d points.", part['name'], part['points'])
+
+    if collection is None and not sharded and not client.collection_exists(alias):
+        swap_alias(client, alias, target)
+    seconds = time.perf_counter() - start
+    print(f"Loaded {loaded} points into '{target}'{' shards' if sharded else ''} in {seconds:.1f}s "
+          f"({loaded / seconds if seconds else 0:.0f} points/s).")
+    return loaded
+
+
+if __name__ == '__main__':
+    fire.Fire({'export': export, 'load': load})
@@ -1,26 +1,54 @@
 from pydantic import BaseModel, Field,field_validator
-from typing import List, Optional, Dict, Union , Any
+from typing import List, Optional, Dict, Union , Any, TYPE_CHECKING
 from uuid import uuid4
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import hashlib
 import json
 
 
-from dateutil import parser
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from unstructured.staging.huggingface import chunk_by_attention_window
-
-
+# The producer imports this module to validate articles, so the chunking and
+# embedding dependencies are only imported where the dataflow uses them.
 from utils.logger import setup_logger
-from utils.data_clean import clean_full, remove_html_tags, normalize_whitespace
-from embedding import GoogleTextEmbedder
+from utils.data_clean import clean_full, clean_url
 from config.setting import Settings
 
+if TYPE_CHECKING:
+    from embedding import GoogleTextEmbedder
+
 
 logger = setup_logger()
 settings  = Settings()
 
 
+PUBLISHED_AT_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def published_timestamp(published_at: Optional[str]) -> Optional[int]:
+    '''Convert a normalized (UTC) `published_at` string to integer epoch seconds'''
+    if not published_at:
+        return None
+    try:
+        parsed = datetime.strptime(published_at, PUBLISHED_AT_FORMAT)
+    except ValueError:
+        return None
+    return int(parsed.replace(tzinfo=timezone.utc).timestamp())
+
+
+def parse_published(value: str) -> datetime:
+    '''Parse a feed date: RFC 822 (RSS) and ISO 8601 (Atom) directly, anything else with dateutil'''
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        pass
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        pass
+    from dateutil import parser
+    return parser.parse(value)
+
+
 class DocumentSource(BaseModel):
     id : Optional[str]
     name : str
@@ -29,8 +57,9 @@ class DocumentSource(BaseModel):
 
 class RefinedDocument(BaseModel):
     doc_id : str
-    is_new : Optional[bool] = Field(default=None, description='Flag to indicate if the document is new or seen before')
+    is_new : Optional[bool] = Field(default=None, description='Flag to indicate if the document is new or changed since last seen')
     full_text : str = ''
+    content_hash : Optional[str] = Field(default=None, description='md5 of full_text, tells an edited article from a seen one')
     metadata : dict = {}
     
     @classmethod
@@ -39,12 +68,15 @@ class RefinedDocument(BaseModel):
 
         refined = RefinedDocument(doc_id=str(base.article_id))
         refined.full_text = '.'.join([base.title, base.content])
+        refined.content_hash = hashlib.md5(refined.full_text.encode()).hexdigest()
         refined.metadata = {
             'title': base.title,
             'url': base.url,
             'content' : base.content,
             'published_at': base.published_at,
+            'published_ts': published_timestamp(base.published_at),
             'source_name': base.source_name,
+            'category': settings.SOURCE_CATEGORIES.get(base.source_name, 'other'),
             'image_url': base.image_url,
             'description': base.description,
             'author': base.author
@@ -64,10 +96,12 @@ class ChuckedDocument(BaseModel):
 
 
     @classmethod
-    def from_refined(cls, refined_doc: RefinedDocument,embedding_model:GoogleTextEmbedder) -> list['ChuckedDocument']:
+    def from_refined(cls, refined_doc: RefinedDocument,embedding_model:'GoogleTextEmbedder',
+                     chunk_size: int = settings.GOOGLE_CHUNCK_MAX_INPUT_LENGTH,
+                     chunk_overlap: int = settings.GOOGLE_CHUNCK_OVERLAP) -> list['ChuckedDocument']:
 
         chunks = ChuckedDocument._chunkenize(
-            refined_doc.full_text, #embedding_model
+            refined_doc.full_text, chunk_size, chunk_overlap #embedding_model
         )
 
         return [
@@ -87,14 +121,17 @@ class ChuckedDocument(BaseModel):
     @staticmethod
     def _chunkenize(text: str,Max_tokens: int=settings.GOOGLE_CHUNCK_MAX_INPUT_LENGTH,
                     overlap: int = settings.GOOGLE_CHUNCK_OVERLAP) -> list[str]:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-        splitter = RecursiveCharacterTextSplitter()
+        splitter = RecursiveCharacterTextSplitter(chunk_size=Max_tokens, chunk_overlap=overlap)
         chunks = splitter.split_text(text=text)
         
         return chunks
     
     @staticmethod
-    def chunkenize(text: str, embedding_model:GoogleTextEmbedder) -> list[str]:
+    def chunkenize(text: str, embedding_model:'GoogleTextEmbedder') -> list[str]:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        from unstructured.staging.huggingface import chunk_by_attention_window
 
         splitter = RecursiveCharacterTextSplitter()
         text_sections = splitter.split_text(text=text)
@@ -121,14 +158,17 @@ class EmbedDocument(BaseModel):
 
     @classmethod
     def from_chunked(cls, chunked_doc: ChuckedDocument, 
-                     embedding_model:GoogleTextEmbedder) -> 'EmbedDocument':
+                     embedding_model:'GoogleTextEmbedder') -> 'EmbedDocument':
         
+        embedding = embedding_model(chunked_doc.text)
+        if embedding is None:  # the embedder logs the cause and returns None
+            raise ValueError(f'No embedding returned for chunk {chunked_doc.chunk_id} of {chunked_doc.doc_id}')
         return cls(
             doc_id = chunked_doc.doc_id,
             chunk_id = chunked_doc.chunk_id,
             full_raw_text = chunked_doc.full_raw_text,
             text = chunked_doc.text,
-            embedding = embedding_model(chunked_doc.text),
+            embedding = embedding,
             metadata = chunked_doc.metadata
         )
         
@@ -184,9 +224,7 @@ class BaseDocument(BaseModel):
     def clean_url_fields(cls,v):
         if v is None :
             return 'N/A'
-        v = remove_html_tags(v)
-        v = normalize_whitespace(v)
-        return v
+        return clean_url(v)
     
     @field_validator('published_at')
     def clean_Date_fields(cls,v):
@@ -194,8 +232,10 @@ class BaseDocument(BaseModel):
         
         Errors if default format is be used'''
         try: 
-            parsed_date = parser.parse(v)
-            return parsed_date.strftime('%Y-%m-%d %H:%M:%S')
+            parsed_date = parse_published(v)
+            if parsed_date.tzinfo is not None:
+                parsed_date = parsed_date.astimezone(timezone.utc) # one timeline across sources
+            return parsed_date.strftime(PUBLISHED_AT_FORMAT)
         except (ValueError,TypeError) as e:
             logger.error(F'Error parsing date: {v} , Usinf the default[current] date instead ')
 
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings 
 
 
@@ -13,6 +15,12 @@ class Settings(BaseSettings):
     KAFKA_SECURITY_PROTOCOL: str
     KAFKA_SASL_MECHANISM: str
     KAFKA_ACKS: str
+    KAFKA_DEAD_LETTER_TOPIC : str = 'news-dead-letter'  # failed messages/documents, '' only logs them
+    KAFKA_DEAD_LETTER_REPLAY_GROUP : str = 'news-dead-letter-replay'
+    KAFKA_CONSUMER_BATCH_SIZE : int = 500  # messages per micro-batch handed to the dataflow
+    KAFKA_FETCH_MIN_BYTES : int = 1  # broker waits for this much data before answering a fetch...
+    KAFKA_FETCH_WAIT_MAX_MS : int = 100  # ...or this long
+    KAFKA_MAX_PARTITION_FETCH_BYTES : int = 1048576
 
     
     NEWSAPI_KEY: str
@@ -21,6 +29,32 @@ class Settings(BaseSettings):
     ARTICLES_BATCH_SIZE: int = 5 
 
     FETCH_WAIT_WINDOW: int = 3600  # seconds (30 minutes)
+    PRODUCER_MAX_WORKERS : int = 16  # feeds and article pages fetched concurrently, across all sources
+    PRODUCER_MAX_IN_FLIGHT : int = 64  # articles fetched but not produced yet, bounds memory when Kafka is slow
+    KAFKA_PRODUCER_QUEUE_MAX_MESSAGES : int = 10000  # librdkafka local queue, BufferError when full
+    KAFKA_PRODUCER_QUEUE_MAX_KBYTES : int = 65536
+    PRODUCER_RUN_DEADLINE : float = 300  # seconds, fetches still pending after it are abandoned
+    SCRAPER_REQUEST_TIMEOUT : float = 20  # seconds per feed or article page request
+    PRODUCER_CURSOR_DIR : str = 'feed_cursors'  # newest delivered entry per source, delete to fetch everything again
+    PRODUCER_CURSOR_MAX_ATTEMPTS : int = 3  # runs an undelivered entry holds its source's cursor back
+    PRODUCER_CURSOR_UNDATED_IDS : int = 1000  # ids of done entries without a date remembered per source
+
+    # article pages fetched by the scrapers, see utils/page_cache.py
+    PAGE_CACHE_DIR : str = 'page_cache'  # '' disables the cache
+    PAGE_CACHE_MAX_MB : float = 512  # zstd-compressed bodies, least recently read evicted first
+    PAGE_CACHE_MAX_AGE : float = 0  # seconds a page is served without revalidation, 0 always asks the site
+    PAGE_CACHE_OFFLINE : bool = False  # serve cached pages only, e.g. to replay a selector change
+    PAGE_CACHE_ZSTD_LEVEL : int = 10
+
+    METRICS_PORT : int = 9100  # Prometheus /metrics endpoint of the dataflow, 0 disables
+    KAFKA_LAG_INTERVAL : float = 15  # seconds between consumer lag checks
+    FLOW_DEBUG : bool = False  # print every item at the inspect steps of the dataflow
+    FLOW_REPLAY_SPEED : float = 1  # topic_log.py replay: N x the recorded pace, 0 as fast as possible
+
+    LOG_DIR : str = 'logs'
+    LOG_FORMAT : str = 'text'  # console format: text | json (the log file is always json lines)
+    LOG_QUEUE_SIZE : int = 10000  # records buffered for the writer thread before new ones are dropped
+    LOG_SAMPLE_PER_SECOND : float = 1  # per call site, for per-item messages logged with extra=SAMPLED
 
 
     GOOGLE_EMBEDDING_MODEL :str = "models/text-embedding-004" #(8192)
@@ -36,11 +70,38 @@ class Settings(BaseSettings):
     
 
     QDRANT_BATCH_SIZE : int = 7
-    QDRANT_COLLECTION_NAME : str 
+    QDRANT_COLLECTION_NAME : str  # alias the app searches, pointing at a versioned collection
     QDRANT_ENDPOINT : str
     QDRANT_API_KEY : str
     QDRANT_CLUSTER : str
 
+    QDRANT_QUANTIZATION : str = 'none'  # none | scalar (int8) | binary, applied when the collection is created
+    QDRANT_QUANTIZATION_ALWAYS_RAM : bool = True
+    QDRANT_ON_DISK_VECTORS : bool = False  # keep original float32 vectors on disk
+    QDRANT_HNSW_M : int = 16
+    QDRANT_HNSW_EF_CONSTRUCT : int = 100
+    QDRANT_HNSW_ON_DISK : bool = False
+    QDRANT_SEARCH_HNSW_EF : Optional[int] = None  # None = Qdrant default
+    QDRANT_SEARCH_OVERSAMPLING : float = 2.0  # quantized candidates fetched per result before rescoring
+    QDRANT_SEARCH_RESCORE : bool = True  # rescore quantized candidates with the original vectors
+    QDRANT_SHARDING : str = 'none'  # none | weekly: one collection per ISO week of published_ts
+    QDRANT_SEARCH_SHARDS : int = 4  # newest weekly shards searched without a time window, 0 = all
+    QDRANT_SEARCH_FANOUT_WORKERS : int = 8  # shards searched concurrently
+
+    # target index of a migration: while any is set the flow dual-writes and reindex.py backfills it
+    REINDEX_EMBEDDING_MODEL : Optional[str] = None
+    REINDEX_VECTOR_SIZE : Optional[int] = None
+    REINDEX_CHUNK_SIZE : Optional[int] = None
+    REINDEX_CHUNK_OVERLAP : Optional[int] = None
+    REINDEX_RATE : float = 5  # chunks per second embedded by the backfill
+    REINDEX_STATE_DIR : str = 'reindex_state'  # resume points of the backfill
+
+    # retention.py deletes points whose published_ts is older than their source's TTL
+    RETENTION_DAYS : Optional[float] = 30  # default TTL, None keeps articles forever
+    RETENTION_SOURCE_DAYS : dict[str, float] = {}  # source_name -> TTL overriding RETENTION_DAYS
+    RETENTION_DELETE_BATCH : int = 256  # points per delete request
+    RETENTION_DELETE_RATE : float = 4  # delete requests per second, keeps searches unaffected
+
 
 
     TECHCRUNCH_URL : str = 'https://techcrunch.com/feed/'
@@ -50,9 +111,45 @@ class Settings(BaseSettings):
     ARTS_URL : str = "https://feeds.arstechnica.com/arstechnica/index"
     CBS_URL : str = "https://www.cbssports.com/rss/headlines/soccer/"
 
+    SOURCE_CATEGORIES : dict[str, str] = {  # source_name -> category facet
+        'techcrunch': 'tech',
+        'Theverge': 'tech',
+        'art_tech': 'tech',
+        'cbssports': 'sports',
+        'channelstv': 'news',
+        'arise': 'news',
+    }
+
 
     GROQ_API_KEY: str
-    GROQ_MODEL_ID: str 
+    GROQ_MODEL_ID: str
+
+
+    CONTEXT_CANDIDATES : int = 24  # over-fetched search results the context is packed from
+    CONTEXT_MAX_DOCUMENTS : int = 8
+    CONTEXT_TOKEN_BUDGET : int = 3000  # approx. tokens of article text in the summary prompt
+    CONTEXT_MIN_PASSAGE_TOKENS : int = 50
+    CONTEXT_MMR_LAMBDA : float = 0.7  # 1.0 = relevance only, 0.0 = diversity only
+    CONTEXT_DUPLICATE_THRESHOLD : float = 0.95  # cosine similarity of near-identical articles
+    CONTEXT_OVERLAP_THRESHOLD : float = 0.6  # shared 5-word shingles of overlapping passages
+
+
+    SEARCH_RECENCY_WEIGHT : float = 0.1  # 0 disables the recency boost
+    SEARCH_RECENCY_HALF_LIFE_HOURS : float = 48
+    SEARCH_RECENCY_CANDIDATES : int = 100  # vector candidates rescored with the recency decay
+    SEARCH_QUERY_EXPANSION : bool = True  # search local rewrites of the query too, see query_expansion.py
+    SEARCH_EXPANSIONS : int = 4  # query variants, the query included
+    SEARCH_FUSION_K : int = 60  # reciprocal rank fusion constant, higher flattens the rank weights
+
+    # second stage over the CONTEXT_CANDIDATES search results, see reranker.py
+    RERANK_ENABLED : bool = True
+    RERANK_LEXICAL_WEIGHT : float = 0.2  # share of query terms in the content
+    RERANK_TITLE_WEIGHT : float = 0.2  # share of query terms in the title
+    RERANK_RECENCY_WEIGHT : float = 0.05  # on top of the search's own recency boost
+    RERANK_SOURCE_PENALTY : float = 0.03  # per higher-ranked candidate from the same source
+    RERANK_RELATIVE_CUTOFF : float = 0.3  # of the min-max normalized score, 0 keeps every candidate
+    RERANK_MIN_SCORE : Optional[float] = None  # absolute cutoff, depends on the embedding model
+    RERANK_MIN_DOCUMENTS : int = 3  # kept whatever the cutoffs, a summary needs several sources
 
 
     class config:
@@ -1,24 +1,30 @@
-import json
-from typing import List
+from typing import List, Optional
 
+import orjson
+from bytewax.connectors.kafka import KafkaSourceMessage, KafkaSource 
+from bytewax.inputs import StatefulSourcePartition
+from pydantic import TypeAdapter, ValidationError
 
-from bytewax.connectors.kafka import KafkaSinkMessage, KafkaSource 
 
 
-
-from utils.logger import setup_logger
+from utils.logger import setup_logger, SAMPLED
 from config.setting import Settings
 from config.pydantic_models import BaseDocument
+from dead_letter import DeadLetterQueue, DECODE
+from utils.metrics import KafkaLagMonitor, CONSUMER_BATCH_SIZE
 
 
 logger = setup_logger()
 settings = Settings()
 
+_DOCUMENT = TypeAdapter(BaseDocument)
+_DOCUMENTS = TypeAdapter(list[BaseDocument])
 
-def build_kafka_source() -> KafkaSource:
-    """Builds a Kafka source for consuming messages."""
-    
-    kafka_config = {
+
+def kafka_consumer_config() -> dict:
+    """Connection settings shared by the Kafka source and the lag monitor."""
+
+    return {
         "bootstrap.servers" : settings.KAFKA_BOOTSTRAP_SERVERS,
         "auto.offset.reset" : "latest",  # Start consuming from the new message
         "security.protocol" : settings.KAFKA_SECURITY_PROTOCOL,
@@ -27,37 +33,121 @@ def build_kafka_source() -> KafkaSource:
         "sasl.password" : settings.KAFKA_PASSWORD,
     }
 
-    kafka_input = KafkaSource(
+
+class _KafkaBatchPartition(StatefulSourcePartition):
+    """Emits each batch consumed by the wrapped Kafka partition as a single item."""
+
+    def __init__(self, partition: StatefulSourcePartition):
+        self._partition = partition
+
+    def next_batch(self) -> List[List[KafkaSourceMessage]]:
+        batch = self._partition.next_batch()
+        return [batch] if batch else []
+
+    def next_awake(self):
+        return self._partition.next_awake()
+
+    def snapshot(self):
+        return self._partition.snapshot()
+
+    def close(self) -> None:
+        self._partition.close()
+
+
+class KafkaBatchSource(KafkaSource):
+    """KafkaSource emitting micro-batches: lists of up to `batch_size` messages per item."""
+
+    def build_part(self, step_id: str, for_part: str, resume_state) -> _KafkaBatchPartition:
+        return _KafkaBatchPartition(super().build_part(step_id, for_part, resume_state))
+
+
+def build_kafka_source() -> KafkaBatchSource:
+    """Builds a Kafka source for consuming message batches."""
+    
+    kafka_config = {
+        **kafka_consumer_config(),
+        "fetch.min.bytes" : settings.KAFKA_FETCH_MIN_BYTES,
+        "fetch.wait.max.ms" : settings.KAFKA_FETCH_WAIT_MAX_MS,
+        "max.partition.fetch.bytes" : settings.KAFKA_MAX_PARTITION_FETCH_BYTES,
+    }
+
+    kafka_input = KafkaBatchSource(
         topics= [settings.KAFKA_TOPIC],
         brokers = [settings.KAFKA_BOOTSTRAP_SERVERS],
-        add_config=kafka_config
+        add_config=kafka_config,
+        batch_size=settings.KAFKA_CONSUMER_BATCH_SIZE
     )
 
     logger.info(f"Kafka source created for topic: {settings.KAFKA_TOPIC} with brokers: {settings.KAFKA_BOOTSTRAP_SERVERS} successfully.")
 
     return kafka_input
 
-def process_messages(messages: KafkaSinkMessage) -> List[BaseDocument]:
-    """Processes incoming Kafka messages and converts them to list of BaseDocument objects."""
 
-    documents: List[BaseDocument] = []
+def _validate(payloads: List[tuple], dead_letter: Optional[DeadLetterQueue]) -> List[BaseDocument]:
+    """Validate (message, data) pairs in one call, dead-lettering the invalid ones."""
+
+    documents = None
     try:
+        return _DOCUMENTS.validate_python([data for _, data in payloads])
+    except ValidationError as e:
+        invalid = {}
+        for error in e.errors():
+            invalid.setdefault(error['loc'][0], ('ValidationError', []))[1].append(
+                f"{'.'.join(map(str, error['loc'][1:])) or 'document'}: {error['msg']}")
+    except Exception:
+        # a validator raised outside pydantic's error handling: validate one by one
+        documents, invalid = [], {}
+        for i, (_, data) in enumerate(payloads):
+            try:
+                documents.append(_DOCUMENT.validate_python(data))
+            except Exception as e:
+                invalid[i] = (type(e).__name__, [str(e)])
 
-        json_str  = messages.value.decode("utf-8")
-        logger.info(f"Received message from Kafka: {type(json_str)}")
-        data = json.loads(json_str)
-        
-        doc = BaseDocument.from_json(data) # convert to basedocument
-        documents.append(doc)
-        logger.info(f"Processed {len(documents)} messages from Kafka.")
+    for i, (error_type, errors) in invalid.items():
+        message = payloads[i][0]
+        reason = '; '.join(errors)
+        logger.error("Invalid document at offset %s: %s", message.offset, reason, extra=SAMPLED)
+        if dead_letter is not None:
+            dead_letter.send(DECODE, reason, message.value, key=message.key, source=message,
+                             error_type=error_type)
+    if documents is not None:
         return documents
-    
-    except StopIteration:
-        logger.info("No more messages to process.")
-    except KeyError as e:
-        logger.error(f"KeyError while processing messages: {e}")
-    except json.JSONDecodeError as e:
-        logger.error(f"JSONDecodeError while processing messages: {e}")
-        raise 
-    except Exception as e:
-        logger.error(f"Unexpected error while processing messages: {e}")
+    valid = [payload for i, payload in enumerate(payloads) if i not in invalid]
+    return _validate(valid, dead_letter) if valid else []
+
+
+def process_batch(messages: List[KafkaSourceMessage],
+                  dead_letter: Optional[DeadLetterQueue] = None) -> List[BaseDocument]:
+    """Decodes a batch of Kafka messages and validates them into BaseDocument objects in bulk.
+
+    Values are parsed with orjson straight from the bytes and the whole batch is
+    validated by one `TypeAdapter(list[BaseDocument])` call. A message that cannot
+    be decoded or validated is sent to `dead_letter` with the error and skipped, so
+    one bad message never stops the flow or the partition."""
+
+    payloads = []
+    for message in messages:
+        try:
+            payloads.append((message, orjson.loads(message.value)))
+        except (orjson.JSONDecodeError, TypeError) as e: # undecodable or empty value
+            logger.error("%s while processing message at offset %s: %s", type(e).__name__, message.offset, e,
+                         extra=SAMPLED)
+            if dead_letter is not None:
+                dead_letter.send(DECODE, e, message.value, key=message.key, source=message)
+
+    documents = _validate(payloads, dead_letter) if payloads else []
+
+    last_offsets = {(m.topic, m.partition): m.offset for m in messages}
+    for (topic, partition), offset in last_offsets.items():
+        KafkaLagMonitor.record_offset(topic, partition, offset)
+    CONSUMER_BATCH_SIZE.observe(len(messages))
+    logger.info("Processed %d messages from Kafka into %d documents.", len(messages), len(documents),
+                extra=SAMPLED)
+    return documents
+
+
+def process_messages(messages: KafkaSourceMessage,
+                     dead_letter: Optional[DeadLetterQueue] = None) -> List[BaseDocument]:
+    """Processes one Kafka message, see `process_batch`."""
+
+    return process_batch([messages], dead_letter)
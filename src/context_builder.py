@@ -0,0 +1,146 @@
+from typing import List, Dict, Any, Optional
+import re
+
+import numpy as np
+
+from config.setting import Settings
+
+
+settings = Settings()
+
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_WORD = re.compile(r'\w+')
+
+
+def estimate_tokens(text: str) -> int:
+    '''Cheap token estimate (~4 characters per token for English text).
+
+    Groq does not expose the Llama tokenizer, so the budget is enforced on this
+    approximation rather than on an exact count.'''
+    if not text: return 0
+    return len(text) // 4 + 1
+
+
+def _cosine_matrix(vectors: np.ndarray) -> np.ndarray:
+    '''Pairwise cosine similarity between the rows of `vectors`'''
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    normalized = vectors / norms
+    return normalized @ normalized.T
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = _WORD.findall(text.lower())
+    return {' '.join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def _overlap(a: set, b: set) -> float:
+    '''Share of the smaller shingle set that is also in the other one'''
+    if not a or not b: return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def mmr_select(candidates: List[Dict[str, Any]],
+               k: int,
+               lambda_mult: float = settings.CONTEXT_MMR_LAMBDA,
+               duplicate_threshold: float = settings.CONTEXT_DUPLICATE_THRESHOLD) -> List[Dict[str, Any]]:
+    '''Order candidates by maximal marginal relevance.
+
+    Relevance is the query score Qdrant already returned, redundancy is the cosine
+    similarity between the candidate vectors. Candidates whose similarity to an
+    already selected one exceeds `duplicate_threshold` are dropped.
+
+    Args:
+        candidates (List[dict]): search results carrying a `score` and a `vector`.
+        k (int): maximum number of candidates to return.
+        lambda_mult (float): 1.0 ranks by relevance only, 0.0 by diversity only.
+        duplicate_threshold (float): cosine similarity above which two candidates are duplicates.
+    '''
+    candidates = [doc for doc in candidates if doc.get('vector') is not None]
+    if not candidates or k <= 0:
+        return []
+
+    relevance = np.array([doc['score'] for doc in candidates], dtype=np.float32)
+    similarity = _cosine_matrix(np.array([doc['vector'] for doc in candidates], dtype=np.float32))
+
+    selected: List[int] = []
+    remaining = list(range(len(candidates)))
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        mmr_scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        best = remaining.pop(int(np.argmax(mmr_scores)))
+        if selected and similarity[best, selected].max() >= duplicate_threshold:
+            continue
+        selected.append(best)
+
+    return [candidates[i] for i in selected]
+
+
+def _truncate_to_budget(text: str, budget: int) -> str:
+    '''Cut the text at the last sentence boundary that fits in `budget` tokens, or at
+    the last word boundary when not even the first sentence fits'''
+    if estimate_tokens(text) <= budget:
+        return text
+    kept, used = [], 0
+    for sentence in _SENTENCE_END.split(text):
+        cost = estimate_tokens(sentence)
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    if kept:
+        return ' '.join(kept)
+    cut = text[:max(budget - 1, 0) * 4]  # the most characters estimate_tokens fits in the budget
+    head, space, _ = cut.rpartition(' ')
+    return head if space and head else cut
+
+
+def build_context(candidates: List[Dict[str, Any]],
+                  token_budget: int = settings.CONTEXT_TOKEN_BUDGET,
+                  max_documents: int = settings.CONTEXT_MAX_DOCUMENTS,
+                  min_passage_tokens: int = settings.CONTEXT_MIN_PASSAGE_TOKENS,
+                  overlap_threshold: float = settings.CONTEXT_OVERLAP_THRESHOLD,
+                  lambda_mult: Optional[float] = None) -> List[Dict[str, Any]]:
+    '''Select, de-duplicate and pack retrieved articles into the prompt token budget.
+
+    Candidates are diversified with MMR, then chunks of an article already packed
+    (same url) or whose text mostly overlaps a packed passage are skipped. Passages
+    are truncated at a sentence boundary to fit the remaining budget.
+
+    The packed documents are renumbered 1..n in prompt order so `source_num` in the
+    prompt, the answer citations and `link_citations` all refer to the same article.
+
+    Returns:
+        List[dict]: the packed documents, `content` trimmed and `source_num` reassigned.
+    '''
+    if lambda_mult is None:
+        lambda_mult = settings.CONTEXT_MMR_LAMBDA
+    ranked = mmr_select(candidates, k=len(candidates), lambda_mult=lambda_mult)
+
+    packed: List[Dict[str, Any]] = []
+    packed_shingles: List[set] = []
+    seen_urls = set()
+    remaining = token_budget
+    for doc in ranked:
+        if len(packed) >= max_documents or remaining < min_passage_tokens:
+            break
+        if doc.get('original') in seen_urls:
+            continue
+        shingles = _shingles(doc['content'])
+        if any(_overlap(shingles, other) >= overlap_threshold for other in packed_shingles):
+            continue
+
+        passage = _truncate_to_budget(doc['content'], remaining)
+        if estimate_tokens(passage) < min_passage_tokens:
+            continue
+
+        remaining -= estimate_tokens(passage)
+        seen_urls.add(doc.get('original'))
+        packed_shingles.append(shingles)
+        packed.append({**doc, 'content': passage, 'source_num': len(packed) + 1})
+
+    return packed
@@ -0,0 +1,258 @@
+import atexit
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Optional, List, Dict, Tuple
+
+import fire
+
+from config.setting import Settings
+from utils.logger import setup_logger, SAMPLED
+from utils.metrics import DEAD_LETTERS
+
+
+logger = setup_logger()
+settings = Settings()
+
+
+# stages a message or document can fail at, also the `dlq.stage` header
+DECODE, EMBED, UPSERT = 'decode', 'embed', 'upsert'
+
+
+def create_dead_letter_producer():
+    '''Kafka producer for the dead-letter topic'''
+    from confluent_kafka import Producer
+
+    return Producer({
+        'bootstrap.servers': settings.KAFKA_BOOTSTRAP_SERVERS,
+        'security.protocol': settings.KAFKA_SECURITY_PROTOCOL,
+        'sasl.mechanisms': settings.KAFKA_SASL_MECHANISM,
+        'sasl.username': settings.KAFKA_USERNAME,
+        'sasl.password': settings.KAFKA_PASSWORD,
+    })
+
+
+class DeadLetterQueue:
+    '''
+    Parks messages and documents that failed processing on the dead-letter topic.
+
+    The message value is the failed input as is: the raw Kafka value for decode
+    failures, the ChuckedDocument JSON for embedding failures and the EmbedDocument
+    JSON for upsert failures. The reason travels in `dlq.*` headers (stage, error,
+    error type, time and the source topic/partition/offset), so `replay` can re-drive
+    each stage. Sending never blocks the dataflow; the producer is created on the
+    first failure and flushed at exit. With an empty KAFKA_DEAD_LETTER_TOPIC
+    failures are only logged and counted.
+    '''
+
+    def __init__(self, producer=None, topic: str = settings.KAFKA_DEAD_LETTER_TOPIC):
+        self._producer = producer
+        self._topic = topic
+        self._lock = threading.Lock()
+
+    @property
+    def producer(self):
+        if self._producer is None:
+            with self._lock:
+                if self._producer is None:
+                    self._producer = create_dead_letter_producer()
+                    atexit.register(self.flush)
+        return self._producer
+
+    @staticmethod
+    def headers(stage: str, error, source=None, error_type: Optional[str] = None,
+                attempts: int = 1) -> List[Tuple[str, str]]:
+        headers = [
+            ('dlq.stage', stage),
+            ('dlq.error', str(error)[:1000]),
+            ('dlq.error_type', error_type or type(error).__name__),
+            ('dlq.failed_at', datetime.now(timezone.utc).isoformat(timespec='seconds')),
+            ('dlq.attempts', str(attempts)),
+        ]
+        if source is not None:
+            headers += [('dlq.source_topic', str(source.topic)),
+                        ('dlq.source_partition', str(source.partition)),
+                        ('dlq.source_offset', str(source.offset))]
+        return headers
+
+    @staticmethod
+    def delivery_callback(err, msg):
+        if err:
+            logger.error('Dead letter failed delivery: %s', err)
+
+    def send(self, stage: str, error, value: bytes, key: Optional[bytes] = None, source=None,
+             error_type: Optional[str] = None, attempts: int = 1) -> None:
+        '''
+        Args:
+            stage (str): DECODE, EMBED or UPSERT.
+            error (Exception | str): why processing failed.
+            value (bytes): the failed message or document.
+            key (bytes, optional): message key, the article id for documents.
+            source (KafkaSourceMessage, optional): the consumed message, for its topic/partition/offset.
+            error_type (str, optional): defaults to the type name of `error`.
+            attempts (int): times processing failed, counted up by each replay.
+        '''
+        DEAD_LETTERS.labels(stage).inc()
+        logger.warning("Dead-lettered %s failure: %s", stage, error, extra=SAMPLED)
+        if not self._topic:
+            return
+        headers = self.headers(stage, error, source, error_type, attempts)
+        for attempt in range(2):
+            try:
+                self.producer.produce(self._topic, value=value, key=key, headers=headers,
+                                      on_delivery=self.delivery_callback)
+                break
+            except BufferError:
+                if attempt:
+                    logger.error("Dead-letter queue full, dropped %s failure: %s", stage, error)
+                    return
+                self.producer.poll(1)  # local queue full: serve delivery reports to make room
+        self.producer.poll(0)
+
+    def flush(self, timeout: float = 10) -> None:
+        if self._producer is not None:
+            self._producer.flush(timeout)
+
+
+def _partitions_to_replay(consumer, topic: str) -> Dict[int, Tuple[int, int]]:
+    '''partition -> (committed offset or low watermark, high watermark) at the start of the replay'''
+    from confluent_kafka import TopicPartition
+
+    partitions = consumer.list_topics(topic, timeout=10).topics[topic].partitions
+    committed = consumer.committed([TopicPartition(topic, p) for p in partitions], timeout=10)
+    ranges = {}
+    for tp in committed:
+        low, high = consumer.get_watermark_offsets(tp, timeout=10)
+        start = tp.offset if tp.offset >= 0 else low
+        if start < high:
+            ranges[tp.partition] = (start, high)
+    return ranges
+
+
+def _replay_source(headers: Dict[str, str]):
+    '''the original topic/partition/offset of a dead letter, carried over when it is dead-lettered again'''
+    if 'dlq.source_topic' not in headers:
+        return None
+    return SimpleNamespace(topic=headers['dlq.source_topic'], partition=headers.get('dlq.source_partition'),
+                           offset=headers.get('dlq.source_offset'))
+
+
+def replay(dry_run: bool = False, limit: Optional[int] = None, batch_size: int = 64):
+    '''
+    Re-drive the dead letters parked since the last replay.
+
+    Decode failures are re-published to KAFKA_TOPIC as they are, after the consumer
+    or the data was fixed. Documents that failed embedding are embedded again and,
+    like those that failed the upsert, written to Qdrant directly, since they already
+    passed deduplication. Anything failing again, including letters that no longer
+    parse, is dead-lettered again with its `dlq.attempts` header counted up.
+
+    Only the letters present when the replay starts are read, and offsets are
+    committed for the replay consumer group after each written batch, so a replay
+    never loops over its own failures and can be resumed.
+
+    Args:
+        dry_run (bool): only count the letters per stage and error type, commit nothing.
+        limit (int, optional): stop after this many letters.
+        batch_size (int): documents written to Qdrant per batch.
+    '''
+    from confluent_kafka import Consumer, TopicPartition
+
+    from consumer import kafka_consumer_config
+    from config.pydantic_models import ChuckedDocument, EmbedDocument
+
+    topic = settings.KAFKA_DEAD_LETTER_TOPIC
+    consumer = Consumer({**kafka_consumer_config(), 'group.id': settings.KAFKA_DEAD_LETTER_REPLAY_GROUP,
+                         'enable.auto.commit': False})
+    ranges = _partitions_to_replay(consumer, topic)
+    consumer.assign([TopicPartition(topic, p, start) for p, (start, _) in ranges.items()])
+    remaining = {p: high for p, (_, high) in ranges.items()}
+    logger.info("Replaying %d dead letters from '%s'.",
+                sum(high - start for start, high in ranges.values()), topic)
+
+    counts = Counter()
+    replayed = failed = 0
+    positions: Dict[int, int] = {}
+    dead_letter = producer = embedder = sink = None
+    if not dry_run:
+        from embedding import GoogleTextEmbedder
+        from vector_database import QdrantVectorOutput
+
+        producer = create_dead_letter_producer()
+        dead_letter = DeadLetterQueue(producer)
+        embedder = GoogleTextEmbedder()
+        sink = QdrantVectorOutput(dead_letter=dead_letter).build('replay', 0, 1)
+    pending: List[EmbedDocument] = []
+
+    def write_pending() -> None:
+        sink.write_batch(pending)
+        pending.clear()
+        producer.flush()
+        if positions:
+            consumer.commit(offsets=[TopicPartition(topic, p, offset) for p, offset in positions.items()],
+                            asynchronous=False)
+
+    try:
+        while remaining and (limit is None or replayed < limit):
+            msg = consumer.poll(1.0)
+            if msg is None:
+                continue
+            if msg.error():
+                logger.error("Error reading dead letters: %s", msg.error())
+                continue
+            partition = msg.partition()
+            if partition not in remaining:
+                continue  # dead-lettered during this replay
+            if msg.offset() >= remaining[partition] - 1:
+                del remaining[partition]
+                consumer.pause([TopicPartition(topic, partition)])
+
+            headers = {k: v.decode('utf-8', 'replace') for k, v in (msg.headers() or [])}
+            stage = headers.get('dlq.stage')
+            attempts = int(headers.get('dlq.attempts') or 1) + 1
+            counts[(stage, headers.get('dlq.error_type'))] += 1
+            replayed += 1
+            if dry_run:
+                continue
+            positions[partition] = msg.offset() + 1
+
+            try:
+                if stage == DECODE:
+                    producer.produce(settings.KAFKA_TOPIC, value=msg.value(), key=msg.key())
+                    producer.poll(0)
+                elif stage == EMBED:
+                    chunked = ChuckedDocument.model_validate_json(msg.value())
+                    try:
+                        pending.append(EmbedDocument.from_chunked(chunked, embedder))
+                    except Exception as e:
+                        failed += 1
+                        dead_letter.send(EMBED, e, msg.value(), key=msg.key(),
+                                         source=_replay_source(headers), attempts=attempts)
+                elif stage == UPSERT:
+                    pending.append(EmbedDocument.model_validate_json(msg.value()))
+                else:
+                    logger.error("Skipping dead letter with unknown stage %r at offset %s", stage, msg.offset())
+            except Exception as e:
+                # parked again before its offset is committed, so a bad letter is never lost
+                logger.error("Cannot replay %s dead letter at offset %s: %s", stage, msg.offset(), e)
+                failed += 1
+                dead_letter.send(stage, e, msg.value(), key=msg.key(),
+                                 source=_replay_source(headers), attempts=attempts)
+
+            if len(pending) >= batch_size:
+                write_pending()
+        if not dry_run:
+            write_pending()
+    finally:
+        consumer.close()
+
+    for (stage, error_type), count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f'{count:>8}  {str(stage):<8} {error_type}')
+    print(f'{replayed} dead letters {"found" if dry_run else "replayed"}.')
+    if failed:
+        print(f'{failed} failed again and were dead-lettered again.')
+
+
+if __name__ == '__main__':
+    fire.Fire(replay)
@@ -8,6 +8,7 @@ import numpy as np
 
 from config.setting import Settings
 from utils.logger import setup_logger
+from utils.metrics import EMBEDDING_SECONDS, EMBEDDING_ERRORS
 
 
 logger = setup_logger()
@@ -25,16 +26,34 @@ class GoogleTextEmbedder():
 
     def __call__(self,text:str ,task_type:str='RETRIEVAL_DOCUMENT') -> list[float] :
         """"Generates an embedding for the given text using Google's embedding model"""
-        logger.info('Generating embedding for text using Google Generative AI')
+        logger.debug('Generating embedding for text using Google Generative AI')
         try:
-            response = genai.embed_content(
-                model = self._model_id,
-                content = [text],
-                task_type=task_type
-            )
+            with EMBEDDING_SECONDS.labels(self._model_id).time():
+                response = genai.embed_content(
+                    model = self._model_id,
+                    content = [text],
+                    task_type=task_type
+                )
             return response['embedding'][0]
         
         except Exception as e :
+            EMBEDDING_ERRORS.labels(self._model_id).inc()
+            logger.info(f'Error generating embeddings : {e}')
+            return None
+
+    def embed_batch(self, texts: List[str], task_type: str = 'RETRIEVAL_DOCUMENT') -> Optional[List[list[float]]]:
+        """Embeds several texts in one request, None on failure"""
+        try:
+            with EMBEDDING_SECONDS.labels(self._model_id).time():
+                response = genai.embed_content(
+                    model = self._model_id,
+                    content = list(texts),
+                    task_type=task_type
+                )
+            return response['embedding']
+
+        except Exception as e :
+            EMBEDDING_ERRORS.labels(self._model_id).inc()
             logger.info(f'Error generating embeddings : {e}')
             return None
 
@@ -0,0 +1,152 @@
+import os
+from typing import Optional, List, Dict, Tuple
+
+from pydantic import BaseModel
+
+from config.setting import Settings
+from config.pydantic_models import parse_published
+from utils.logger import setup_logger, SAMPLED
+
+
+settings = Settings()
+logger = setup_logger()
+
+
+def entry_timestamp(entry: dict) -> Optional[int]:
+    '''Epoch seconds of a raw feed entry's `published`, None when it cannot be parsed'''
+    try:
+        return int(parse_published(entry['published']).timestamp())
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return None
+
+
+class FeedCursor(BaseModel):
+    '''High-water mark of one source: the newest `published` delivered to Kafka and
+    the ids of the entries delivered at exactly that time, with the runs that already
+    tried the entries still pending after it. Entries without a parsable date cannot
+    be placed against the mark, their ids are remembered instead, the latest
+    `PRODUCER_CURSOR_UNDATED_IDS` of them.'''
+
+    source : str
+    published_ts : Optional[int] = None
+    ids : List[str] = []
+    attempts : Dict[str, int] = {}
+    undated : List[str] = []
+
+    @staticmethod
+    def path(source: str, directory: str) -> str:
+        return os.path.join(directory, f'{source}.json')
+
+    @classmethod
+    def load(cls, source: str, directory: str = settings.PRODUCER_CURSOR_DIR) -> 'FeedCursor':
+        try:
+            with open(cls.path(source, directory)) as f:
+                return cls.model_validate_json(f.read())
+        except FileNotFoundError:
+            return cls(source=source)
+
+    def save(self, directory: str = settings.PRODUCER_CURSOR_DIR) -> None:
+        os.makedirs(directory, exist_ok=True)
+        path = self.path(self.source, directory)
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.model_dump_json())
+        os.replace(path + '.tmp', path)  # a crash never leaves a truncated cursor
+
+    def is_new(self, entry: dict) -> bool:
+        '''Published after the cursor, or at it but not delivered yet.
+        Entries without a parsable date are new until they are done.'''
+        ts = entry_timestamp(entry)
+        if ts is None:
+            return entry['id'] not in self.undated
+        if self.published_ts is None:
+            return True
+        return ts > self.published_ts or (ts == self.published_ts and entry['id'] not in self.ids)
+
+    def advance(self, published_ts: int, entry_id: str) -> None:
+        if self.published_ts is None or published_ts > self.published_ts:
+            self.published_ts, self.ids = published_ts, [entry_id]
+        elif published_ts == self.published_ts and entry_id not in self.ids:
+            self.ids.append(entry_id)
+
+    def remember(self, entry_id: str, limit: int = settings.PRODUCER_CURSOR_UNDATED_IDS) -> None:
+        '''Done with an entry without a date: skip it from now on'''
+        if entry_id not in self.undated:
+            self.undated = [*self.undated, entry_id][-limit:]
+
+
+class FeedCursors:
+    '''
+    Per-source cursors of the producer, so each run only fetches the pages of the
+    entries published since the previous one.
+
+    The entries a run selects are tracked oldest first and a cursor only moves over
+    the ones that are done, stopping at the first that is not: an entry whose
+    delivery failed, or whose page could not be fetched, is selected again by the
+    next run, even when newer ones made it. An entry is done when its Kafka
+    delivery callback reported success, when it `failed` for good (a page that
+    cannot be parsed, a document that does not validate), or after `max_attempts`
+    runs, so one bad entry cannot hold the cursor back and have every newer
+    article fetched and produced again by each run.
+
+    Attributes:
+        directory (str): where the cursors are saved, one JSON file per source.
+        max_attempts (int): runs that select an entry before it is given up.
+    '''
+
+    def __init__(self, directory: str = settings.PRODUCER_CURSOR_DIR,
+                 max_attempts: int = settings.PRODUCER_CURSOR_MAX_ATTEMPTS):
+        self.directory = directory
+        self.max_attempts = max_attempts
+        self._cursors: Dict[str, FeedCursor] = {}
+        # source -> [(published_ts, id)] of the entries selected this run, oldest first
+        self._selected: Dict[str, List[Tuple[int, str]]] = {}
+        self._undated: Dict[str, List[str]] = {}  # source -> ids of the selected entries without a date
+        self._done: Dict[str, set] = {}
+
+    def cursor(self, source: str) -> FeedCursor:
+        if source not in self._cursors:
+            self._cursors[source] = FeedCursor.load(source, self.directory)
+        return self._cursors[source]
+
+    def new_entries(self, source: str, entries: List[dict]) -> List[dict]:
+        '''The entries the cursor has not passed yet, and start tracking them'''
+        cursor = self.cursor(source)
+        selected = [entry for entry in entries if cursor.is_new(entry)]
+        self._selected[source] = sorted((ts, entry['id']) for entry in selected
+                                        if (ts := entry_timestamp(entry)) is not None)
+        self._undated[source] = [entry['id'] for entry in selected if entry_timestamp(entry) is None]
+        self._done[source] = set()
+        given_up = {entry['id'] for entry in selected if cursor.attempts.get(entry['id'], 0) >= self.max_attempts}
+        for entry in selected:
+            if entry['id'] in given_up:
+                logger.warning('Giving up %s article %s after %d runs.', source, entry.get('link'),
+                               cursor.attempts[entry['id']], extra=SAMPLED)
+                self._mark_done(source, entry)
+        return [entry for entry in selected if entry['id'] not in given_up]
+
+    def delivered(self, source: str, entry: dict) -> None:
+        '''Delivery callback of an entry: move the cursor over the done entries'''
+        self._mark_done(source, entry)
+
+    def failed(self, source: str, entry: dict) -> None:
+        '''The entry cannot be fetched or validated, whatever the run: never select it again'''
+        self._mark_done(source, entry)
+
+    def _mark_done(self, source: str, entry: dict) -> None:
+        self._done.setdefault(source, set()).add(entry['id'])
+        cursor = self.cursor(source)
+        if entry['id'] in self._undated.get(source, []):
+            cursor.remember(entry['id'])
+        pending = self._selected.get(source, [])
+        while pending and pending[0][1] in self._done[source]:
+            cursor.advance(*pending.pop(0))
+
+    def save(self) -> None:
+        '''Count one more attempt for the entries still pending, and save the cursors'''
+        for source, cursor in self._cursors.items():
+            if source in self._selected:
+                done = self._done.get(source, set())
+                pending = [entry_id for _, entry_id in self._selected[source]] + self._undated[source]
+                cursor.attempts = {entry_id: cursor.attempts.get(entry_id, 0) + 1
+                                   for entry_id in pending if entry_id not in done}
+            cursor.save(self.directory)
@@ -1,19 +1,19 @@
 import datetime
 import os
 import functools
-from typing import Callable, List, Any
+from typing import Callable, List, Any, NamedTuple, Optional
 
 
 from pydantic import ValidationError
 from config.setting import Settings
 from utils.logger import setup_logger
 from config.pydantic_models import *
-from scraper.techcrunch import fetch_techcrunch_articles
+from scraper.techcrunch import fetch_techcrunch_articles, parse_techcrunch_feed, fetch_techcrunch_page
 from scraper.theverge import fetch_theverge_articles
 from scraper.channelstv import fetch_channel_articles
 from scraper.arise import fetch_arise_articles
 from scraper.arts_tech import fetch_art_tech_articles
-from scraper.cbssport import fetch_cbs_articles
+from scraper.cbssport import fetch_cbs_articles, parse_cbs_feed, fetch_cbs_page
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -40,7 +40,7 @@ def handle_article_fetcing(func: Callable) -> Callable:
             logger.error(f'Validation error while processing articles: {e}')
         except Exception as e:
             logger.error(f"Error fetching articles: {e}")
-            logger.exception(e,"Exception occurred", exc_info=True)
+            logger.exception("Exception occurred")
         return []
     
     return wrapper
@@ -55,6 +55,36 @@ def time_window(hours: int) -> str:
     return now.datetime.strfttime("%Y-%m-%dT%H:%M:%S"), end_datetime.strftime("%Y-%m-%dT%H:%M:%S")
 
 
+class NewsSource(NamedTuple):
+    '''
+    A news feed split into tasks: parsing the feed, then completing and validating
+    each entry on its own, so the pages of every source can be fetched concurrently.
+
+    Attributes:
+        name (str): source name, as in the documents' `source_name`.
+        url (str): feed url.
+        parse_feed (Callable): feed url -> raw article dicts.
+        model (type): pydantic model of the raw articles, with `to_base()`.
+        fetch_page (Callable, optional): raw article -> raw article with the content
+            of its page, for the feeds that do not carry it.
+    '''
+    name: str
+    url: str
+    parse_feed: Callable[[str], List[Dict]]
+    model: type
+    fetch_page: Optional[Callable[[Dict], Dict]] = None
+
+    def entries(self) -> List[Dict]:
+        '''The raw articles of the feed, without their pages'''
+        return self.parse_feed(self.url)
+
+    def document(self, entry: Dict) -> BaseDocument:
+        '''Fetch the page of one entry if needed and validate it'''
+        if self.fetch_page is not None:
+            entry = self.fetch_page(entry, timeout=settings.SCRAPER_REQUEST_TIMEOUT)
+        return self.model(**entry).to_base()
+
+
 class NewsFetcher:
 
     '''
@@ -108,3 +138,14 @@ class NewsFetcher:
                 self.fetch_from_channelstv,self.fetch_from_arise,
                 self.fetch_from_art,self.fetch_from_cbs]
 
+    @property
+    def feeds(self) -> List[NewsSource]:
+        '''The same sources, as feed and per-article tasks for the producer swarm'''
+        return [
+                NewsSource('techcrunch', settings.TECHCRUNCH_URL, parse_techcrunch_feed, TechCrunchModel,
+                           fetch_techcrunch_page),
+                NewsSource('Theverge', settings.THEVERGE_URL, fetch_theverge_articles, TheVergeModel),
+                NewsSource('channelstv', settings.CHANNELSTV_URL, fetch_channel_articles, ChannelstvModel),
+                NewsSource('arise', settings.ARISE_URL, fetch_arise_articles, AriseModel),
+                NewsSource('art_tech', settings.ARTS_URL, fetch_art_tech_articles, ArtsModel),
+                NewsSource('cbssports', settings.CBS_URL, parse_cbs_feed, CbsModel, fetch_cbs_page)]
@@ -1,37 +1,42 @@
-from typing import Optional,Set,Dict
+from typing import Optional,Set,Dict,Tuple
 from datetime import datetime,timedelta,timezone
 from pathlib import Path
 from bytewax.dataflow import Dataflow
 import bytewax.operators as op
-from bytewax.outputs import DynamicSink
-from bytewax.connectors.kafka import KafkaSource
+from bytewax.outputs import DynamicSink, Sink
+from bytewax.inputs import Source
 
-from consumer import process_messages, build_kafka_source
+from consumer import process_batch, build_kafka_source
+from dead_letter import DeadLetterQueue, EMBED
 from embedding import GoogleTextEmbedder
 from config.pydantic_models import ChuckedDocument, EmbedDocument, RefinedDocument
-from utils.logger import setup_logger
-from vector_database import QdrantVectorOutput
+from utils.logger import setup_logger, SAMPLED
+from utils.metrics import instrument, DEDUP_CHECKS
+from vector_database import QdrantVectorOutput, target_index_spec
+from config.setting import Settings
 
 
 
 logger = setup_logger()
+settings = Settings()
 
 
 class deduplicates_check:
-    """A class to handle deduplication of news articles based on their IDs.
-    It maintains a dict of seen IDs and last seen time and checks if a new article's ID has been seen before.
-    If not, it adds the ID to the dict and marks the article as new.
+    """A class to handle deduplication of news articles based on their IDs and content.
+    It maintains a dict of seen IDs with their content hash and last seen time, and
+    checks if a new article's ID has been seen before with the same content.
+    New and edited articles are marked as new, so edits get re-indexed.
     """
 
-    _state : Dict[str,datetime] = dict()
+    _state : Dict[str,Tuple[str,datetime]] = dict()
 
     @classmethod
     def  updates_articles_seen_state(cls,state, news_item) : 
 
-        """Checks if a new_items's ID has been seen before.
-        Updates the seen_ids list  and adds and 'is_new' flag to the news_item refined_document.
+        """Checks if a new_items's ID has been seen before with the same content.
+        Updates the seen state and adds and 'is_new' flag to the news_item refined_document.
         Args:
-            state (dict[str,datetime]): dict of IDs that have been seen.
+            state (dict[str,tuple[str,datetime]]): dict of IDs that have been seen, with their content hash and last seen time.
             news_item (RefinedDocument): The news item to check and update.
             """
         
@@ -42,27 +47,30 @@ class deduplicates_check:
         if state is None:
             state = cls._state
         
-        # Check if the news_item's doc_id is in the seen_ids list
-        is_new = False
-        if doc_id not in state:
-            is_new = True
-           # news_item_copied = news_item.model_copy(update = {'is_new': True}) 
-            #seen_ids.add(news_item.doc_id)
-            logger.info(f"New article detected: {doc_id}")
+        # Check if the news_item's doc_id is in the seen state, and with which content
+        is_new = True
+        seen = state.get(doc_id)
+        if seen is None:
+            DEDUP_CHECKS.labels('new').inc()
+            logger.info("New article detected: %s", doc_id, extra=SAMPLED)
+        elif seen[0] != news_item.content_hash:
+            DEDUP_CHECKS.labels('changed').inc()
+            logger.info("Edited article detected: %s", doc_id, extra=SAMPLED)
         else:
-            #news_item_copied = news_item.model_copy(update = {'is_new': False}) # Update the is_new flag to False, basemodel are immutable
-            logger.info(f"Article already seen: {doc_id}")
+            is_new = False
+            DEDUP_CHECKS.labels('seen').inc()
+            logger.info("Article already seen: %s", doc_id, extra=SAMPLED)
 
-        state[doc_id] = current_time
+        state[doc_id] = (news_item.content_hash, current_time)
 
         ids_to_remove = []
-        for exisiting_doc_id,last_seen_time in state.items():
+        for exisiting_doc_id,(_, last_seen_time) in state.items():
             if current_time - last_seen_time >  expiry_duration:
                 ids_to_remove.append(exisiting_doc_id)
 
         for remove_id in ids_to_remove:
             del state[remove_id]
-            logger.info(f"Removed expired ID: {remove_id}. Current state size: {len(state)}")
+            logger.debug("Removed expired ID: %s. Current state size: %d", remove_id, len(state))
         
         updated_news_item = news_item.model_copy(update={'is_new': is_new})
         return state, updated_news_item
@@ -75,39 +83,87 @@ class deduplicates_check:
 
 
 
-def build(model_cache_dir: Optional[Path] = None
+def build(model_cache_dir: Optional[Path] = None,
+          source: Optional[Source] = None,
+          sink: Optional[Sink] = None,
+          embedding_model: Optional[GoogleTextEmbedder] = None,
+          dead_letter: Optional[DeadLetterQueue] = None,
+          target_sink: Optional[Sink] = None,
+          target_embedding_model: Optional[GoogleTextEmbedder] = None
           ) -> Dataflow:
     
     """
     Build the ByteWax dataflow for the Qdrant db.
     Follows this dataflow:
-        * 1. Tag: ['kafka_input']   = The input data is read from a KafkaSource
-        * 2. Tag: ['map_kinp']      = Process message from KafkaSource to CommonDocument
+        * 1. Tag: ['kafka_input']   = Message batches are read from a KafkaBatchSource
+        * 2. Tag: ['map_kinp']      = Decode and validate each batch into BaseDocuments
         * 3. Tag: ['refine']        = Convert the message to a refined document format
         * 4. Tag: ['key_on']        = Add key(news id) to the refined document (id, refine)
-        * 5. Tag: ['Deduplicate']   = Check if new article been seen before
+        * 5. Tag: ['Deduplicate']   = Check if new article been seen before, with the same content
         * 6. Tag: ['drop_key']      = Drop key
-        * 7. Tag: ['filter_new_only'] = Filter out seen articles
-        * 8. Tag: ['chunkenize']    = Split the refined document into smaller chunks
+        * 7. Tag: ['filter_new_only'] = Filter out seen articles, keeping new and edited ones
+        * 8. Tag: ['chunkenize']    = Split the refined document into smaller chunks, keep the ones not indexed yet
         * 9. Tag: ['embed']         = Generate embeddings for the chunks
         * 10. Tag: ['output']        = Write the embeddings to the Upstash vector database
+
+    Every step is wrapped with `utils.metrics.instrument` (items in/out, latency);
+    the `dbg_*` inspect steps only run with FLOW_DEBUG.
+
+    An edited article (same id, new content hash) passes deduplication again. Its
+    chunks are compared with the ones already in the collection (`ChunkIndex`):
+    only the new chunks are embedded and upserted, the unchanged ones get the new
+    metadata, and the chunks of the previous version that are gone are deleted.
+    Other sinks get every chunk.
+
+    Messages that cannot be decoded or validated, chunks that fail embedding and
+    documents that fail the upsert go to `dead_letter` with the error instead of
+    stopping the flow; `python dead_letter.py` replays them.
+
+    While a migration is configured (REINDEX_* settings), the new articles are also
+    chunked and embedded for the target index and written to its versioned collection
+    (`chunkenize_reindex` -> `embed_reindex` -> `output_reindex`), so the backfill
+    in `reindex.py` never misses live articles. Failures there are only logged; the
+    backfill's catch-up pass re-indexes what is missing.
+
+    `source` must emit lists of Kafka messages; `topic_log.ReplaySource` replays a
+    topic recorded by `topic_log.py record` or `producer.py --record` instead.
+    `source`, `sink`, `embedding_model` and `dead_letter` default to Kafka, Qdrant,
+    the Google embedder and the dead-letter topic, `target_sink` and
+    `target_embedding_model` to the migration's collection and model; the offline
+    benchmarks pass local stand-ins instead.
     """
     
     #model = TextEmbedder(cache_dir=model_cache_dir)
-    model = GoogleTextEmbedder()
+    model = embedding_model or GoogleTextEmbedder()
+    dead_letter = dead_letter or DeadLetterQueue()
+    output = sink or _build_output(dead_letter)
+    chunk_index = output.chunk_index() if isinstance(output, QdrantVectorOutput) else None
+
+    def chunkenize(refined_doc: RefinedDocument) -> list[ChuckedDocument]:
+        chunks = ChuckedDocument.from_refined(refined_doc, model)
+        return chunk_index.changed_chunks(refined_doc.doc_id, chunks) if chunk_index else chunks
+
+    def embed(chunked_doc: ChuckedDocument) -> list[EmbedDocument]:
+        try:
+            return [EmbedDocument.from_chunked(chunked_doc, model)]
+        except Exception as e:
+            dead_letter.send(EMBED, e, chunked_doc.model_dump_json().encode('utf-8'),
+                             key=chunked_doc.doc_id.encode('utf-8'))
+            return []
 
     dataflow  = Dataflow(flow_id="news-to-qdrant")
     stream = op.input(
         step_id="kafka_input",
         flow=dataflow,
-        source= _build_input()
+        source= source or _build_input()
     )
 
-    stream = op.flat_map('map_kinp' , stream, process_messages)
+    stream = op.flat_map('map_kinp' , stream,
+                         instrument('map_kinp', lambda messages: process_batch(messages, dead_letter), flat=True))
     #_ = op.inspect("dbg_map_kinp", stream)
 
 
-    stream = op.map('refine', stream, RefinedDocument.from_base)
+    stream = op.map('refine', stream, instrument('refine', RefinedDocument.from_base))
     #_ = op.inspect("dbg_refine", stream)
 
     stream = op.key_on(
@@ -119,7 +175,7 @@ def build(model_cache_dir: Optional[Path] = None
     
     stream = op.stateful_map('deduplicates',
                               stream, # empty initail list  to store seen ids\
-                            deduplicates_check.updates_articles_seen_state)
+                            instrument('deduplicates', deduplicates_check.updates_articles_seen_state))
     #_ = op.inspect("dbg_deduplicates", stream)
 
     
@@ -129,32 +185,33 @@ def build(model_cache_dir: Optional[Path] = None
             stream,
             lambda key_doc: key_doc[1]  # extract the document
         )
-    _ = op.inspect("dbg_dop_key", stream)
+    if settings.FLOW_DEBUG:
+        _ = op.inspect("dbg_dop_key", stream)
 
     # 2. Keep only the new ones
     stream = op.filter(                              
         step_id="/filter_new_only",
         up=stream,
-        predicate=lambda item: getattr(item, "is_new", False)
+        predicate=instrument('filter_new_only', lambda item: getattr(item, "is_new", False), predicate=True)
         )
     #_ = op.inspect("dbg_filter", stream)
 
-
+    target = target_index_spec()
+    if target is not None:
+        _build_reindex_branch(stream, target, target_sink, target_embedding_model)
     
     stream = op.flat_map('chunkenize',
                          stream,
-                         lambda refined_doc : ChuckedDocument.from_refined(refined_doc, model))
-    _ = op.inspect("dbg_chunk", stream)
+                         instrument('chunkenize', chunkenize, flat=True))
+    if settings.FLOW_DEBUG:
+        _ = op.inspect("dbg_chunk", stream)
     
     
-    stream = op.map(
-        'embed',
-        stream,
-        lambda chunked_doc: EmbedDocument.from_chunked(chunked_doc, model)
-    )
+    stream = op.flat_map('embed', stream, instrument('embed', embed, flat=True))
     
-    _ = op.inspect("dbg_embed", stream)
-    stream = op.output("output", stream, _build_output())
+    if settings.FLOW_DEBUG:
+        _ = op.inspect("dbg_embed", stream)
+    stream = op.output("output", stream, output)
     logger.info("Successfully created bytewax dataflow.")
     logger.info(
         "\tStages: Kafka Input -> Map -> Refine -> Key-on -> Deduplicate -> Drop-key -> Chunkenize -> Embed -> Upsert"
@@ -162,10 +219,36 @@ def build(model_cache_dir: Optional[Path] = None
     return dataflow
 
 
-def _build_input() -> KafkaSource:
+def _build_reindex_branch(stream, target, sink: Optional[Sink], embedding_model) -> None:
+    """Dual-write the new articles to the collection of the index being migrated to."""
+
+    model = embedding_model or GoogleTextEmbedder(model_id=target.embedding_model)
+    output = sink or QdrantVectorOutput(spec=target)
+    chunk_index = output.chunk_index() if isinstance(output, QdrantVectorOutput) else None
+
+    def chunkenize(refined_doc: RefinedDocument) -> list[ChuckedDocument]:
+        chunks = ChuckedDocument.from_refined(refined_doc, model, target.chunk_size, target.chunk_overlap)
+        return chunk_index.changed_chunks(refined_doc.doc_id, chunks) if chunk_index else chunks
+
+    def embed(chunked_doc: ChuckedDocument) -> list[EmbedDocument]:
+        try:
+            return [EmbedDocument.from_chunked(chunked_doc, model)]
+        except Exception as e:
+            logger.error("Dual-write embedding failed for %s: %s", chunked_doc.doc_id, e, extra=SAMPLED)
+            return []
+
+    stream = op.flat_map('chunkenize_reindex',
+                         stream,
+                         instrument('chunkenize_reindex', chunkenize, flat=True))
+    stream = op.flat_map('embed_reindex', stream, instrument('embed_reindex', embed, flat=True))
+    op.output("output_reindex", stream, output)
+    logger.info("Dual-writing new articles to the %s index.", target.embedding_model)
+
+
+def _build_input() -> Source:
     return build_kafka_source()
 
-def _build_output() -> DynamicSink:
-    return QdrantVectorOutput()
+def _build_output(dead_letter: Optional[DeadLetterQueue] = None) -> DynamicSink:
+    return QdrantVectorOutput(dead_letter=dead_letter)
 
     
\ No newline at end of file
@@ -2,11 +2,14 @@ import threading
 import json
 import time
 import fire
-from typing import Callable,List,NoReturn
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from typing import List, Dict, Tuple, Optional, Deque
 from confluent_kafka import Producer
-from utils.logger import setup_logger
-from fetch_news import NewsFetcher
-from config.pydantic_models import BaseDocument
+from utils.logger import setup_logger, SAMPLED
+from fetch_news import NewsFetcher, NewsSource
+from feed_cursor import FeedCursors
+from utils.page_cache import PageCacheMiss
 from config.setting import Settings
 from dotenv import load_dotenv
 load_dotenv()
@@ -17,112 +20,173 @@ settings = Settings()
 
 logger = setup_logger()
 
-class KafkaProducerThread(threading.Thread):
+# article errors a later run may not hit (network, offline cache miss): the cursor waits for these entries
+TRANSIENT_ERRORS = (OSError, PageCacheMiss)  # requests' errors are OSErrors
+
+class KafkaProducerSwarm:
     '''
-    A thread to produce messages tp Kafka topic.
+    Fetches the news sources on one bounded pool of threads and produces every
+    article to a Kafka topic as soon as it is parsed.
+
+    Each feed is one task and each of its articles another, so the pages of all
+    sources are fetched concurrently and a run takes about as long as the slowest
+    single page rather than the slowest source's pages one after another.
+    Articles are fetched, validated and serialized on the workers and produced
+    from the calling thread.
 
     Attributes:
-        producer_id (int): Identifier for the producer instance.
+        producer (Producer): Kafka producer instance, shared by every source.
         topic (str): The Kafka topic to which messages will be produced.
-        fetch_function (Callable): Function to fetch data to be sent to Kafka.
-        producer (KafkaProducer): Kafka producer instance.
-        running (bool): Control flag for the running state of the thread.
+        sources (List[NewsSource]): feeds and how to complete their articles.
+        max_workers (int): fetches running at once, across all sources.
+        max_in_flight (int): articles being fetched or waiting to be produced at
+            once, which bounds memory when Kafka is slower than the sites.
+        deadline (float): seconds after which pending fetches are abandoned; each
+            request times out after SCRAPER_REQUEST_TIMEOUT, so their threads end soon after.
+        cursors (FeedCursors, optional): only the entries published since the last
+            delivered one are fetched, and the cursors advance on delivery, or past
+            the articles failing with other than `TRANSIENT_ERRORS`. None fetches
+            every entry of the feeds.
+        recorder (TopicRecorder, optional): also writes every produced message to
+            a local log, replayable into the flow with `topic_log.py replay`.
+        sent (Counter): messages produced per source during the last run.
+        queue_full_waits (int): times the last run waited for the local producer
+            queue to drain (`BufferError`).
     '''
 
-    def __init__(self, 
-                 producer_id: int, 
-                 producer: Producer,
-                 topic:str, 
-                 fetch_function: Callable
-                 ) -> None:
-        super().__init__(daemon=True) # lets threading setup before the main thread
-        self.producer_id = f'KafkaProducerThread # {producer_id}'
-        self.producer = producer # use the shared producer instance
+    def __init__(self,
+                 producer : Producer,
+                 topic:str,
+                 sources: List[NewsSource],
+                 max_workers: int = settings.PRODUCER_MAX_WORKERS,
+                 max_in_flight: int = settings.PRODUCER_MAX_IN_FLIGHT,
+                 deadline: float = settings.PRODUCER_RUN_DEADLINE,
+                 cursors: Optional[FeedCursors] = None,
+                 recorder=None):
+        self.producer = producer
         self.topic = topic
-        self.fetch_function = fetch_function
-        self.running = threading.Event()
-        self.running.set()
+        self.sources = sources
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self.deadline = deadline
+        self.cursors = cursors
+        self.recorder = recorder
+        self.sent = Counter()
+        self.queue_full_waits = 0
+        self._stopped = threading.Event()
 
     # failed delivery (after retries).
     @staticmethod
     def delivery_callback(err, msg):
         if err:
-            logger.info(f'ERROR: Message failed delivery: {err}')
+            logger.error('Message failed delivery: %s', err)
         else:
-            key = msg.key().decode('utf-8') if msg.key() else 'No Key'
-            value = msg.value().decode('utf-8') if msg.value() else 'No Value'
-            logger.info(f"Produced event to topic {msg.topic()}: key = {key:12} value = {value:12}")
-
-    def run(self) -> NoReturn:
-        '''Continuously fetch data and produce messages to Kafka topic.'''
-        logger.info(f'{self.producer_id} started.')
-        
-        try:
-            messages: List[BaseDocument] = self.fetch_function()
-            logger.info(f'{self.producer_id} fetched {len(messages)} messages.')
-            if messages:
-                messages_payload = [msg.to_kafka_payload() for msg in messages]
-                for message in messages_payload:
-                    message = json.dumps(message).encode('utf-8')
-                    self.producer.produce(self.topic,value=message,callback=self.delivery_callback)
-                    
-                self.producer.poll(0)
-                self.producer.flush()
-                
-            logger.info(
-                f'producer : {self.producer_id} sent : {len(messages)} msgs.'
-            )
-            #logger.info(f'{self.producer_id} sleeping for {self.wait_window_sec / 60} minutes.')
-        
-            #time.sleep(self.wait_window_sec) # wait for the next fetch
-            
-        except Exception as e:
-            logger.error(f'Error in producer worker {self.producer_id}: {e}')
-            self.running.clear() # stop the thread error
-
-    def stop(self) -> None:
-        '''Signals the thread to stop running and cloases the kafka Producer'''
-
-        self.running.clear()
-        #self.producer.close()
-        self.join()
-
+            logger.info("Produced event to topic %s [%s] @ %s", msg.topic(), msg.partition(), msg.offset(),
+                        extra=SAMPLED)
 
-class KafkaProducerSwarm:
-    '''Manages the swarm of KafkaProducerThread instances for concurrent data 
-    fetching and kafka message production.'''
+    @staticmethod
+    def _serialize(source: NewsSource, entry: dict) -> bytes:
+        '''Fetch, validate and serialize one article, on a worker thread'''
+        return json.dumps(source.document(entry).to_kafka_payload()).encode('utf-8')
+
+    def _produce(self, message: bytes, callback, end: float) -> bool:
+        '''Produce one message, waiting for the local queue to drain while it is full.
+        False when it is still full at the deadline or on `stop()`.'''
+        while True:
+            try:
+                self.producer.produce(self.topic, value=message, callback=callback)
+                return True
+            except BufferError:
+                if self._stopped.is_set() or time.monotonic() >= end:
+                    return False
+                self.queue_full_waits += 1
+                logger.warning('Producer queue full, waiting for deliveries.', extra=SAMPLED)
+                self.producer.poll(0.5)  # serves delivery reports, which frees queue space
+
+    def _publish(self, source: NewsSource, entry: dict, message: bytes, end: float) -> None:
+        callback = self.delivery_callback
+        if self.cursors is not None:
+            def callback(err, msg):
+                self.delivery_callback(err, msg)
+                if not err:
+                    self.cursors.delivered(source.name, entry)
+        if not self._produce(message, callback, end):
+            logger.error('Producer queue still full, dropped %s article %s.', source.name, entry.get('link'),
+                         extra=SAMPLED)
+            return
+        if self.recorder is not None:
+            self.recorder.write(message, topic=self.topic)
+        self.producer.poll(0)  # serve delivery reports of the earlier messages
+        self.sent[source.name] += 1
+
+    def run(self) -> int:
+        '''Fetch and produce every article until all are sent, the deadline passes or
+        `stop()` is called. Returns the number of messages produced.'''
+        self._stopped.clear()
+        self.sent.clear()
+        self.queue_full_waits = 0
+        end = time.monotonic() + self.deadline
+        executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='news-fetch')
+        # future -> (source, None) for a feed, (source, entry) for an article
+        pending: Dict[Future, Tuple[NewsSource, Optional[dict]]] = {
+            executor.submit(source.entries): (source, None) for source in self.sources
+        }
+        backlog: Deque[Tuple[NewsSource, dict]] = deque()  # articles not fetched yet
+        in_flight = 0  # articles fetching, or fetched and not produced yet
 
-    def __init__(self,
-                 producer : Producer,
-                 topic:str,
-                 fetch_function: list[Callable]):
-        self.producer_threads = [
-            KafkaProducerThread(i,producer,topic , fetch_function)
-            for i , fetch_function in enumerate(fetch_function)
-        ] # use same producer instance for all threads for each fetch functions.
-        
-    def start(self) -> None:
-        '''Starts all producer threads.'''
-
-        for thread in self.producer_threads:
-            thread.start()
-           # logger.info(f'{thread.producer_id} started.')
-        logger.info('All producer threads started.')
+        try:
+            while (pending or backlog) and not self._stopped.is_set():
+                # articles are only scheduled while few are in flight: when Kafka is slow,
+                # fetching pauses instead of piling up parsed documents in memory
+                while backlog and in_flight < self.max_in_flight:
+                    source, article = backlog.popleft()
+                    pending[executor.submit(self._serialize, source, article)] = (source, article)
+                    in_flight += 1
+
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    logger.warning('Producer run deadline of %ss passed, %d fetches abandoned.',
+                                   self.deadline, len(pending) + len(backlog))
+                    break
+                done, _ = wait(pending, timeout=min(remaining, 1), return_when=FIRST_COMPLETED)
+                for future in done:
+                    source, entry = pending.pop(future)
+                    if entry is not None:
+                        in_flight -= 1
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if entry is None:
+                            logger.error('Error fetching the %s feed: %s', source.name, e)
+                        else:
+                            logger.error('Error fetching %s article %s: %s', source.name, entry.get('link'), e,
+                                         extra=SAMPLED)
+                            if self.cursors is not None and not isinstance(e, TRANSIENT_ERRORS):
+                                self.cursors.failed(source.name, entry)  # parsing or validation, every run
+                        continue
+                    if entry is None:
+                        articles = result
+                        if self.cursors is not None:
+                            articles = self.cursors.new_entries(source.name, result)
+                        logger.info('%s feed: %d new of %d articles.', source.name, len(articles), len(result))
+                        backlog.extend((source, article) for article in articles)
+                    else:
+                        self._publish(source, entry, result, end)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.producer.flush()  # serves the remaining delivery callbacks
+            if self.cursors is not None:
+                self.cursors.save()
+
+        for source in self.sources:
+            logger.info('producer : %s sent : %d msgs.', source.name, self.sent[source.name])
+        if self.queue_full_waits:
+            logger.warning('Waited %d times for the producer queue to drain.', self.queue_full_waits)
+        return sum(self.sent.values())
 
     def stop(self) -> None:
-        '''Stops all producer threads.'''
-
-        for thread in self.producer_threads:
-            thread.stop()
-            logger.info(f'{thread.producer_id} stopped.')
-        logger.info('All producer threads stopped.')
-    
-    def join_all(self) -> None:
-        '''Waits for all producer threads to complete.'''
-        for thread in self.producer_threads:
-            thread.join()
-            logger.info(f'{thread.producer_id} joined.')
-        logger.info('All producer threads completed their run.')
+        '''Makes a running `run()` abandon its pending fetches and return'''
+        self._stopped.set()
 
 
 
@@ -135,29 +199,43 @@ def create_producer() -> Producer:
     'security.protocol': settings.KAFKA_SECURITY_PROTOCOL,
     'sasl.mechanisms': settings.KAFKA_SASL_MECHANISM,
     'sasl.username': settings.KAFKA_USERNAME,
-    'sasl.password': settings.KAFKA_PASSWORD
+    'sasl.password': settings.KAFKA_PASSWORD,
+    # caps the memory of the local queue, produce() raises BufferError when it is full
+    'queue.buffering.max.messages': settings.KAFKA_PRODUCER_QUEUE_MAX_MESSAGES,
+    'queue.buffering.max.kbytes': settings.KAFKA_PRODUCER_QUEUE_MAX_KBYTES,
         }
     
     return Producer(**conf)
 
-def main():
-    '''main function to run the kafka producer swarm '''
+def main(record: Optional[str] = None):
+    '''main function to run the kafka producer swarm
+
+    Args:
+        record (str, optional): also append the produced messages to this log,
+            see `topic_log.TopicRecorder`.
+    '''
 
     producer = create_producer()
     fetcher = NewsFetcher()
+    recorder = None
+    if record:
+        from topic_log import TopicRecorder
+        recorder = TopicRecorder(record)
 
     multi_producer = KafkaProducerSwarm(
         producer = producer,
         topic=settings.KAFKA_TOPIC,
-        fetch_function= fetcher.sources,
+        sources= fetcher.feeds,
+        cursors= FeedCursors(),
+        recorder= recorder,
     )
 
     try:
-        multi_producer.start()
-        
-        multi_producer.join_all() # ensures all thread complete their ru
+        sent = multi_producer.run()
+        logger.info(f'All sources fetched, {sent} messages sent.')
     finally:
-        multi_producer.stop()
+        if recorder is not None:
+            recorder.close()
         logger.info("Kafka producer process completed.")
 
 if __name__ == "__main__":
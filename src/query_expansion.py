@@ -0,0 +1,68 @@
+from typing import List
+import re
+
+from config.setting import Settings
+from reranker import STOPWORDS
+
+
+settings = Settings()
+
+
+_WORD = re.compile(r"[\w'$]+")
+
+# short forms common in news queries -> the words articles spell out
+ABBREVIATIONS = {
+    'ai': 'artificial intelligence',
+    'ml': 'machine learning',
+    'llm': 'large language model',
+    'llms': 'large language models',
+    'gpu': 'graphics processor',
+    'gpus': 'graphics processors',
+    'ev': 'electric vehicle',
+    'evs': 'electric vehicles',
+    'ipo': 'initial public offering',
+    'vc': 'venture capital',
+    'ceo': 'chief executive',
+    'uk': 'united kingdom',
+    'eu': 'european union',
+    'un': 'united nations',
+    'epl': 'premier league',
+    'ucl': 'champions league',
+    'cbn': 'central bank of nigeria',
+    'inec': 'electoral commission',
+    'fx': 'foreign exchange',
+}
+
+
+def expand_query(query: str, max_variants: int = settings.SEARCH_EXPANSIONS) -> List[str]:
+    '''
+    Rewrite the query locally into up to `max_variants` texts to search for, the
+    query itself first:
+        * the keywords with abbreviations spelled out ('AI chips' -> 'artificial intelligence chips');
+        * a headline-like form, title-cased with abbreviations both spelled out and
+          kept ('AI chips' -> 'Artificial Intelligence (AI) Chips'), closer to how a title reads;
+        * its keywords, without stopwords;
+        * for queries of one or two keywords, the keywords as a news topic.
+    Variants differing from an earlier one only in case are skipped, except the
+    headline form, whose casing is the point: it is only skipped when identical.
+    '''
+
+    words = _WORD.findall(query.lower())
+    keywords = [word for word in words if word not in STOPWORDS] or words
+    spelled = [ABBREVIATIONS.get(word, word) for word in keywords]
+    headline = ' '.join(f'{ABBREVIATIONS[word].title()} ({word.upper()})' if word in ABBREVIATIONS
+                        else word.capitalize() for word in keywords)
+
+    variants = [query.strip(), ' '.join(spelled), headline, ' '.join(keywords)]
+    if len(keywords) <= 2:
+        variants.append(f'latest news on {" ".join(spelled)}')
+
+    unique = []
+    for variant in variants:
+        if variant == headline:
+            duplicate = variant in unique
+        else:
+            duplicate = variant.lower() in {earlier.lower() for earlier in unique}
+        if variant and not duplicate:
+            unique.append(variant)
+    return unique[:max_variants]
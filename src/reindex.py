@@ -0,0 +1,235 @@
+import json
+import os
+import time
+import uuid
+from typing import Optional, Union, Iterable, Set
+
+import fire
+from pydantic import BaseModel
+from qdrant_client import QdrantClient
+
+from config.setting import Settings
+from config.pydantic_models import RefinedDocument, ChuckedDocument, EmbedDocument
+from embedding import GoogleTextEmbedder
+from utils.logger import setup_logger
+from utils.rate_limit import RateLimiter
+from vector_database import (IndexSpec, QdrantVectorSink, current_index_spec, target_index_spec,
+                             resolve_alias, is_legacy_collection, swap_alias)
+
+
+logger = setup_logger()
+settings = Settings()
+
+
+class ReindexState(BaseModel):
+    '''Resume point of a backfill, saved after every page'''
+
+    source : str
+    target : str
+    offset : Optional[Union[int, str]] = None  # next scroll offset in the source collection
+    scanned : int = 0  # source points read
+    articles : int = 0
+    chunks : int = 0
+    failed : int = 0
+    backfill_done : bool = False
+
+    @staticmethod
+    def path(target: str) -> str:
+        return os.path.join(settings.REINDEX_STATE_DIR, f'{target}.json')
+
+    @classmethod
+    def load(cls, source: str, target: str) -> 'ReindexState':
+        try:
+            with open(cls.path(target)) as f:
+                state = cls(**json.load(f))
+        except FileNotFoundError:
+            return cls(source=source, target=target)
+        if state.source != source:
+            logger.warning("Saved progress was made from '%s', starting over from '%s'.", state.source, source)
+            return cls(source=source, target=target)
+        return state
+
+    def save(self) -> None:
+        os.makedirs(settings.REINDEX_STATE_DIR, exist_ok=True)
+        path = self.path(self.target)
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.model_dump_json())
+        os.replace(path + '.tmp', path)  # a crash never loses the backfill offset
+
+
+def _doc_id(point) -> str:
+    '''The article id of a point. Points written before `doc_id` was in the payload
+    had the article id as their own id, which Qdrant returns as a hyphenated UUID:
+    back to the 32-hex form of `article_id`, so the live flow finds the article.'''
+    if 'doc_id' in point.payload:
+        return str(point.payload['doc_id'])
+    if isinstance(point.id, int):
+        return str(point.id)
+    return uuid.UUID(str(point.id)).hex
+
+
+def _refined(point) -> RefinedDocument:
+    '''Rebuild the refined article from a point payload, as `RefinedDocument.from_base` did'''
+    payload = point.payload
+    return RefinedDocument(
+        doc_id=_doc_id(point),
+        full_text='.'.join([payload.get('title', ''), payload.get('content', '')]),
+        metadata=payload
+    )
+
+
+def _doc_ids(client: QdrantClient, collection_name: str, page_size: int) -> Set[str]:
+    ids, offset = set(), None
+    while True:
+        points, offset = client.scroll(collection_name, limit=page_size, offset=offset,
+                                       with_payload=['doc_id'], with_vectors=False)
+        ids.update(_doc_id(point) for point in points)
+        if offset is None:
+            return ids
+
+
+class Reindexer:
+    '''Re-chunks and re-embeds articles into the collection of a target index'''
+
+    def __init__(self, client: QdrantClient, target: IndexSpec, sink: QdrantVectorSink,
+                 embedder: GoogleTextEmbedder, state: ReindexState, rate: float):
+        self._client = client
+        self._target = target
+        self._sink = sink
+        self._embedder = embedder
+        self._state = state
+        self._limiter = RateLimiter(rate)
+        self._started = time.monotonic()
+        self._start_chunks = state.chunks
+
+    def index(self, points: Iterable, seen: Set[str]) -> None:
+        '''Re-index the articles of a page of source points, once per article'''
+        embedded = []
+        for point in points:
+            doc_id = _doc_id(point)
+            if doc_id in seen:
+                continue  # another chunk of an article already re-indexed
+            seen.add(doc_id)
+            refined = _refined(point)
+            try:
+                chunks = ChuckedDocument.from_refined(refined, self._embedder,
+                                                      self._target.chunk_size, self._target.chunk_overlap)
+                for chunk in chunks:
+                    self._limiter.wait()
+                    embedded.append(EmbedDocument.from_chunked(chunk, self._embedder))
+            except Exception as e:
+                self._state.failed += 1
+                logger.error("Re-indexing %s failed: %s", doc_id, e)
+                continue
+            self._state.articles += 1
+            self._state.chunks += len(chunks)
+        if embedded:
+            self._sink.write_batch(embedded)
+
+    def report(self, total: int) -> None:
+        elapsed = time.monotonic() - self._started
+        rate = (self._state.chunks - self._start_chunks) / elapsed if elapsed else 0.0
+        logger.info("Re-index progress: %d/%d points scanned, %d articles, %d chunks, %d failed, %.1f chunks/s",
+                    self._state.scanned, total, self._state.articles, self._state.chunks, self._state.failed, rate)
+
+
+def reindex(rate: float = settings.REINDEX_RATE, page_size: int = 64, swap: bool = True,
+            drop_old: bool = False, restart: bool = False,
+            client: Optional[QdrantClient] = None, embedder: Optional[GoogleTextEmbedder] = None):
+    '''
+    Backfill the collection of the target index (REINDEX_* settings) and swap the alias to it.
+
+    Run it while the dataflow is dual-writing, i.e. with the same REINDEX_* settings:
+        1. backfill: scroll the collection behind QDRANT_COLLECTION_NAME page by page,
+           re-chunk and re-embed every article at `rate` chunks/s into the versioned
+           target collection. Progress is saved after every page and a rerun resumes there.
+        2. catch-up: re-index the articles still missing from the target, e.g. ones
+           whose dual-write failed.
+        3. swap: point the alias at the target collection atomically, searches keep working.
+    Afterwards promote the REINDEX_* values to GOOGLE_EMBEDDING_MODEL, GOOGLE_VECTOR_SIZE,
+    GOOGLE_CHUNCK_* and unset them. The old collection is kept for a rollback
+    (`swap_alias` back to it) unless `drop_old`.
+
+    A collection created before versioning carries the alias name itself, so it has
+    to be deleted before the alias can be created: the swap then needs `drop_old` and
+    searches fail for the moment between the two calls.
+
+    Args:
+        rate (float): chunks embedded per second, to stay within the embedding quota.
+        page_size (int): source points read and upserted per page.
+        swap (bool): swap the alias once the target is complete.
+        drop_old (bool): delete the previous collection after the swap.
+        restart (bool): ignore the saved progress.
+        client, embedder: default to the configured Qdrant and the target model.
+    '''
+    if settings.QDRANT_SHARDING != 'none':
+        raise ValueError('reindex.py migrates the aliased collection, not weekly shards: '
+                         'new shards follow the new settings and old ones expire with the retention')
+    target = target_index_spec()
+    if target is None:
+        raise ValueError('No migration configured: set REINDEX_EMBEDDING_MODEL, REINDEX_VECTOR_SIZE '
+                         'or REINDEX_CHUNK_* to the target index')
+
+    client = client or QdrantClient(url=settings.QDRANT_ENDPOINT, api_key=settings.QDRANT_API_KEY)
+    alias = settings.QDRANT_COLLECTION_NAME
+    legacy = is_legacy_collection(client, alias)
+    source = alias if legacy else resolve_alias(client, alias) or current_index_spec().collection_name(alias)
+    target_name = target.collection_name(alias)
+    if source == target_name:
+        raise ValueError(f"The alias '{alias}' already points to '{target_name}'")
+
+    state = ReindexState(source=source, target=target_name) if restart else ReindexState.load(source, target_name)
+    sink = QdrantVectorSink(client, target_name, vector_size=target.vector_size)
+    embedder = embedder or GoogleTextEmbedder(model_id=target.embedding_model)
+    reindexer = Reindexer(client, target, sink, embedder, state, rate)
+    total = client.count(source, exact=True).count
+    logger.info("Re-indexing '%s' into '%s' (%s, %d dims, chunks %d/%d), %d points.", source, target_name,
+                target.embedding_model, target.vector_size, target.chunk_size, target.chunk_overlap, total)
+
+    # 1. backfill, resumable
+    seen: Set[str] = set()
+    while not state.backfill_done:
+        points, state.offset = client.scroll(source, limit=page_size, offset=state.offset,
+                                             with_payload=True, with_vectors=False)
+        reindexer.index(points, seen)
+        state.scanned += len(points)
+        state.backfill_done = state.offset is None
+        state.save()
+        reindexer.report(total)
+
+    # 2. catch-up
+    missing = _doc_ids(client, source, page_size) - _doc_ids(client, target_name, page_size)
+    if missing:
+        logger.info("Catching up %d articles missing from '%s'.", len(missing), target_name)
+        offset = None
+        while True:
+            points, offset = client.scroll(source, limit=page_size, offset=offset,
+                                           with_payload=True, with_vectors=False)
+            reindexer.index([point for point in points if _doc_id(point) in missing], seen=set())
+            missing -= {_doc_id(point) for point in points}
+            if offset is None or not missing:
+                break
+        state.save()
+    reindexer.report(total)
+
+    # 3. swap
+    if not swap:
+        print(f"Backfill of '{target_name}' complete, alias '{alias}' still points to '{source}'.")
+        return
+    if legacy:
+        if not drop_old:
+            raise ValueError(f"'{alias}' is a collection, not an alias: rerun with --drop_old to replace it "
+                             f"with an alias to '{target_name}'")
+        # a dataflow still running with the old settings stops writing to it, see QdrantVectorSink
+        client.delete_collection(alias)
+        swap_alias(client, alias, target_name)
+    else:
+        swap_alias(client, alias, target_name)
+        if drop_old:
+            client.delete_collection(source)
+    print(f"Alias '{alias}' now points to '{target_name}': {state.articles} articles, {state.chunks} chunks, "
+          f"{state.failed} failed. Promote the REINDEX_* settings and restart the dataflow.")
+
+
+if __name__ == '__main__':
+    fire.Fire(reindex)
@@ -0,0 +1,88 @@
+from typing import List, Dict, Any, Optional
+from collections import Counter
+from datetime import datetime, timezone
+import re
+
+from config.setting import Settings
+
+
+settings = Settings()
+
+
+_WORD = re.compile(r'\w+')
+STOPWORDS = frozenset('''a an and are as at be by for from has have in is it its of on or that the this to
+was were will with what who how why when where latest news about'''.split())
+
+
+def query_terms(text: str) -> set:
+    '''Lowercased words of the text, without stopwords'''
+    return {word for word in _WORD.findall(text.lower()) if word not in STOPWORDS}
+
+
+def _coverage(terms: set, text: str) -> float:
+    '''Share of the query terms found in the text'''
+    if not terms or not text: return 0.0
+    return len(terms & set(_WORD.findall(text.lower()))) / len(terms)
+
+
+def _recency(published_ts: Optional[int], half_life_hours: float, now: float) -> float:
+    '''1 for an article published now, halving every `half_life_hours`; 0 when unknown'''
+    if published_ts is None: return 0.0
+    age_hours = max(now - published_ts, 0) / 3600
+    return 0.5 ** (age_hours / half_life_hours)
+
+
+def rerank(query: str,
+           candidates: List[Dict[str, Any]],
+           lexical_weight: float = settings.RERANK_LEXICAL_WEIGHT,
+           title_weight: float = settings.RERANK_TITLE_WEIGHT,
+           recency_weight: float = settings.RERANK_RECENCY_WEIGHT,
+           recency_half_life_hours: float = settings.SEARCH_RECENCY_HALF_LIFE_HOURS,
+           source_penalty: float = settings.RERANK_SOURCE_PENALTY,
+           relative_cutoff: float = settings.RERANK_RELATIVE_CUTOFF,
+           min_score: Optional[float] = settings.RERANK_MIN_SCORE,
+           min_documents: int = settings.RERANK_MIN_DOCUMENTS) -> List[Dict[str, Any]]:
+    '''Re-score the oversampled search results on CPU and drop the weak ones.
+
+    Each candidate scores its vector `score`, plus `lexical_weight` x the share of
+    query terms in its content, `title_weight` x the share in its title and
+    `recency_weight` x an exponential decay of its age. Candidates are then taken
+    greedily, each one losing `source_penalty` per candidate of the same source
+    already taken, so one outlet does not fill the context.
+
+    Candidates whose score, min-max normalized over the candidates (the best 1, the
+    worst 0), is below `relative_cutoff`, or whose score is below `min_score`, are
+    dropped, except for the `min_documents` best ones, so a summary is still built
+    from several articles. The raw scores' range depends on the embedding model,
+    the normalized one does not. `score` becomes the rerank score so the MMR packing in `build_context`
+    uses it; the search score is kept as `vector_score`.
+    '''
+    if not candidates:
+        return []
+
+    terms = query_terms(query)
+    now = datetime.now(timezone.utc).timestamp()
+    scored = []
+    for doc in candidates:
+        score = doc['score'] \
+            + lexical_weight * _coverage(terms, doc.get('content', '')) \
+            + title_weight * _coverage(terms, doc.get('title', '')) \
+            + recency_weight * _recency(doc.get('published_ts'), recency_half_life_hours, now)
+        scored.append((score, doc))
+
+    ranked: List[Dict[str, Any]] = []
+    taken = Counter()
+    while scored:
+        best = max(range(len(scored)),
+                   key=lambda i: scored[i][0] - source_penalty * taken[scored[i][1].get('source')])
+        score, doc = scored.pop(best)
+        score -= source_penalty * taken[doc.get('source')]
+        taken[doc.get('source')] += 1
+        ranked.append({**doc, 'score': score, 'vector_score': doc['score']})
+
+    ranked.sort(key=lambda doc: -doc['score'])
+    top, bottom = ranked[0]['score'], ranked[-1]['score']
+    threshold = bottom + relative_cutoff * (top - bottom)
+    if min_score is not None:
+        threshold = max(threshold, min_score)
+    return [doc for i, doc in enumerate(ranked) if i < min_documents or doc['score'] >= threshold]
@@ -0,0 +1,237 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Tuple, Dict
+
+import fire
+from qdrant_client import QdrantClient
+from qdrant_client import models
+
+from config.setting import Settings
+from config.pydantic_models import published_timestamp, parse_published
+from utils.logger import setup_logger
+from utils.rate_limit import RateLimiter
+from vector_database import resolve_alias, current_index_spec, target_index_spec, list_shards, shard_start
+
+
+logger = setup_logger()
+settings = Settings()
+
+
+def retention_rules(now: Optional[datetime] = None) -> List[Tuple[str, models.Filter]]:
+    '''
+    (rule, filter of its expired points): one rule per source of RETENTION_SOURCE_DAYS,
+    and a 'default' one with RETENTION_DAYS for every other source.
+    Points without `published_ts` never match, see `backfill_published_ts`.
+    '''
+    now = now or datetime.now(timezone.utc)
+
+    def expired(days: float) -> models.FieldCondition:
+        cutoff = int((now - timedelta(days=days)).timestamp())
+        return models.FieldCondition(key='published_ts', range=models.Range(lt=cutoff))
+
+    overrides = settings.RETENTION_SOURCE_DAYS
+    rules = [
+        (source, models.Filter(must=[
+            models.FieldCondition(key='source_name', match=models.MatchValue(value=source)),
+            expired(days)
+        ]))
+        for source, days in overrides.items()
+    ]
+    if settings.RETENTION_DAYS is not None:
+        others = [models.FieldCondition(key='source_name', match=models.MatchAny(any=list(overrides)))]
+        rules.append(('default', models.Filter(must=[expired(settings.RETENTION_DAYS)],
+                                               must_not=others if overrides else None)))
+    return rules
+
+
+def retained_collections(client: QdrantClient) -> List[str]:
+    '''The collection behind the alias, and the target collection of a running migration.
+    With weekly sharding, the shards of the current index.'''
+    alias = settings.QDRANT_COLLECTION_NAME
+    if settings.QDRANT_SHARDING == 'weekly':
+        return list_shards(client, current_index_spec().collection_name(alias))
+    collections = [resolve_alias(client, alias) or alias]
+    target = target_index_spec()
+    if target is not None and client.collection_exists(target.collection_name(alias)):
+        collections.append(target.collection_name(alias))
+    return [name for name in collections if client.collection_exists(name)]
+
+
+def point_bytes(info: models.CollectionInfo) -> int:
+    '''Estimated RAM per point: vectors kept in memory plus the HNSW graph links'''
+    vectors = info.config.params.vectors
+    size = vectors.size
+    quantization = info.config.quantization_config
+    total = 0 if vectors.on_disk else size * 4
+    if isinstance(quantization, models.ScalarQuantization):
+        total += size
+    elif isinstance(quantization, models.BinaryQuantization):
+        total += size // 8
+    if not info.config.hnsw_config.on_disk:
+        total += info.config.hnsw_config.m * 2 * 4  # level-0 links, 4-byte ids
+    return total
+
+
+def expired_shards(shards: List[str], now: Optional[datetime] = None) -> List[str]:
+    '''Shards whose whole week is older than the longest retention period'''
+    ttls = list(settings.RETENTION_SOURCE_DAYS.values())
+    if settings.RETENTION_DAYS is None:
+        return []  # the default sources are kept forever
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=max([settings.RETENTION_DAYS, *ttls]))
+    return [shard for shard in shards if shard_start(shard) + timedelta(days=7) <= cutoff]
+
+
+def legacy_timestamp(published_at: Optional[str]) -> Optional[int]:
+    '''`published_ts` of a point written before it existed: its normalized `published_at`,
+    or the raw feed date older points kept there'''
+    ts = published_timestamp(published_at)
+    if ts is None and published_at:
+        try:
+            parsed = parse_published(published_at)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        ts = int((parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp())
+    return ts
+
+
+def backfill_published_ts(client: QdrantClient, collection_name: str, batch_size: int, limiter: RateLimiter,
+                          dry_run: bool = False) -> Tuple[int, int]:
+    '''
+    Set `published_ts` on the points written before it existed, from their
+    `published_at`, so the retention rules can match them: one payload update
+    request per page of `batch_size` points. Returns the points without
+    `published_ts` and, of those, the ones whose date cannot be parsed, which are
+    never expired. With `dry_run` nothing is written.
+    '''
+    missing_filter = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key='published_ts'))])
+    missing = unparsable = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name, scroll_filter=missing_filter, limit=batch_size,
+                                       offset=offset, with_payload=['published_at'], with_vectors=False)
+        by_ts: Dict[int, list] = {}
+        for point in points:
+            ts = legacy_timestamp(point.payload.get('published_at'))
+            if ts is None:
+                unparsable += 1
+            else:
+                by_ts.setdefault(ts, []).append(point.id)
+        missing += len(points)
+        if by_ts and not dry_run:
+            limiter.wait()
+            client.batch_update_points(collection_name, wait=True, update_operations=[
+                models.SetPayloadOperation(set_payload=models.SetPayload(payload={'published_ts': ts}, points=ids))
+                for ts, ids in by_ts.items()])
+        if offset is None:
+            break
+    if missing:
+        logger.info("'%s': %d points without published_ts %s, %d without a parsable published_at.",
+                    collection_name, missing, 'to backfill' if dry_run else 'backfilled', unparsable)
+    return missing, unparsable
+
+
+def purge(client: QdrantClient, collection_name: str, point_filter: models.Filter,
+          batch_size: int, limiter: RateLimiter) -> int:
+    '''Delete the points matching `point_filter` `batch_size` at a time, return how many'''
+    removed = 0
+    while True:
+        points, _ = client.scroll(collection_name, scroll_filter=point_filter, limit=batch_size,
+                                  with_payload=False, with_vectors=False)
+        if not points:
+            return removed
+        limiter.wait()
+        client.delete(collection_name, points_selector=models.PointIdsList(points=[p.id for p in points]),
+                      wait=True)
+        removed += len(points)
+
+
+def apply_retention(client: QdrantClient, collection_name: str, dry_run: bool = False, optimize: bool = False,
+                    batch_size: int = settings.RETENTION_DELETE_BATCH,
+                    rate: float = settings.RETENTION_DELETE_RATE) -> Dict[str, int]:
+    '''Delete the expired points of one collection, return the points removed per rule.
+    Points without `published_ts` get it first, except with `dry_run` where they are
+    not counted.'''
+    limiter = RateLimiter(rate)
+    removed = {}
+    missing, unparsable = backfill_published_ts(client, collection_name, batch_size, limiter, dry_run)
+    if dry_run and missing:
+        print(f"'{collection_name}': {missing} points without published_ts are not counted, "
+              f"{missing - unparsable} of them get it from published_at on a real run.")
+    elif unparsable:
+        print(f"'{collection_name}': {unparsable} points without a parsable published_at are never expired.")
+    for rule, point_filter in retention_rules():
+        if dry_run:
+            removed[rule] = client.count(collection_name, count_filter=point_filter, exact=True).count
+        else:
+            removed[rule] = purge(client, collection_name, point_filter, batch_size, limiter)
+        logger.info("Retention '%s' in '%s': %d points %s.", rule, collection_name, removed[rule],
+                    'expired' if dry_run else 'deleted')
+
+    if optimize and not dry_run and any(removed.values()):
+        # an empty diff makes Qdrant run its optimizers now: segments holding mostly
+        # deleted points, i.e. the oldest ones, are vacuumed and their memory freed
+        client.update_collection(collection_name, optimizers_config=models.OptimizersConfigDiff())
+        logger.info("Triggered optimization of '%s'.", collection_name)
+    return removed
+
+
+def retention(dry_run: bool = False, optimize: bool = False, every_hours: Optional[float] = None,
+              batch_size: int = settings.RETENTION_DELETE_BATCH, rate: float = settings.RETENTION_DELETE_RATE,
+              client: Optional[QdrantClient] = None):
+    '''
+    Delete the articles older than their retention period from the vector collection.
+
+    Each source keeps its points for RETENTION_SOURCE_DAYS[source] days, the others for
+    RETENTION_DAYS, counted from `published_ts` (range index), which points written
+    before it existed get from their `published_at` first. Expired points are
+    deleted in batches of `batch_size` at `rate` requests per second, so searches
+    running at the same time are not slowed down. The target collection of a running
+    migration is purged too.
+
+    With weekly sharding, shards older than the longest retention period are dropped
+    whole, which frees their memory at once; the remaining shards are purged point
+    by point for the sources with a shorter period.
+
+    Args:
+        dry_run (bool): only count the expired points.
+        optimize (bool): trigger Qdrant's optimizers afterwards, so the space of the
+            deleted points is reclaimed now rather than at the next optimization.
+        every_hours (float, optional): keep running, once every `every_hours`.
+        batch_size (int): points per delete request.
+        rate (float): delete requests per second.
+        client: defaults to the configured Qdrant.
+    '''
+    client = client or QdrantClient(url=settings.QDRANT_ENDPOINT, api_key=settings.QDRANT_API_KEY)
+    while True:
+        try:
+            collections = retained_collections(client)
+            if settings.QDRANT_SHARDING == 'weekly':
+                for shard in expired_shards(collections):
+                    collections.remove(shard)
+                    info = client.get_collection(shard)
+                    if not dry_run:
+                        client.delete_collection(shard)
+                    print(f"'{shard}': expired shard {'to drop' if dry_run else 'dropped'}, {info.points_count} "
+                          f"points, ~{info.points_count * point_bytes(info) / 2**20:.1f} MiB of vectors and graph links.")
+            for collection_name in collections:
+                info = client.get_collection(collection_name)
+                removed = sum(apply_retention(client, collection_name, dry_run, optimize, batch_size, rate).values())
+                freed = removed * point_bytes(info) / 2**20
+                if dry_run:
+                    print(f"'{collection_name}': {removed} of {info.points_count} points expired, "
+                          f"~{freed:.1f} MiB of vectors and graph links to reclaim.")
+                else:
+                    print(f"'{collection_name}': {removed} points removed, "
+                          f"{client.count(collection_name, exact=True).count} left, ~{freed:.1f} MiB of vectors "
+                          f"and graph links {'reclaimed' if optimize else 'reclaimed at the next optimization'}.")
+        except Exception as e:
+            if every_hours is None:
+                raise
+            logger.error("Retention run failed, retrying in %s hours: %s", every_hours, e)
+        if every_hours is None:
+            return
+        time.sleep(every_hours * 3600)
+
+
+if __name__ == '__main__':
+    fire.Fire(retention)
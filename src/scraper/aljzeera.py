@@ -3,6 +3,7 @@ import feedparser
 from bs4 import BeautifulSoup
 from typing import Dict, Any
 import hashlib
+from utils.page_cache import fetch_feed
 
 
 def fetch_bbcsport_articles(url: str) -> Dict[str,Any]:
@@ -14,7 +15,7 @@ def fetch_bbcsport_articles(url: str) -> Dict[str,Any]:
         Dict contain news information
     """
 
-    feed  = feedparser.parse(url)
+    feed  = feedparser.parse(fetch_feed(url))
     result = []
 
     for entry in feed.entries:
@@ -2,6 +2,7 @@ import feedparser
 from bs4 import BeautifulSoup
 from typing import Dict, Any
 import hashlib
+from utils.page_cache import fetch_feed
 
 def extract_image_url(content):
     html = content[0]['value']  # get the HTML string
@@ -21,7 +22,7 @@ def fetch_arise_articles(url: str) -> Dict[str,Any]:
         Dict contain news information
     """
 
-    feed  = feedparser.parse(url)
+    feed  = feedparser.parse(fetch_feed(url))
     result = []
 
     for entry in feed.entries:
@@ -1,22 +1,22 @@
-import requests
 import feedparser
 from bs4 import BeautifulSoup
-from typing import Dict, Any
+from typing import Dict, Any, List
 import hashlib
+from utils.page_cache import fetch_page, fetch_feed
 
 
 
 
-def fetch_cbs_articles(url: str) -> Dict[str,Any]:
+def parse_cbs_feed(url: str) -> List[Dict[str,Any]]:
 
     """
-    Fetch news articles from cbs sports soccer section
-    
+    Parse the cbs sports soccer feed, without fetching the article pages
+
     return :
-        Dict contain news information
+        List of Dict contain news information, with empty content
     """
 
-    feed  = feedparser.parse(url)
+    feed  = feedparser.parse(fetch_feed(url))
     result = []
 
     for entry in feed.entries:
@@ -31,21 +31,36 @@ def fetch_cbs_articles(url: str) -> Dict[str,Any]:
             'source' : 'cbssports',
         }
 
-        
+        result.append(article)
+
+    return result
 
-        # Fetch the full content of the article
-        response = requests.get(entry.link)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            for paragraph in soup.find('div',class_='Article-bodyContent').find_all('p'):
-                article['content'] += paragraph.get_text() + '\n'
 
-            
+def fetch_cbs_page(article: Dict[str,Any], timeout: float = None) -> Dict[str,Any]:
 
-                
-        result.append(article)
-        
-    return result
+    """
+    Fetch the full content of one article from its page
+    """
+
+    response = fetch_page(article['link'], timeout=timeout)
+    if response.status_code == 200:
+        soup = BeautifulSoup(response.content, 'html.parser')
+        for paragraph in soup.find('div',class_='Article-bodyContent').find_all('p'):
+            article['content'] += paragraph.get_text() + '\n'
+
+    return article
+
+
+def fetch_cbs_articles(url: str) -> List[Dict[str,Any]]:
+
+    """
+    Fetch news articles from cbs sports soccer section
+    
+    return :
+        Dict contain news information
+    """
+
+    return [fetch_cbs_page(article) for article in parse_cbs_feed(url)]
 
 
 
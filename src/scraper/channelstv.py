@@ -2,6 +2,7 @@ import feedparser
 from typing import Dict, Any
 from bs4 import BeautifulSoup
 import hashlib
+from utils.page_cache import fetch_feed
 from utils.data_clean import clean_full
 
 def extract_image_url(content):
@@ -21,7 +22,7 @@ def fetch_channel_articles(url: str) -> Dict[str,Any]:
         Dict contain news information
     """
 
-    feed  = feedparser.parse(url)
+    feed  = feedparser.parse(fetch_feed(url))
     result = []
 
     for entry in feed.entries:
@@ -1,20 +1,20 @@
-import requests
 import feedparser
 from bs4 import BeautifulSoup
-from typing import Dict, Any
+from typing import Dict, Any, List
 import hashlib
+from utils.page_cache import fetch_page, fetch_feed
 
 
-def fetch_techcrunch_articles(url: str) -> Dict[str,Any]:
+def parse_techcrunch_feed(url: str) -> List[Dict[str,Any]]:
 
     """
-    Fetch news articles from techcrunch AI section 
-    
+    Parse the techcrunch feed, without fetching the article pages
+
     return :
-        Dict contain news information
+        List of Dict contain news information, with empty content
     """
 
-    feed  = feedparser.parse(url)
+    feed  = feedparser.parse(fetch_feed(url))
     result = []
 
     for entry in feed.entries:
@@ -29,20 +29,36 @@ def fetch_techcrunch_articles(url: str) -> Dict[str,Any]:
             'source' : 'techcrunch',
         }
 
-        
+        result.append(article)
+
+    return result
 
-        # Fetch the full content of the article
-        response = requests.get(entry.link)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            for paragraph in soup.find('div',class_='entry-content wp-block-post-content is-layout-constrained wp-block-post-content-is-layout-constrained').find_all('p'):
-                article['content'] += paragraph.get_text() + '\n'
 
-                
+def fetch_techcrunch_page(article: Dict[str,Any], timeout: float = None) -> Dict[str,Any]:
 
-        result.append(article)
-        
-    return result
+    """
+    Fetch the full content of one article from its page
+    """
+
+    response = fetch_page(article['link'], timeout=timeout)
+    if response.status_code == 200:
+        soup = BeautifulSoup(response.content, 'html.parser')
+        for paragraph in soup.find('div',class_='entry-content wp-block-post-content is-layout-constrained wp-block-post-content-is-layout-constrained').find_all('p'):
+            article['content'] += paragraph.get_text() + '\n'
+
+    return article
+
+
+def fetch_techcrunch_articles(url: str) -> List[Dict[str,Any]]:
+
+    """
+    Fetch news articles from techcrunch AI section 
+    
+    return :
+        Dict contain news information
+    """
+
+    return [fetch_techcrunch_page(article) for article in parse_techcrunch_feed(url)]
 
 
 
@@ -2,6 +2,7 @@ import feedparser
 from typing import Dict, Any
 from bs4 import BeautifulSoup
 import hashlib
+from utils.page_cache import fetch_feed
 
 def extract_image_url(content):
     html = content[0]['value']  # get the HTML string
@@ -20,7 +21,7 @@ def fetch_theverge_articles(url: str) -> Dict[str,Any]:
         Dict contain news information
     """
 
-    feed  = feedparser.parse(url)
+    feed  = feedparser.parse(fetch_feed(url))
     result = []
 
     for entry in feed.entries:
@@ -0,0 +1,323 @@
+import functools
+import heapq
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any
+from datetime import datetime, timedelta, timezone
+
+from qdrant_client import QdrantClient
+from qdrant_client import models
+
+from embedding import GoogleTextEmbedder
+from config.setting import Settings
+from query_expansion import expand_query
+from utils.data_clean import clean_full
+
+
+settings = Settings()
+
+
+qdrant = QdrantClient(settings.QDRANT_ENDPOINT,
+                      api_key=settings.QDRANT_API_KEY,)
+
+
+def window_start(max_age_hours: Optional[float] = None,
+                 published_after: Optional[datetime] = None) -> Optional[datetime]:
+    '''Lower bound of the time window, the later of `published_after` and now - `max_age_hours`'''
+    if max_age_hours is None:
+        return published_after
+    start = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+    return max(published_after, start) if published_after else start
+
+
+_shards = {'expires': 0.0, 'names': []}
+
+
+def searched_collections(client: QdrantClient,
+                         published_after: Optional[datetime] = None,
+                         published_before: Optional[datetime] = None,
+                         recent: int = settings.QDRANT_SEARCH_SHARDS) -> List[str]:
+    '''
+    Collections a search runs on: the alias, or with QDRANT_SHARDING=weekly the
+    weekly shards overlapping the time window (the `recent` newest without one).
+    The shard list is refreshed every minute.
+    '''
+
+    if settings.QDRANT_SHARDING != 'weekly':
+        return [settings.QDRANT_COLLECTION_NAME]
+
+    from vector_database import current_index_spec, list_shards, shards_for_window  # only used when sharded
+    if time.monotonic() > _shards['expires']:
+        base = current_index_spec().collection_name(settings.QDRANT_COLLECTION_NAME)
+        _shards['names'] = list_shards(client, base)
+        _shards['expires'] = time.monotonic() + 60
+    return shards_for_window(_shards['names'], published_after, published_before, recent)
+
+
+@functools.lru_cache(maxsize=None)
+def _fanout() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=settings.QDRANT_SEARCH_FANOUT_WORKERS, thread_name_prefix='shard-search')
+
+
+def fanout_query(client: QdrantClient, collections: List[str], limit: int, **query_args) -> List[models.ScoredPoint]:
+    '''Run the query on every collection concurrently and merge the top `limit` points by score'''
+    if len(collections) == 1:
+        return client.query_points(collection_name=collections[0], limit=limit, **query_args).points
+    futures = [_fanout().submit(client.query_points, collection_name=name, limit=limit, **query_args)
+               for name in collections]
+    points = [point for future in futures for point in future.result().points]
+    return heapq.nlargest(limit, points, key=lambda point: point.score)
+
+
+def fanout_batch_query(client: QdrantClient, collections: List[str],
+                       requests: List[models.QueryRequest]) -> List[List[models.ScoredPoint]]:
+    '''Run the batch of queries on every collection concurrently, one round trip per collection,
+    and merge the top points of each query by score'''
+    if len(collections) == 1:
+        return [response.points for response in client.query_batch_points(collections[0], requests=requests)]
+    futures = [_fanout().submit(client.query_batch_points, name, requests=requests) for name in collections]
+    responses = [future.result() for future in futures]
+    return [heapq.nlargest(request.limit, [point for response in responses for point in response[i].points],
+                           key=lambda point: point.score)
+            for i, request in enumerate(requests)]
+
+
+def rank_fusion(rankings: List[List[models.ScoredPoint]], limit: int,
+                k: int = settings.SEARCH_FUSION_K) -> List[models.ScoredPoint]:
+    '''
+    Reciprocal rank fusion: a point scores the sum of 1 / (k + rank) over the rankings
+    it appears in. Points come back in fused order, each with the best score it had:
+    every variant is embedded as a `RETRIEVAL_QUERY` like an unexpanded query, so
+    the scores stay on the scale of an unexpanded search.
+    '''
+    fused: Dict[Any, float] = {}
+    best: Dict[Any, models.ScoredPoint] = {}
+    for ranking in rankings:
+        for rank, point in enumerate(ranking, start=1):
+            fused[point.id] = fused.get(point.id, 0.0) + 1.0 / (k + rank)
+            if point.id not in best or point.score > best[point.id].score:
+                best[point.id] = point
+    return [best[point_id] for point_id in sorted(fused, key=fused.get, reverse=True)[:limit]]
+
+
+def embed_queries(embedder: GoogleTextEmbedder, texts: List[str]) -> List[List[float]]:
+    '''Query vectors of the texts, in one embedding request when the embedder supports it'''
+    if hasattr(embedder, 'embed_batch'):
+        vectors = embedder.embed_batch(texts, task_type='RETRIEVAL_QUERY')
+        if vectors is None:
+            raise RuntimeError(f'Embedding the query variants failed: {texts}')
+        return vectors
+    return [embedder(text, task_type='RETRIEVAL_QUERY') for text in texts]
+
+
+def build_filter(max_age_hours: Optional[float] = None,
+                 published_after: Optional[datetime] = None,
+                 published_before: Optional[datetime] = None,
+                 sources: Optional[List[str]] = None,
+                 categories: Optional[List[str]] = None) -> Optional[models.Filter]:
+    '''
+    Build a Qdrant filter on the indexed payload fields.
+
+    Args:
+        max_age_hours (float, optional): only keep articles published in the last N hours.
+        published_after (datetime, optional): lower bound of the time window.
+        published_before (datetime, optional): upper bound of the time window.
+        sources (List[str], optional): only keep articles from these `source_name`s.
+        categories (List[str], optional): only keep articles in these categories.
+    '''
+
+    published_after = window_start(max_age_hours, published_after)
+
+    conditions = []
+    if published_after is not None or published_before is not None:
+        conditions.append(models.FieldCondition(
+            key='published_ts',
+            range=models.Range(
+                gte=int(published_after.timestamp()) if published_after else None,
+                lte=int(published_before.timestamp()) if published_before else None
+            )
+        ))
+    if sources:
+        conditions.append(models.FieldCondition(key='source_name', match=models.MatchAny(any=list(sources))))
+    if categories:
+        conditions.append(models.FieldCondition(key='category', match=models.MatchAny(any=list(categories))))
+
+    return models.Filter(must=conditions) if conditions else None
+
+
+def facet_counts(key: str,
+                 query_filter: Optional[models.Filter] = None,
+                 limit: int = 20,
+                 client: Optional[QdrantClient] = None) -> Dict[str, int]:
+    '''
+    Count articles per value of a keyword-indexed payload field (`source_name`, `category`).
+
+    Counts are computed by Qdrant from the payload index and respect `query_filter`,
+    e.g. the selected time window. Counts are per point (chunk), not per article.
+    With weekly shards the counts of all shards are added up.
+    '''
+
+    client = client or qdrant
+    counts = Counter()
+    for collection_name in searched_collections(client, recent=0):
+        response = client.facet(
+            collection_name=collection_name,
+            key=key,
+            facet_filter=query_filter,
+            limit=limit
+        )
+        counts.update({hit.value: hit.count for hit in response.hits})
+    return dict(counts.most_common(limit))
+
+
+def search_params(quantization: str = settings.QDRANT_QUANTIZATION,
+                  oversampling: float = settings.QDRANT_SEARCH_OVERSAMPLING,
+                  rescore: bool = settings.QDRANT_SEARCH_RESCORE,
+                  hnsw_ef: Optional[int] = settings.QDRANT_SEARCH_HNSW_EF) -> Optional[models.SearchParams]:
+    '''
+    Search parameters matching the collection layout.
+
+    For quantized collections Qdrant fetches `oversampling` x limit candidates on the
+    quantized vectors and rescores them with the original vectors.
+    '''
+
+    quantization_params = None
+    if quantization != 'none':
+        quantization_params = models.QuantizationSearchParams(
+            ignore=False,
+            rescore=rescore,
+            oversampling=oversampling
+        )
+    if quantization_params is None and hnsw_ef is None:
+        return None
+    return models.SearchParams(hnsw_ef=hnsw_ef, quantization=quantization_params)
+
+
+def recency_query(query_vector: List[float],
+                  weight: float,
+                  half_life_hours: float,
+                  candidates: int,
+                  query_filter: Optional[models.Filter] = None,
+                  params: Optional[models.SearchParams] = None) -> Dict[str, Any]:
+    '''
+    Query arguments that rescore the vector candidates with an exponential recency decay.
+
+    Qdrant computes `score + weight * decay(now - published_ts)` on the server, where
+    the decay halves every `half_life_hours`. Points without `published_ts` get no boost.
+    '''
+
+    now = int(datetime.now(timezone.utc).timestamp())
+    return dict(
+        prefetch=models.Prefetch(query=query_vector, filter=query_filter, params=params, limit=candidates),
+        query=models.FormulaQuery(
+            formula=models.SumExpression(sum=[
+                '$score',
+                models.MultExpression(mult=[
+                    weight,
+                    models.ExpDecayExpression(exp_decay=models.DecayParamsExpression(
+                        x='published_ts',
+                        target=now,
+                        scale=half_life_hours * 3600,
+                        midpoint=0.5
+                    ))
+                ])
+            ]),
+            defaults={'published_ts': 0}
+        )
+    )
+
+
+def query_vectordatabase(query: str,
+                         limit: int = 8,
+                         with_vectors: bool = False,
+                         max_age_hours: Optional[float] = None,
+                         published_after: Optional[datetime] = None,
+                         sources: Optional[List[str]] = None,
+                         categories: Optional[List[str]] = None,
+                         recency_weight: float = settings.SEARCH_RECENCY_WEIGHT,
+                         recency_half_life_hours: float = settings.SEARCH_RECENCY_HALF_LIFE_HOURS,
+                         params: Optional[models.SearchParams] = None,
+                         expand: bool = settings.SEARCH_QUERY_EXPANSION,
+                         client: Optional[QdrantClient] = None,
+                         embedder: Optional[GoogleTextEmbedder] = None) -> List[Dict[str, Any]]:
+    '''
+    Search for news articles in the Qdrant database using the query.
+
+    Time-window, source and category filters and the recency boost are evaluated by
+    Qdrant through the payload indexes instead of being post-filtered here.
+    `params` overrides the settings-derived `search_params()`.
+
+    With weekly shards only the shards of the time window are searched (the
+    QDRANT_SEARCH_SHARDS newest without one), concurrently, and their results are
+    merged by score.
+
+    With `expand` the query is rewritten locally (`expand_query`), all variants are
+    embedded in one request and searched in one `query_batch_points` round trip,
+    and the rankings are merged with reciprocal rank fusion.
+    '''
+
+    client = client or qdrant
+    embedder  = embedder or GoogleTextEmbedder()
+    query_filter = build_filter(max_age_hours, published_after, sources=sources, categories=categories)
+    params = params or search_params()
+    collections = searched_collections(client, window_start(max_age_hours, published_after))
+
+    variants = expand_query(query) if expand else [query]
+    if len(variants) > 1:
+        points = _expanded_search(client, collections, embed_queries(embedder, variants), limit, with_vectors,
+                                  query_filter, params, recency_weight, recency_half_life_hours)
+        return _results(points)
+
+    embed_query = embedder(query, task_type='RETRIEVAL_QUERY')
+    if recency_weight > 0:
+        query_args = recency_query(embed_query, recency_weight, recency_half_life_hours,
+                                   candidates=max(limit, settings.SEARCH_RECENCY_CANDIDATES),
+                                   query_filter=query_filter, params=params)
+    else:
+        query_args = dict(query=embed_query, query_filter=query_filter, search_params=params)
+
+    points = fanout_query(
+        client,
+        collections,
+        limit=limit,
+        with_payload=True,
+        with_vectors=with_vectors,
+        **query_args
+    )
+    return _results(points)
+
+
+def _expanded_search(client: QdrantClient, collections: List[str], vectors: List[List[float]], limit: int,
+                     with_vectors: bool, query_filter: Optional[models.Filter],
+                     params: Optional[models.SearchParams], recency_weight: float,
+                     recency_half_life_hours: float) -> List[models.ScoredPoint]:
+    if not collections:
+        return []
+    requests = []
+    for vector in vectors:
+        if recency_weight > 0:
+            query_args = recency_query(vector, recency_weight, recency_half_life_hours,
+                                       candidates=max(limit, settings.SEARCH_RECENCY_CANDIDATES),
+                                       query_filter=query_filter, params=params)
+        else:
+            query_args = dict(query=vector, filter=query_filter, params=params)
+        requests.append(models.QueryRequest(limit=limit, with_payload=True, with_vector=with_vectors, **query_args))
+    return rank_fusion(fanout_batch_query(client, collections, requests), limit)
+
+
+def _results(points: List[models.ScoredPoint]) -> List[Dict[str, Any]]:
+    return [
+        {   'content': clean_full(res.payload['content']),
+            "score": res.score,
+            "title": res.payload["title"],
+            "image": res.payload["image_url"],
+            "date": res.payload["published_at"],
+            "published_ts": res.payload.get("published_ts"),
+            "original": res.payload["url"],
+            "source": res.payload.get("source_name"),
+            "source_num" : i + 1,
+            "vector": res.vector
+        }
+        for i, res in enumerate(points)
+    ]
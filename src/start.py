@@ -1,8 +1,17 @@
 from flow import build as build_flow
 from bytewax.testing import run_main
 
+from config.setting import Settings
+from consumer import kafka_consumer_config
+from utils.metrics import start_metrics_server, KafkaLagMonitor
+
+
+settings = Settings()
 
 flow = build_flow()
 
 if __name__ == "__main__":
-    run_main(flow)
\ No newline at end of file
+    start_metrics_server(settings.METRICS_PORT)
+    if settings.METRICS_PORT:
+        KafkaLagMonitor(kafka_consumer_config(), interval=settings.KAFKA_LAG_INTERVAL).start()
+    run_main(flow)
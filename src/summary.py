@@ -0,0 +1,63 @@
+import os
+from typing import Optional
+
+from jinja2 import environment,FileSystemLoader
+
+from config.setting import Settings
+from search import query_vectordatabase
+from context_builder import build_context
+from reranker import rerank
+
+
+settings = Settings()
+
+
+def get_prompt(filename: str) -> str:
+    '''
+    Load the prompt template from the given file path.
+    '''
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # This is /app/src
+    PROMPT_DIR = os.path.join(BASE_DIR, "prompts")         # This is /app/src/prompts
+    env  = environment.Environment(loader=FileSystemLoader(PROMPT_DIR))
+    Template = env.get_template(filename)
+    return Template
+
+
+def retrieve_context(query: str, max_age_hours: Optional[float] = None,
+                     categories: Optional[list] = None, sources: Optional[list] = None,
+                     **search_kwargs) -> list:
+    '''
+    Retrieve the news articles for the query and pack them into the prompt context.
+    With RERANK_ENABLED the candidates are re-ranked and cut off first (`rerank`).
+    '''
+
+    candidates = query_vectordatabase(query, limit=settings.CONTEXT_CANDIDATES, with_vectors=True,
+                                      max_age_hours=max_age_hours, categories=categories, sources=sources,
+                                      **search_kwargs)
+    if settings.RERANK_ENABLED:
+        candidates = rerank(query, candidates)
+    return build_context(candidates)
+
+
+def generate_summary(query: str, content: list, llm=None):
+    '''
+    Stream a summary of the retrieved news articles, chunk by chunk.
+
+    `llm` is any LangChain chat model; defaults to ChatGroq with the configured model.
+    '''
+
+    docu = [{"content":doc['content'],"source_num" : doc['source_num']} for doc in content]
+    prompt_template = get_prompt('summary_prompt.j2')
+    prompt = prompt_template.render(query=query, documents=docu)
+
+    if llm is None:
+        from langchain_groq import ChatGroq  # imported on first use, the UI starts without it
+        llm = ChatGroq(model=settings.GROQ_MODEL_ID,api_key=settings.GROQ_API_KEY, temperature=0.1)
+    message = [
+        ("system",prompt),
+        ("human", query)
+    ]
+
+    for chunk in llm.stream(message):
+        if chunk.content:
+            yield chunk.content
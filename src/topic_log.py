@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional
+
+import fire
+import orjson
+from bytewax.connectors.kafka import KafkaSourceMessage
+from bytewax.inputs import FixedPartitionedSource, StatefulSourcePartition
+
+from config.setting import Settings
+from utils.logger import setup_logger
+
+
+logger = setup_logger()
+settings = Settings()
+
+
+class TopicRecorder:
+    '''
+    Appends Kafka messages to a local zstd-compressed JSON-lines log, one
+    `{"ts", "topic", "key", "value"}` object per message, to be replayed into the
+    flow by `ReplaySource`. Each recorder session appends a zstd frame, so a log can
+    be extended by several runs. Safe to share between threads.
+
+    Attributes:
+        path (str): the log file, by convention `*.jsonl.zst`.
+    '''
+
+    def __init__(self, path: str, level: int = 3):
+        import zstandard
+
+        self.path = path
+        self.records = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'ab')
+        self._writer = zstandard.ZstdCompressor(level=level).stream_writer(self._file)
+        self._lock = threading.Lock()
+
+    def write(self, value: bytes, key: Optional[bytes] = None, topic: str = settings.KAFKA_TOPIC,
+              ts: Optional[float] = None) -> None:
+        '''
+        Args:
+            value (bytes): message value, the JSON payload of a BaseDocument.
+            key (bytes, optional): message key.
+            topic (str): topic the message was sent to.
+            ts (float, optional): epoch seconds it was produced, defaults to now.
+        '''
+        line = orjson.dumps({
+            'ts': time.time() if ts is None else ts,
+            'topic': topic,
+            'key': key.decode('utf-8', 'replace') if key is not None else None,
+            'value': value.decode('utf-8', 'replace'),
+        }) + b'\n'
+        with self._lock:
+            self._writer.write(line)
+            self.records += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._writer.close()  # ends the frame and closes the file
+
+    def __enter__(self) -> 'TopicRecorder':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_log(path: str) -> Iterator[dict]:
+    '''The records of a `TopicRecorder` log, in the order they were written'''
+    import io
+    import zstandard
+
+    with open(path, 'rb') as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        for line in io.BufferedReader(reader):
+            if line.strip():
+                yield orjson.loads(line)
+
+
+def _message(record: dict, offset: int) -> KafkaSourceMessage:
+    key = record.get('key')
+    return KafkaSourceMessage(key=key.encode('utf-8') if key is not None else None,
+                              value=record['value'].encode('utf-8'), topic=record.get('topic'),
+                              partition=0, offset=offset, timestamp=(1, int(record['ts'] * 1000)))
+
+
+class _ReplayPartition(StatefulSourcePartition):
+    '''Emits the recorded messages in batches, each one no earlier than its recorded
+    time relative to the first replayed message, divided by `speed`'''
+
+    def __init__(self, path: str, speed: float, batch_size: int, resume_state: Optional[int]):
+        self._records = read_log(path)
+        self._offset = resume_state or 0
+        for _ in range(self._offset):  # already replayed before the restart
+            next(self._records, None)
+        self._speed = speed
+        self._batch_size = batch_size
+        self._next = next(self._records, None)
+        self._first_ts = self._next['ts'] if self._next else 0.0
+        self._start = time.monotonic()
+
+    def _due(self, record: dict) -> float:
+        '''monotonic time at which the record is replayed'''
+        return self._start + (record['ts'] - self._first_ts) / self._speed
+
+    def next_batch(self) -> List[List[KafkaSourceMessage]]:
+        if self._next is None:
+            raise StopIteration()
+        now = time.monotonic()
+        batch = []
+        while self._next is not None and len(batch) < self._batch_size and \
+                (self._speed <= 0 or self._due(self._next) <= now):
+            batch.append(_message(self._next, self._offset))
+            self._offset += 1
+            self._next = next(self._records, None)
+        return [batch] if batch else []
+
+    def next_awake(self) -> Optional[datetime]:
+        if self._speed <= 0 or self._next is None:
+            return None
+        delay = max(self._due(self._next) - time.monotonic(), 0.0)
+        return datetime.now(timezone.utc) + timedelta(seconds=delay)
+
+    def snapshot(self) -> int:
+        return self._offset
+
+
+class ReplaySource(FixedPartitionedSource):
+    '''
+    Flow input replaying a `TopicRecorder` log, emitting lists of Kafka messages
+    like `KafkaBatchSource`, for load tests and for reproducing an incident locally.
+
+    Attributes:
+        path (str): the recorded log.
+        speed (float): 1 replays at the recorded pace, N at N times that pace,
+            0 as fast as the flow consumes.
+        batch_size (int): messages per emitted list at most.
+    '''
+
+    def __init__(self, path: str, speed: float = settings.FLOW_REPLAY_SPEED,
+                 batch_size: int = settings.KAFKA_CONSUMER_BATCH_SIZE):
+        self.path = path
+        self.speed = speed
+        self.batch_size = batch_size
+
+    def list_parts(self) -> List[str]:
+        return ['replay']
+
+    def build_part(self, step_id: str, for_part: str, resume_state: Optional[int]) -> _ReplayPartition:
+        logger.info("Replaying '%s' at %s.", self.path,
+                    f'{self.speed}x the recorded pace' if self.speed > 0 else 'full speed')
+        return _ReplayPartition(self.path, self.speed, self.batch_size, resume_state)
+
+
+def record(path: str, seconds: Optional[float] = None, limit: Optional[int] = None,
+           from_beginning: bool = False):
+    '''
+    Record the messages of KAFKA_TOPIC to a local log, with their Kafka timestamps.
+
+    No offsets are committed, so recording never affects the flow's consumer group.
+    Stop with Ctrl-C, after `seconds` or after `limit` messages.
+
+    Args:
+        path (str): the log, appended to if it exists (`*.jsonl.zst`).
+        seconds (float, optional): stop after this long.
+        limit (int, optional): stop after this many messages.
+        from_beginning (bool): start from the oldest retained message rather than new ones.
+    '''
+    from confluent_kafka import Consumer
+
+    from consumer import kafka_consumer_config
+
+    consumer = Consumer({**kafka_consumer_config(), 'group.id': f'{settings.KAFKA_TOPIC}-recorder',
+                         'enable.auto.commit': False,
+                         'auto.offset.reset': 'earliest' if from_beginning else 'latest'})
+    consumer.subscribe([settings.KAFKA_TOPIC])
+    end = time.monotonic() + seconds if seconds is not None else None
+    with TopicRecorder(path) as recorder:
+        try:
+            while (end is None or time.monotonic() < end) and (limit is None or recorder.records < limit):
+                msg = consumer.poll(1.0)
+                if msg is None:
+                    continue
+                if msg.error():
+                    logger.error("Error reading '%s': %s", settings.KAFKA_TOPIC, msg.error())
+                    continue
+                _, timestamp_ms = msg.timestamp()
+                recorder.write(msg.value(), msg.key(), msg.topic(),
+                               ts=timestamp_ms / 1000 if timestamp_ms > 0 else None)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            consumer.close()
+    print(f"Recorded {recorder.records} messages to '{path}'.")
+
+
+def replay(path: str, speed: float = settings.FLOW_REPLAY_SPEED):
+    '''Run the flow with the recorded log as its input instead of Kafka, see `ReplaySource`'''
+    from bytewax.testing import run_main
+
+    from flow import build
+
+    start = time.perf_counter()
+    run_main(build(source=ReplaySource(path, speed)))
+    print(f"Replayed '{path}' in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == '__main__':
+    fire.Fire({'record': record, 'replay': replay})
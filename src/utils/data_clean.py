@@ -1,18 +1,14 @@
-from unstructured.cleaners.core import (
-    clean,
-    clean_non_ascii_chars,
-    replace_unicode_quotes,
-    remove_punctuation,
-    clean_ordered_bullets
-
-)
-
 import html
+from html.entities import html5
 from bs4 import BeautifulSoup
 
 import re
 
 
+# a character reference html.unescape and BeautifulSoup decode the same way, or a bare '&'
+_CHARREF = re.compile(r'&(#[0-9]+;|#[xX][0-9a-fA-F]+;|[A-Za-z][A-Za-z0-9]*;)|&')
+
+
 
 
 
@@ -43,13 +39,50 @@ def remove_html_tags(text: str) -> str:
 
 def normalize_whitespace(text: str) -> str:
     if not text: return ""
-    return re.sub(r'\s+', ' ', text).strip()
+    return ' '.join(text.split())  # same result as re.sub(r'\s+', ' ', text).strip()
+
+def _safe_codepoint(codepoint: int) -> bool:
+    '''Numeric references both decoders turn into the same printable character'''
+    return (0x20 <= codepoint < 0x7f or 0xa0 <= codepoint <= 0xd7ff or 0xe000 <= codepoint <= 0xfdcf
+            or 0xfdf0 <= codepoint <= 0x10fffd) and (codepoint & 0xfffe) != 0xfffe
+
+def _simple_charrefs(text: str) -> bool:
+    '''True when every '&' in the text starts a well-formed, known character reference'''
+    for match in _CHARREF.finditer(text):
+        ref = match.group(1)
+        if ref is None:
+            return False
+        if ref[0] == '#':
+            codepoint = int(ref[2:-1], 16) if ref[1] in 'xX' else int(ref[1:-1])
+            if not _safe_codepoint(codepoint):
+                return False
+        elif ref not in html5:
+            return False
+    return True
 
 def clean_full(text: str) -> str:
+    '''Strip markup, decode entities and collapse whitespace.
+
+    Most feed text has no tags, so the HTML parser only runs when there is a '<'
+    or an entity the fast path cannot decode exactly like BeautifulSoup would
+    (bare '&', unknown names, control characters); the output is the same either way.'''
     if not text: return ""
+    if '<' not in text:
+        if '&' not in text:
+            return ' '.join(text.split())
+        if _simple_charrefs(text):
+            # the parser decodes once, html.unescape a second time
+            return ' '.join(html.unescape(html.unescape(text)).split())
     text = remove_html_tags(text)
     text = html.unescape(text)
     text = normalize_whitespace(text)
     return text
 
+def clean_url(text: str) -> str:
+    '''Strip markup and whitespace from a url, skipping the parser when there is nothing to strip'''
+    if not text: return ""
+    if '<' not in text and '&' not in text:
+        return ' '.join(text.split())
+    return normalize_whitespace(remove_html_tags(text))
+
 
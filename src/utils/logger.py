@@ -1,39 +1,134 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
 import sys
-import inspect
+import threading
+import time
 from datetime import datetime
 
+from config.setting import Settings
 
 
-def setup_logger(level=logging.INFO):
-    """Function to setup a logger with a specific name and log file."""
+# pass as `extra=SAMPLED` on per-item log calls to rate-limit them
+SAMPLED = {'sampled': True}
 
-    file_name  = f'{datetime.now().strftime("%Y-%m-%d_%H_%M_%S")}.log'
-    os.makedirs('logs',exist_ok=True)
-    log_file = os.path.join('logs',file_name)
+_TEXT_FORMAT = '%(name)s - %(levelname)s - %(message)s - Line: %(lineno)d'
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'sampled', 'suppressed'}
 
-    # Create a custom logger
-    running_filename = os.path.basename(inspect.stack()[1].filename) # get name of calling file
-    logger = logging.getLogger(running_filename)
-    logger.setLevel(level)
+_configure_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    '''One JSON object per line, including any `extra` fields of the record'''
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'line': record.lineno,
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    '''Rate-limits records logged with `extra=SAMPLED`.
+
+    Each call site (logger name + message template) may emit `per_second` records
+    per second; the rest are dropped and counted, and the count is attached to the
+    next record that gets through as `suppressed`. Other records pass untouched.'''
+
+    def __init__(self, per_second: float = 1.0):
+        super().__init__()
+        self._interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next_allowed = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sampled', False):
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_allowed.get(key, 0.0):
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            self._next_allowed[key] = now + self._interval
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f'{record.msg} (+{suppressed} similar suppressed)'
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    '''Queue handler that never blocks the caller: records are dropped when the queue is full.
+
+    Records are queued unformatted; the message is built on the writer thread.'''
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def _configure() -> None:
+    '''Attach one queue handler to the root logger and start the writer thread (once per process).
+
+    The root level is left alone, so third-party loggers stay at WARNING while the
+    module loggers returned by `setup_logger` log at their own level.'''
+    global _listener, _queue_handler
+
+    settings = Settings()
+    os.makedirs(settings.LOG_DIR, exist_ok=True)
+    log_file = os.path.join(settings.LOG_DIR, f'{datetime.now().strftime("%Y-%m-%d_%H_%M_%S")}_{os.getpid()}.log')
 
-    # Create handlers
     c_handler = logging.StreamHandler(sys.stdout)
     f_handler = logging.FileHandler(log_file)
+    c_handler.setFormatter(JsonFormatter() if settings.LOG_FORMAT == 'json' else logging.Formatter(_TEXT_FORMAT))
+    f_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_PER_SECOND))
+    _listener = logging.handlers.QueueListener(log_queue, c_handler, f_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # flush what is still queued on exit
+
+    logging.getLogger().addHandler(_queue_handler)
 
-    # Set level for handlers
-    c_handler.setLevel(level)
-    f_handler.setLevel(level)
 
-    # Create formatters and add them to handlers
-    c_format = logging.Formatter('%(name)s - %(levelname)s - %(message)s - Line: %(lineno)d')
-    f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s - Line: %(lineno)d')
-    c_handler.setFormatter(c_format)
-    f_handler.setFormatter(f_format)
+def setup_logger(level=logging.INFO, name: str = None) -> logging.Logger:
+    """Return the logger for the calling module.
 
-    # Add handlers to the logger
-    logger.addHandler(c_handler)
-    logger.addHandler(f_handler)
+    Logging is configured once per process: records go through a bounded queue
+    to a background thread that writes them to stdout and to a JSON-lines file in
+    LOG_DIR, so log I/O never runs on the processing threads. Per-item messages
+    should be logged with `extra=SAMPLED` to rate-limit them."""
 
+    if _listener is None:
+        with _configure_lock:
+            if _listener is None:
+                _configure()
+
+    if name is None:
+        name = os.path.basename(sys._getframe(1).f_code.co_filename)  # name of calling file
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
     return logger
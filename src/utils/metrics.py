@@ -0,0 +1,131 @@
+import functools
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+
+_LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+STEP_ITEMS = Counter(
+    'flow_step_items_total', 'Items entering and leaving each dataflow step', ['step', 'direction'])
+STEP_SECONDS = Histogram(
+    'flow_step_seconds', 'Time spent in each dataflow step per input item', ['step'],
+    buckets=_LATENCY_BUCKETS)
+EMBEDDING_SECONDS = Histogram(
+    'embedding_request_seconds', 'Embedding API request time', ['model'], buckets=_LATENCY_BUCKETS)
+EMBEDDING_ERRORS = Counter('embedding_errors_total', 'Failed embedding requests', ['model'])
+UPSERT_SECONDS = Histogram(
+    'qdrant_upsert_seconds', 'Qdrant upsert time per batch', ['collection'], buckets=_LATENCY_BUCKETS)
+UPSERT_BATCH_SIZE = Histogram(
+    'qdrant_upsert_batch_points', 'Points per Qdrant upsert batch', ['collection'],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+UPSERT_ERRORS = Counter('qdrant_upsert_errors_total', 'Failed Qdrant upsert batches', ['collection'])
+DEAD_LETTERS = Counter(
+    'dead_letters_total', 'Messages and documents sent to the dead-letter topic', ['stage'])
+DEDUP_CHECKS = Counter('dedup_checks_total', 'Deduplication checks by outcome', ['result'])
+CHUNK_CHANGES = Counter(
+    'chunk_changes_total', 'Chunks of new and edited articles: added, unchanged or removed', ['change'])
+CONSUMER_BATCH_SIZE = Histogram(
+    'kafka_consumer_batch_messages', 'Messages per consumed micro-batch',
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500))
+KAFKA_LAST_OFFSET = Gauge(
+    'kafka_consumer_last_offset', 'Offset of the last consumed message', ['topic', 'partition'])
+KAFKA_LAG = Gauge(
+    'kafka_consumer_lag', 'High watermark minus next offset to consume', ['topic', 'partition'])
+
+
+_server_lock = threading.Lock()
+_server_port: Optional[int] = None
+
+
+def start_metrics_server(port: int) -> None:
+    '''Expose the metrics on http://0.0.0.0:<port>/metrics (once per process, 0 disables)'''
+    global _server_port
+    if not port:
+        return
+    with _server_lock:
+        if _server_port is None:
+            start_http_server(port)
+            _server_port = port
+
+
+def instrument(step: str, func: Callable, flat: bool = False, predicate: bool = False) -> Callable:
+    '''Wrap a dataflow step function to count items in/out and time each call.
+
+    Args:
+        step (str): step_id used as the metric label.
+        func (Callable): the mapper, flat-mapper or predicate.
+        flat (bool): `func` returns an iterable of outputs (flat_map).
+        predicate (bool): `func` returns whether the item is kept (filter).
+    '''
+    items_in = STEP_ITEMS.labels(step, 'in')
+    items_out = STEP_ITEMS.labels(step, 'out')
+    seconds = STEP_SECONDS.labels(step)
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        items_in.inc()
+        start = time.perf_counter()
+        result = func(*args)
+        if flat:
+            result = list(result or [])
+        seconds.observe(time.perf_counter() - start)
+        if flat:
+            items_out.inc(len(result))
+        elif not predicate or result:
+            items_out.inc()
+        return result
+
+    return wrapper
+
+
+class KafkaLagMonitor(threading.Thread):
+    '''Periodically publishes consumer lag per partition.
+
+    The dataflow reports the offsets it consumed through `record_offset`; this
+    thread asks the broker for each partition's high watermark and sets
+    `kafka_consumer_lag` to the difference.'''
+
+    _offsets: Dict[Tuple[str, int], int] = {}
+    _offsets_lock = threading.Lock()
+
+    def __init__(self, consumer_config: Dict[str, str], interval: float = 15.0):
+        super().__init__(daemon=True, name='kafka-lag-monitor')
+        self._consumer_config = consumer_config
+        self._interval = interval
+        self._stopped = threading.Event()
+
+    @classmethod
+    def record_offset(cls, topic: Optional[str], partition: Optional[int], offset: Optional[int]) -> None:
+        if topic is None or partition is None or offset is None:
+            return
+        with cls._offsets_lock:
+            cls._offsets[(topic, partition)] = offset
+        KAFKA_LAST_OFFSET.labels(topic, str(partition)).set(offset)
+
+    def _partitions(self) -> Iterable[Tuple[Tuple[str, int], int]]:
+        with self._offsets_lock:
+            return list(self._offsets.items())
+
+    def run(self) -> None:
+        from confluent_kafka import Consumer, TopicPartition
+
+        consumer = Consumer({**self._consumer_config, 'group.id': 'news-lag-monitor',
+                             'enable.auto.commit': False})
+        try:
+            while not self._stopped.wait(self._interval):
+                for (topic, partition), offset in self._partitions():
+                    try:
+                        _, high = consumer.get_watermark_offsets(
+                            TopicPartition(topic, partition), timeout=5, cached=False)
+                    except Exception:
+                        continue
+                    KAFKA_LAG.labels(topic, str(partition)).set(max(high - offset - 1, 0))
+        finally:
+            consumer.close()
+
+    def stop(self) -> None:
+        self._stopped.set()
@@ -0,0 +1,238 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import fire
+import requests
+
+from config.setting import Settings
+
+
+settings = Settings()
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,  -- compressed bytes on disk
+    raw_size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at);
+'''
+
+
+class Page(NamedTuple):
+    '''What the scrapers read from a `requests.Response`, and where it came from'''
+    status_code: int
+    content: bytes
+    cached: bool = False
+
+
+class PageCacheMiss(LookupError):
+    '''Offline mode and the page was never cached'''
+
+
+class PageCache:
+    '''
+    Local cache of downloaded pages, so article HTML is fetched from the site once
+    and parsed again at disk speed after a selector change, a re-index or in a
+    benchmark.
+
+    Bodies are stored zstd-compressed under the sha256 of their content, so
+    identical pages behind several urls are kept once; a sqlite index maps each url
+    to its body and the ETag / Last-Modified validators the site sent. A cached page
+    younger than `max_age` is served as is, an older one is revalidated with a
+    conditional request (a 304 serves the cached body). When the blobs exceed
+    `max_bytes`, the least recently read pages are evicted. Only 200 responses are
+    cached. Safe to share between threads.
+
+    Attributes:
+        directory (str): index and blobs location.
+        max_bytes (int): compressed size limit.
+        max_age (float): seconds a page is served without asking the site.
+        offline (bool): never use the network, raise `PageCacheMiss` for uncached pages.
+        level (int): zstd compression level.
+    '''
+
+    def __init__(self,
+                 directory: str = settings.PAGE_CACHE_DIR,
+                 max_bytes: int = int(settings.PAGE_CACHE_MAX_MB * 2**20),
+                 max_age: float = settings.PAGE_CACHE_MAX_AGE,
+                 offline: bool = settings.PAGE_CACHE_OFFLINE,
+                 level: int = settings.PAGE_CACHE_ZSTD_LEVEL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.offline = offline
+        self.level = level
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.executescript(_SCHEMA)
+        self._session = requests.Session()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'blobs', digest[:2], f'{digest}.zst')
+
+    def _read_blob(self, digest: str) -> Optional[bytes]:
+        import zstandard
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                return zstandard.ZstdDecompressor().decompress(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _write_blob(self, body: bytes) -> str:
+        import zstandard
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock:
+            if self._db.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone():
+                return digest
+        compressed = zstandard.ZstdCompressor(level=self.level).compress(body)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp, path)
+        with self._lock:
+            self._db.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)', (digest, len(compressed), len(body)))
+        return digest
+
+    def _entry(self, url: str) -> Optional[tuple]:
+        with self._lock:
+            return self._db.execute('SELECT digest, etag, last_modified, fetched_at FROM pages WHERE url = ?',
+                                    (url,)).fetchone()
+
+    def _touch(self, url: str, fetched: bool = False) -> None:
+        now = time.time()
+        with self._lock:
+            if fetched:
+                self._db.execute('UPDATE pages SET accessed_at = ?, fetched_at = ? WHERE url = ?', (now, now, url))
+            else:
+                self._db.execute('UPDATE pages SET accessed_at = ? WHERE url = ?', (now, url))
+
+    def get(self, url: str, timeout: Optional[float] = None) -> Page:
+        '''The page at `url`, from the cache when it is fresh or still valid'''
+        entry = self._entry(url)
+        if entry is not None:
+            digest, etag, last_modified, fetched_at = entry
+            if self.offline or time.time() - fetched_at < self.max_age:
+                body = self._read_blob(digest)
+                if body is not None:
+                    self._touch(url)
+                    return Page(200, body, cached=True)
+                entry = None  # blob removed behind our back
+        if self.offline:
+            raise PageCacheMiss(url)
+
+        headers = {}
+        if entry is not None:
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response = self._session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and entry is not None:
+            body = self._read_blob(entry[0])
+            if body is not None:
+                self._touch(url, fetched=True)
+                return Page(200, body, cached=True)
+            response = self._session.get(url, timeout=timeout)
+        if response.status_code == 200:
+            self.put(url, response.content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return Page(response.status_code, response.content)
+
+    def put(self, url: str, body: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        digest = self._write_blob(body)
+        now = time.time()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+                             (url, digest, etag, last_modified, now, now))
+        self.evict()
+
+    def evict(self) -> int:
+        '''Drop the least recently read pages until the blobs fit in `max_bytes`, return how many'''
+        removed = []
+        with self._lock:
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            for url, digest in self._db.execute('SELECT url, digest FROM pages ORDER BY accessed_at').fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._db.execute('DELETE FROM pages WHERE url = ?', (url,))
+                if not self._db.execute('SELECT 1 FROM pages WHERE digest = ?', (digest,)).fetchone():
+                    size = self._db.execute('SELECT size FROM blobs WHERE digest = ?', (digest,)).fetchone()[0]
+                    self._db.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+                    removed.append(digest)
+                    total -= size
+        for digest in removed:
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+        return len(removed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pages = self._db.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+            blobs, size, raw_size = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(raw_size), 0) FROM blobs').fetchone()
+        return {'pages': pages, 'blobs': blobs, 'bytes': size, 'raw_bytes': raw_size}
+
+
+_default_cache: Optional[PageCache] = None
+_default_lock = threading.Lock()
+
+
+def fetch_page(url: str, timeout: Optional[float] = None) -> Page:
+    '''GET an article page through the process-wide PageCache; straight from the
+    network when PAGE_CACHE_DIR is empty'''
+    global _default_cache
+    if not settings.PAGE_CACHE_DIR:
+        response = requests.get(url, timeout=timeout)
+        return Page(response.status_code, response.content)
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = PageCache()
+    return _default_cache.get(url, timeout=timeout)
+
+
+def fetch_feed(url: str, timeout: Optional[float] = settings.SCRAPER_REQUEST_TIMEOUT) -> bytes:
+    '''GET a feed for `feedparser.parse`, never cached since it lists the new entries.
+    With a timeout, unlike `feedparser.parse(url)`, so a hung site cannot hold a run.'''
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.content
+
+
+def stats(directory: str = settings.PAGE_CACHE_DIR):
+    '''Print the pages cached, and their size compressed and raw'''
+    s = PageCache(directory).stats()
+    ratio = s['raw_bytes'] / s['bytes'] if s['bytes'] else 0.0
+    print(f"{s['pages']} pages, {s['blobs']} distinct bodies, {s['bytes'] / 2**20:.1f} MiB on disk, "
+          f"{s['raw_bytes'] / 2**20:.1f} MiB raw ({ratio:.1f}x).")
+
+
+def prune(max_mb: float = settings.PAGE_CACHE_MAX_MB, directory: str = settings.PAGE_CACHE_DIR):
+    '''Evict the least recently read pages down to `max_mb`'''
+    cache = PageCache(directory, max_bytes=int(max_mb * 2**20))
+    print(f'{cache.evict()} bodies evicted.')
+    stats(directory)
+
+
+if __name__ == '__main__':
+    fire.Fire({'stats': stats, 'prune': prune})
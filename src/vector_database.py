@@ -1,45 +1,369 @@
-from typing import Optional, List
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Set, Dict, Tuple
+from uuid import UUID, uuid5, NAMESPACE_URL
 
 from bytewax.outputs import DynamicSink, StatelessSinkPartition
 from qdrant_client import QdrantClient 
-from qdrant_client.models import  Distance,PointStruct
+from qdrant_client.models import  Distance,PointStruct,IntegerIndexParams,KeywordIndexParams,PayloadSchemaType
+from qdrant_client import models
+from pydantic import BaseModel
 
 
 from config.setting import Settings
-from utils.logger import setup_logger
-from config.pydantic_models import EmbedDocument
+from utils.logger import setup_logger, SAMPLED
+from utils.metrics import UPSERT_SECONDS, UPSERT_BATCH_SIZE, UPSERT_ERRORS, CHUNK_CHANGES
+from config.pydantic_models import EmbedDocument, ChuckedDocument
+from dead_letter import DeadLetterQueue, EMBED, UPSERT
 
 
 settings = Settings()
 logger = setup_logger()
 
 
+def collection_config(vector_size: int = settings.GOOGLE_VECTOR_SIZE,
+                      quantization: str = settings.QDRANT_QUANTIZATION,
+                      on_disk: bool = settings.QDRANT_ON_DISK_VECTORS,
+                      quantization_always_ram: bool = settings.QDRANT_QUANTIZATION_ALWAYS_RAM,
+                      hnsw_m: int = settings.QDRANT_HNSW_M,
+                      hnsw_ef_construct: int = settings.QDRANT_HNSW_EF_CONSTRUCT,
+                      hnsw_on_disk: bool = settings.QDRANT_HNSW_ON_DISK) -> dict:
+    '''Keyword arguments for `QdrantClient.create_collection`.
+
+    Args:
+        quantization (str): 'none', 'scalar' (int8, 4x smaller) or 'binary' (1 bit per dimension, 32x smaller).
+        on_disk (bool): keep the original float32 vectors on disk (memmap) instead of in RAM.
+        quantization_always_ram (bool): pin the quantized vectors in RAM, so search only
+            touches the disk to rescore the oversampled candidates.
+        hnsw_m, hnsw_ef_construct, hnsw_on_disk: HNSW graph parameters.
+    '''
+
+    if quantization == 'scalar':
+        quantization_config = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=quantization_always_ram
+            )
+        )
+    elif quantization == 'binary':
+        quantization_config = models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=quantization_always_ram)
+        )
+    elif quantization == 'none':
+        quantization_config = None
+    else:
+        raise ValueError(f"Unknown quantization '{quantization}', expected 'none', 'scalar' or 'binary'")
+
+    return dict(
+        vectors_config=models.VectorParams(
+            size=vector_size,
+            distance=Distance.COSINE,
+            on_disk=on_disk
+        ),
+        hnsw_config=models.HnswConfigDiff(
+            m=hnsw_m,
+            ef_construct=hnsw_ef_construct,
+            on_disk=hnsw_on_disk
+        ),
+        quantization_config=quantization_config
+    )
+
+
+class IndexSpec(BaseModel):
+    '''What the vectors of a collection depend on; changing any of it needs a re-index'''
+
+    embedding_model : str
+    vector_size : int
+    chunk_size : int
+    chunk_overlap : int
+
+    def collection_name(self, alias: str) -> str:
+        '''Versioned collection holding this index, e.g. news-text-embedding-004-768d-c2000o200'''
+        model = re.sub(r'[^a-z0-9]+', '-', self.embedding_model.split('/')[-1].lower()).strip('-')
+        return f'{alias}-{model}-{self.vector_size}d-c{self.chunk_size}o{self.chunk_overlap}'
+
+
+def current_index_spec() -> IndexSpec:
+    return IndexSpec(
+        embedding_model=settings.GOOGLE_EMBEDDING_MODEL,
+        vector_size=settings.GOOGLE_VECTOR_SIZE,
+        chunk_size=settings.GOOGLE_CHUNCK_MAX_INPUT_LENGTH,
+        chunk_overlap=settings.GOOGLE_CHUNCK_OVERLAP
+    )
+
+
+def target_index_spec() -> Optional[IndexSpec]:
+    '''The index a migration is moving to, from the REINDEX_* settings (None when no migration runs)'''
+    current = current_index_spec()
+    target = IndexSpec(
+        embedding_model=settings.REINDEX_EMBEDDING_MODEL or current.embedding_model,
+        vector_size=settings.REINDEX_VECTOR_SIZE or current.vector_size,
+        chunk_size=settings.REINDEX_CHUNK_SIZE or current.chunk_size,
+        chunk_overlap=settings.REINDEX_CHUNK_OVERLAP if settings.REINDEX_CHUNK_OVERLAP is not None
+        else current.chunk_overlap
+    )
+    return None if target == current else target
+
+
+def resolve_alias(client: QdrantClient, alias: str) -> Optional[str]:
+    '''Collection the alias points to, None when there is no such alias'''
+    for description in client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def is_legacy_collection(client: QdrantClient, alias: str) -> bool:
+    '''A plain collection named like the alias, created before collections were versioned'''
+    return resolve_alias(client, alias) is None and client.collection_exists(alias)
+
+
+def index_collection(client: QdrantClient, alias: str, spec: IndexSpec) -> str:
+    '''Collection the vectors of `spec` are written to: the versioned collection, or the
+    legacy collection when it holds the current index.'''
+    if spec == current_index_spec() and is_legacy_collection(client, alias):
+        return alias
+    return spec.collection_name(alias)
+
+
+def swap_alias(client: QdrantClient, alias: str, collection_name: str) -> None:
+    '''Point the alias at `collection_name` in one atomic operation, so searches never fail'''
+    operations = []
+    if resolve_alias(client, alias) is not None:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    logger.info("Alias '%s' now points to collection '%s'.", alias, collection_name)
+
+
+def shard_name(base: str, published_ts: Optional[int]) -> str:
+    '''Weekly shard of a point: `{base}-{ISO year}w{ISO week}` of its publication time (now when unknown)'''
+    moment = datetime.fromtimestamp(published_ts, timezone.utc) if published_ts is not None \
+        else datetime.now(timezone.utc)
+    year, week, _ = moment.isocalendar()
+    return f'{base}-{year}w{week:02d}'
+
+
+def shard_start(name: str) -> datetime:
+    '''Monday 00:00 UTC of the week a shard holds'''
+    year, week = re.search(r'-(\d{4})w(\d{2})$', name).groups()
+    return datetime.fromisocalendar(int(year), int(week), 1).replace(tzinfo=timezone.utc)
+
+
+def list_shards(client: QdrantClient, base: str) -> List[str]:
+    '''The weekly shards of `base`, newest first'''
+    pattern = re.compile(re.escape(base) + r'-\d{4}w\d{2}')
+    shards = [c.name for c in client.get_collections().collections if pattern.fullmatch(c.name)]
+    return sorted(shards, key=shard_start, reverse=True)
+
+
+def shards_for_window(shards: List[str], published_after: Optional[datetime] = None,
+                      published_before: Optional[datetime] = None, recent: int = 0) -> List[str]:
+    '''The shards a time window needs, or the `recent` newest ones without a window (0 = all)'''
+    if published_after is None and published_before is None:
+        return shards[:recent] if recent else shards
+    week = timedelta(days=7)
+    return [shard for shard in shards
+            if (published_after is None or shard_start(shard) + week > published_after)
+            and (published_before is None or shard_start(shard) <= published_before)]
+
+
+def point_id(doc_id: str, chunk_id: str) -> str:
+    '''Point id of a chunk: stable for the same text of the same article, so upserts are idempotent'''
+    return str(uuid5(NAMESPACE_URL, f'{doc_id}/{chunk_id}'))
+
+
+def legacy_point_id(doc_id: str) -> Optional[str]:
+    '''Point id the whole article had before it was chunked (`id=doc_id`), None when
+    the doc id is not a UUID Qdrant would have accepted'''
+    try:
+        return str(UUID(doc_id))
+    except ValueError:
+        return None
+
+
+class ChunkIndex:
+    '''
+    The chunks of each article stored in a collection, found by the `doc_id` and
+    `chunk_id` payload fields. Lets the dataflow re-embed only the chunks of an
+    edited article that are not indexed yet, refresh the payload of the others and
+    delete the ones it no longer has.
+    With `sharded` an article is written to the weekly shard of its `published_ts`
+    and looked up in every shard, since an edit can move its publication date.'''
+
+    def __init__(self, client: QdrantClient, collection_name: str, page_size: int = 256,
+                 sharded: bool = False):
+        self._client = client
+        self._collection_name = collection_name
+        self._page_size = page_size
+        self._sharded = sharded
+
+    def _target(self, chunks: List[ChuckedDocument]) -> str:
+        '''Collection the article's chunks are written to'''
+        if not self._sharded:
+            return self._collection_name
+        return shard_name(self._collection_name, chunks[0].metadata.get('published_ts'))
+
+    def _collections(self) -> List[str]:
+        '''Collections a previous version of an article can be in'''
+        if not self._sharded:
+            return [self._collection_name]
+        return list_shards(self._client, self._collection_name)
+
+    def chunk_ids(self, doc_id: str, collection_name: Optional[str] = None) -> Set[str]:
+        '''chunk_ids indexed for the article'''
+        return self._lookup(doc_id, collection_name or self._collection_name)[0]
+
+    def _lookup(self, doc_id: str, collection_name: str) -> Tuple[Set[str], bool]:
+        '''chunk_ids indexed for the article, and whether its pre-chunking point is there too'''
+        article = models.Filter(should=[models.FieldCondition(key='doc_id', match=models.MatchValue(value=doc_id))])
+        legacy_id = legacy_point_id(doc_id)
+        if legacy_id is not None:
+            article.should.append(models.HasIdCondition(has_id=[legacy_id]))
+        ids, legacy, offset = set(), False, None
+        while True:
+            points, offset = self._client.scroll(collection_name, scroll_filter=article,
+                                                 limit=self._page_size, offset=offset,
+                                                 with_payload=['chunk_id'], with_vectors=False)
+            for point in points:
+                if 'chunk_id' in point.payload:
+                    ids.add(point.payload['chunk_id'])
+                else:
+                    legacy = True
+            if offset is None:
+                return ids, legacy
+
+    def delete_chunks(self, doc_id: str, chunk_ids: Set[str], collection_name: Optional[str] = None,
+                      legacy: bool = False) -> None:
+        points = [point_id(doc_id, chunk_id) for chunk_id in chunk_ids]
+        if legacy:
+            points.append(legacy_point_id(doc_id))
+        self._client.delete(collection_name or self._collection_name, wait=False, points_selector=points)
+
+    def changed_chunks(self, doc_id: str, chunks: List[ChuckedDocument]) -> List[ChuckedDocument]:
+        '''The chunks of the article's current text that still need embedding.
+
+        The chunks already indexed get the new metadata (title, content, dates...)
+        without being embedded again. Chunks of a previous version missing from
+        `chunks`, copies in another shard and the article's pre-chunking point are
+        deleted. When the lookup fails every chunk is returned: the upsert overwrites
+        the unchanged ones, only the removed ones are left behind.'''
+        if not chunks:
+            return chunks
+        current = {chunk.chunk_id for chunk in chunks}
+        target = self._target(chunks)
+        indexed, removed, previous = set(), 0, False
+        try:
+            for collection_name in self._collections():
+                found, legacy = self._lookup(doc_id, collection_name)
+                previous = previous or bool(found) or legacy
+                stale = found - current if collection_name == target else found
+                if collection_name == target:
+                    indexed = found & current
+                if stale or legacy:
+                    self.delete_chunks(doc_id, stale, collection_name, legacy)
+                    removed += len(stale)
+            if indexed:
+                self._client.set_payload(target, payload=chunks[0].metadata, wait=False,
+                                         points=[point_id(doc_id, chunk_id) for chunk_id in indexed])
+        except Exception as e:
+            logger.error("Chunk lookup for %s in '%s' failed, re-embedding all its chunks: %s",
+                         doc_id, self._collection_name, e)
+            return chunks
+
+        changed = [chunk for chunk in chunks if chunk.chunk_id not in indexed]
+        CHUNK_CHANGES.labels('added').inc(len(changed))
+        CHUNK_CHANGES.labels('unchanged').inc(len(indexed))
+        CHUNK_CHANGES.labels('removed').inc(removed)
+        if previous:
+            logger.info("Article %s changed: %d chunks to embed, %d unchanged, %d removed.",
+                        doc_id, len(changed), len(indexed), removed, extra=SAMPLED)
+        return changed
+
 
 class QdrantVectorSink(StatelessSinkPartition):
     '''
-    A sink that writes embeddings to qdrant vector database collection'''
+    A sink that writes embeddings to qdrant vector database collection
+
+    With `sharded` (QDRANT_SHARDING=weekly) `collection_name` is the base name and
+    every document goes to the weekly shard of its `published_ts`, created on first use.
+
+    With `legacy` `collection_name` is a collection named like the alias. Once
+    `reindex.py --drop_old` replaces it with an alias to the re-indexed collection,
+    writing there would mix vectors of the old model into the new index: the
+    documents go to the dead-letter queue as chunks to embed instead, until the
+    dataflow is restarted with the new settings.'''
 
     def __init__(self,
                  client: QdrantClient,
-                 collection_name :str = None):
+                 collection_name :str = None,
+                 dead_letter: Optional[DeadLetterQueue] = None,
+                 vector_size: int = settings.GOOGLE_VECTOR_SIZE,
+                 sharded: bool = settings.QDRANT_SHARDING == 'weekly',
+                 legacy: bool = False):
         
         self._client = client
+        self._legacy = legacy
+        self._legacy_replaced = False
+        self._dead_letter = dead_letter
         self._qdrant_batch_size = settings.QDRANT_BATCH_SIZE
         self._collection_name = collection_name
+        self._vector_size = vector_size
+        self._sharded = sharded
+        self._collections: Set[str] = set()  # created and indexed
 
+        if not sharded:
+            self._ensure_collection(collection_name)
 
-       
+    def _ensure_collection(self, collection_name: str) -> None:
+        if collection_name in self._collections:
+            return
         if self._client.collection_exists(collection_name) is False:
             self._client.create_collection(
                     collection_name=collection_name,
-                    vectors_config={
-                        "size": settings.GOOGLE_VECTOR_SIZE,
-                        "distance": Distance.COSINE
-                    }
+                    **collection_config(vector_size=self._vector_size)
                 )
-            logger.info(f"Collection '{collection_name}' created successfully.")
-        
-        
+            logger.info(
+                f"Collection '{collection_name}' created successfully "
+                f"(quantization={settings.QDRANT_QUANTIZATION}, on_disk={settings.QDRANT_ON_DISK_VECTORS})."
+            )
+
+        self._create_payload_indexes(collection_name)
+        self._collections.add(collection_name)
+
+    def collection_for(self, document: EmbedDocument) -> str:
+        if not self._sharded:
+            return self._collection_name
+        return shard_name(self._collection_name, document.metadata.get('published_ts'))
+
+    def _create_payload_indexes(self, collection_name: str) -> None:
+        '''Index the payload fields the search filters on.
+
+        `published_ts` is a range-enabled integer index marked as principal, so
+        time-window filters and recency scoring are pruned by Qdrant itself.
+        `source_name` and `category` get keyword indexes for facet filters and counts,
+        `doc_id` one for looking up the chunks of an article (`ChunkIndex`).
+        Creating an index that already exists is a no-op, so this also backfills
+        collections created before the index was introduced.'''
+
+        self._client.create_payload_index(
+            collection_name=collection_name,
+            field_name='published_ts',
+            field_schema=IntegerIndexParams(
+                type=PayloadSchemaType.INTEGER,
+                lookup=False,
+                range=True,
+                is_principal=True
+            )
+        )
+        for field_name in ('source_name', 'category', 'doc_id'):
+            self._client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=KeywordIndexParams(type=PayloadSchemaType.KEYWORD)
+            )
 
     
     def write_batch(self,documents: List[EmbedDocument]):
@@ -48,46 +372,98 @@ class QdrantVectorSink(StatelessSinkPartition):
         
         Args:
             documents (List[EmbeddedDocument]): The documents to write.
+
+        Each chunk is its own point (`point_id`), its payload is the article metadata
+        plus `doc_id` and `chunk_id`. Documents of a batch that fails are sent to the
+        dead-letter queue, if any.
         '''
 
+        if self._legacy and self._replaced_by_alias():
+            logger.error("'%s' was replaced by an alias to a re-indexed collection, restart the dataflow: "
+                         "%d documents sent to the dead-letter queue.", self._collection_name, len(documents))
+            if self._dead_letter is not None:
+                error = RuntimeError(f"'{self._collection_name}' was re-indexed with another embedding model")
+                for doc in documents:
+                    chunk = ChuckedDocument(**doc.model_dump(exclude={'embedding'}))
+                    self._dead_letter.send(EMBED, error, chunk.model_dump_json().encode('utf-8'),
+                                           key=doc.doc_id.encode('utf-8'))
+            return
+
+        by_collection: Dict[str, List[EmbedDocument]] = {}
+        for doc in documents:
+            by_collection.setdefault(self.collection_for(doc), []).append(doc)
+        for collection_name, collection_documents in by_collection.items():
+            self._write(collection_name, collection_documents)
+
+    def _replaced_by_alias(self) -> bool:
+        if not self._legacy_replaced:
+            self._legacy_replaced = resolve_alias(self._client, self._collection_name) is not None
+        return self._legacy_replaced
+
+    def _write(self, collection_name: str, documents: List[EmbedDocument]) -> None:
         vectors  = [
             PointStruct(
-                id = doc.doc_id,
+                id = point_id(doc.doc_id, doc.chunk_id),
                 vector= doc.embedding,
-                payload=doc.metadata
+                payload={**doc.metadata, 'doc_id': doc.doc_id, 'chunk_id': doc.chunk_id}
             ) for doc in documents
         ]
 
+        # metrics are labelled with the base name, shards come and go every week
         for i in range(0, len(vectors), self._qdrant_batch_size):
             batch_vectors = vectors[i : i + self._qdrant_batch_size]
+            UPSERT_BATCH_SIZE.labels(self._collection_name).observe(len(batch_vectors))
             try:
-                self._client.upsert(
-                    collection_name=self._collection_name,
-                    wait =True,
-                    points=batch_vectors
-                )
+                self._ensure_collection(collection_name)
+                with UPSERT_SECONDS.labels(self._collection_name).time():
+                    self._client.upsert(
+                        collection_name=collection_name,
+                        wait =True,
+                        points=batch_vectors
+                    )
                 logger.info(
-                    f"Upserted {len(batch_vectors)} points to collection '{self._collection_name}'."
+                    "Upserted %d points to collection '%s'.", len(batch_vectors), collection_name,
+                    extra=SAMPLED
                 )
             except Exception as e:
+                UPSERT_ERRORS.labels(self._collection_name).inc()
                 logger.error(f"Caught an exception during batch upsert {e}")
+                if self._dead_letter is not None:
+                    for doc in documents[i : i + self._qdrant_batch_size]:
+                        self._dead_letter.send(UPSERT, e, doc.model_dump_json().encode('utf-8'),
+                                               key=doc.doc_id.encode('utf-8'))
 
 
 
     
 class QdrantVectorOutput(DynamicSink):
-    '''A class representing the Qdrant vector output'''
+    '''A class representing the Qdrant vector output
+
+    `collection_name` is the alias the app searches. The vectors are written to the
+    versioned collection of `spec` (the current index by default), and on first
+    use the alias is created pointing there. During a migration the flow adds a
+    second output with the target spec, see `reindex.py`.
+
+    With `sharded` the versioned collection name is the base of weekly shards
+    (`shard_name`) and no alias is created: searches find the shards by name.'''
     
 
     def __init__(
             self,
-            vector_size:int = settings.GOOGLE_VECTOR_SIZE,
+            vector_size: Optional[int] = None,
             collection_name: str = settings.QDRANT_COLLECTION_NAME,
-            client: Optional[QdrantClient] = None   
+            client: Optional[QdrantClient] = None,
+            dead_letter: Optional[DeadLetterQueue] = None,
+            spec: Optional[IndexSpec] = None,
+            sharded: bool = settings.QDRANT_SHARDING == 'weekly'
             ):
         
         self._collection_name = collection_name
-        self._vector_size = vector_size
+        self._dead_letter = dead_letter
+        self._spec = spec or current_index_spec()
+        self._sharded = sharded
+        self._index_collection = None
+        self._vector_size = vector_size or self._spec.vector_size
 
         if client:
             self.client = client
@@ -97,9 +473,25 @@ class QdrantVectorOutput(DynamicSink):
                 api_key= settings.QDRANT_API_KEY
             )
 
+    @property
+    def index_collection(self) -> str:
+        if self._index_collection is None:
+            self._index_collection = self._spec.collection_name(self._collection_name) if self._sharded \
+                else index_collection(self.client, self._collection_name, self._spec)
+        return self._index_collection
+
+    def chunk_index(self) -> ChunkIndex:
+        '''The chunks already written by this output, see `ChunkIndex`'''
+        return ChunkIndex(self.client, self.index_collection, sharded=self._sharded)
+
     def build(
             self, step_id: str , worker_index:int , 
             worker_count:int) -> StatelessSinkPartition:
         
-        return QdrantVectorSink(self.client,self._collection_name)
-        
\ No newline at end of file
+        collection_name = self.index_collection
+        sink = QdrantVectorSink(self.client, collection_name, dead_letter=self._dead_letter,
+                                vector_size=self._vector_size, sharded=self._sharded,
+                                legacy=not self._sharded and collection_name == self._collection_name)
+        if not self._sharded and not self.client.collection_exists(self._collection_name):
+            swap_alias(self.client, self._collection_name, collection_name)
+        return sink
@@ -0,0 +1,8 @@
+'''The unit tests share the benchmarks' offline setup: `src/` on the path and
+placeholder settings, and their local stand-ins (`fakes`, `fixture_server`).'''
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmarks'))
+
+import _common  # noqa: E402,F401
@@ -0,0 +1,13 @@
+import numpy as np
+import pyarrow.parquet as pq
+
+from bulk import _write_part
+
+
+def test_part_has_every_payload_field(tmp_path):
+    payloads = [{'title': 'legacy'}, {'title': 'new', 'doc_id': 'd', 'published_ts': 1}]
+    _write_part(str(tmp_path), 0, ['p1', 'p2'], [np.zeros((2, 4), dtype=np.float32)], payloads)
+    rows = pq.read_table(tmp_path / 'part-00000.parquet').to_pylist()
+    assert rows[1] == {'point_id': 'p2', 'title': 'new', 'doc_id': 'd', 'published_ts': 1}
+    assert rows[0]['doc_id'] is None
+    assert np.load(tmp_path / 'part-00000.npy').shape == (2, 4)
@@ -0,0 +1,36 @@
+from context_builder import build_context, estimate_tokens
+
+
+def doc(n: int, vector, score: float, url: str = None, words: int = 120) -> dict:
+    content = ' '.join(f'article{n}word{i}.' for i in range(words))
+    return {'score': score, 'vector': vector, 'content': content, 'original': url or f'https://news.example/{n}'}
+
+
+def test_packs_within_the_budget_and_renumbers():
+    candidates = [doc(n, [1.0, n], 1.0 - n / 10) for n in range(6)]
+    packed = build_context(candidates, token_budget=600, max_documents=8, min_passage_tokens=50)
+    assert sum(estimate_tokens(d['content']) for d in packed) <= 600
+    assert [d['source_num'] for d in packed] == list(range(1, len(packed) + 1))
+
+
+def test_skips_chunks_of_a_packed_article_and_duplicates():
+    first = doc(1, [1.0, 0.0], 0.9)
+    same_url = {**doc(2, [0.5, 0.5], 0.8), 'original': first['original']}
+    near_duplicate = doc(3, [1.0, 0.001], 0.85)
+    other = doc(4, [0.0, 1.0], 0.7)
+    packed = build_context([first, same_url, near_duplicate, other], token_budget=3000)
+    assert [d['original'] for d in packed] == [first['original'], other['original']]
+
+
+def test_max_documents():
+    candidates = [doc(n, [1.0, float(n)], 1.0) for n in range(10)]
+    assert len(build_context(candidates, max_documents=3)) == 3
+
+
+def test_an_unpunctuated_top_article_is_cut_at_a_word_boundary():
+    long_sentence = {'score': 1.0, 'vector': [1.0, 0.0], 'original': 'https://news.example/long',
+                     'content': ' '.join(f'word{i}' for i in range(2000))}
+    packed = build_context([long_sentence], token_budget=300, min_passage_tokens=50)
+    assert len(packed) == 1
+    assert 50 <= estimate_tokens(packed[0]['content']) <= 300
+    assert long_sentence['content'].startswith(packed[0]['content'] + ' ')
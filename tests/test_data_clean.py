@@ -0,0 +1,31 @@
+import pytest
+
+from utils.data_clean import clean_full, clean_url, remove_html_tags, normalize_whitespace
+
+
+def parsed(text: str) -> str:
+    '''What clean_full returns without its fast path'''
+    import html
+    return normalize_whitespace(html.unescape(remove_html_tags(text)))
+
+
+@pytest.mark.parametrize('text', [
+    'Plain   feed\n text',
+    'Fish &amp; chips &#8217;n&#x2019; more',
+    'AT&T earnings, R&D up',
+    '&unknownentity; and &amp',
+    'double &amp;amp; escaped',
+    '<p>Tagged <b>text</b></p>\n<script>x()</script>',
+    'control &#1; reference',
+])
+def test_clean_full_fast_path_matches_the_parser(text):
+    assert clean_full(text) == parsed(text)
+
+
+def test_clean_full_empty():
+    assert clean_full('') == '' and clean_full(None) == ''
+
+
+def test_clean_url():
+    assert clean_url('  https://news.example/a?b=1 ') == 'https://news.example/a?b=1'
+    assert clean_url('<a>https://news.example/a</a>') == 'https://news.example/a'
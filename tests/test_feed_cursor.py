@@ -0,0 +1,60 @@
+from feed_cursor import FeedCursors
+
+
+def entry(n: int) -> dict:
+    return {'id': f'id{n}', 'link': f'https://news.example/{n}', 'published': f'Mon, 0{n} Jan 2024 10:00:00 +0000'}
+
+
+ENTRIES = [entry(n) for n in range(1, 5)]
+
+
+def test_cursor_advances_over_the_delivered_prefix(tmp_path):
+    cursors = FeedCursors(str(tmp_path))
+    assert cursors.new_entries('s', ENTRIES) == ENTRIES
+    for n in (1, 3, 4):  # 2 is not delivered
+        cursors.delivered('s', entry(n))
+    cursors.save()
+    assert [e['id'] for e in FeedCursors(str(tmp_path)).new_entries('s', ENTRIES)] == ['id2', 'id3', 'id4']
+
+
+def test_failed_entries_do_not_hold_the_cursor(tmp_path):
+    cursors = FeedCursors(str(tmp_path))
+    cursors.new_entries('s', ENTRIES)
+    cursors.failed('s', entry(1))
+    for n in (2, 3, 4):
+        cursors.delivered('s', entry(n))
+    cursors.save()
+    assert FeedCursors(str(tmp_path)).new_entries('s', ENTRIES) == []
+
+
+def test_undelivered_entry_is_given_up_after_max_attempts(tmp_path):
+    for _ in range(2):
+        cursors = FeedCursors(str(tmp_path), max_attempts=2)
+        assert cursors.new_entries('s', ENTRIES[:1]) == ENTRIES[:1]
+        cursors.save()
+    cursors = FeedCursors(str(tmp_path), max_attempts=2)
+    assert cursors.new_entries('s', ENTRIES) == ENTRIES[1:]
+    cursors.save()
+    assert FeedCursors(str(tmp_path)).cursor('s').published_ts is not None
+
+
+def test_entries_without_a_date_are_skipped_once_done(tmp_path):
+    undated = [{'id': f'undated{n}', 'link': f'https://news.example/u{n}', 'published': 'sometime'} for n in range(3)]
+    cursors = FeedCursors(str(tmp_path))
+    assert cursors.new_entries('s', undated) == undated
+    cursors.delivered('s', undated[0])
+    cursors.failed('s', undated[1])
+    cursors.save()
+    cursors = FeedCursors(str(tmp_path))
+    assert cursors.new_entries('s', undated) == undated[2:]
+    cursors.save()
+    assert FeedCursors(str(tmp_path)).cursor('s').attempts == {'undated2': 2}
+
+
+def test_remembered_undated_ids_are_bounded(tmp_path):
+    from feed_cursor import FeedCursor
+
+    cursor = FeedCursor(source='s')
+    for n in range(5):
+        cursor.remember(f'id{n}', limit=3)
+    assert cursor.undated == ['id2', 'id3', 'id4']
@@ -0,0 +1,41 @@
+import pytest
+
+from fixture_server import FixtureServer
+from utils.page_cache import PageCache, PageCacheMiss
+
+
+@pytest.fixture(scope='module')
+def server():
+    with FixtureServer() as server:
+        yield server
+
+
+def test_revalidates_with_the_etag(server, tmp_path):
+    cache = PageCache(str(tmp_path), max_age=0)
+    url = f'{server.base_url}/article/techcrunch/0.html'
+    first = cache.get(url)
+    second = cache.get(url)
+    assert first.status_code == 200 and not first.cached
+    assert second.cached and second.content == first.content
+
+
+def test_offline_serves_cached_pages_only(server, tmp_path):
+    url = f'{server.base_url}/article/techcrunch/0.html'
+    PageCache(str(tmp_path)).get(url)
+    offline = PageCache(str(tmp_path), offline=True)
+    assert offline.get(url).cached
+    with pytest.raises(PageCacheMiss):
+        offline.get(f'{server.base_url}/article/techcrunch/1.html')
+
+
+def test_identical_bodies_are_stored_once_and_evicted_least_recent_first(tmp_path):
+    cache = PageCache(str(tmp_path), max_bytes=10**9)
+    cache.put('https://a.example/1', b'same body' * 100)
+    cache.put('https://b.example/1', b'same body' * 100)
+    assert cache.stats()['blobs'] == 1
+    cache.put('https://a.example/2', b'other body' * 100)
+    cache.max_bytes = cache.stats()['bytes'] - 1
+    assert cache.evict() == 1
+    assert cache.stats()['pages'] == 1
+    with pytest.raises(PageCacheMiss):
+        PageCache(str(tmp_path), offline=True).get('https://a.example/1')
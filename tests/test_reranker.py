@@ -0,0 +1,36 @@
+import time
+
+from reranker import rerank
+
+
+def candidate(n: int, score: float, source: str = 'a', title: str = '', content: str = '') -> dict:
+    return {'id': n, 'score': score, 'source': source, 'title': title, 'content': content,
+            'published_ts': int(time.time())}
+
+
+def test_query_terms_in_the_title_move_a_candidate_up():
+    candidates = [candidate(1, 0.80, title='Weather report'), candidate(2, 0.78, title='Nvidia chips')]
+    ranked = rerank('nvidia chips', candidates, relative_cutoff=0, source_penalty=0)
+    assert [d['id'] for d in ranked] == [2, 1]
+    assert ranked[0]['vector_score'] == 0.78
+
+
+def test_cutoff_is_on_the_normalized_score_and_keeps_min_documents():
+    candidates = [candidate(n, score) for n, score in enumerate([0.9, 0.89, 0.5, 0.49, 0.1])]
+    kept = rerank('q', candidates, relative_cutoff=0.6, source_penalty=0, recency_weight=0, min_documents=1)
+    assert [d['id'] for d in kept] == [0, 1]
+    kept = rerank('q', candidates, relative_cutoff=0.99, source_penalty=0, recency_weight=0, min_documents=3)
+    assert [d['id'] for d in kept] == [0, 1, 2]
+
+
+def test_min_score_and_source_penalty():
+    candidates = [candidate(1, 0.9, 'a'), candidate(2, 0.89, 'a'), candidate(3, 0.88, 'b')]
+    ranked = rerank('q', candidates, relative_cutoff=0, recency_weight=0, source_penalty=0.05)
+    assert [d['id'] for d in ranked] == [1, 3, 2]
+    kept = rerank('q', candidates, relative_cutoff=0, recency_weight=0, source_penalty=0, min_score=0.895,
+                  min_documents=0)
+    assert [d['id'] for d in kept] == [1]
+
+
+def test_no_candidates():
+    assert rerank('q', []) == []
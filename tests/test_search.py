@@ -0,0 +1,34 @@
+from qdrant_client import models
+
+from query_expansion import expand_query
+from search import rank_fusion
+
+
+def point(point_id: int, score: float) -> models.ScoredPoint:
+    return models.ScoredPoint(id=point_id, version=0, score=score)
+
+
+def test_rank_fusion_orders_by_reciprocal_rank_and_keeps_the_best_score():
+    fused = rank_fusion([[point(1, 0.9), point(2, 0.8)], [point(2, 0.85), point(3, 0.7)]], limit=10, k=60)
+    assert [p.id for p in fused] == [2, 1, 3]
+    assert fused[0].score == 0.85
+    assert len(rank_fusion([[point(n, 1.0) for n in range(5)]], limit=2)) == 2
+
+
+def test_expand_query():
+    variants = expand_query('latest AI chips', max_variants=5)
+    assert variants[0] == 'latest AI chips'
+    assert 'artificial intelligence chips' in variants
+    assert expand_query('AI chips', max_variants=1) == ['AI chips']
+
+
+def test_expand_query_skips_variants_differing_only_in_case():
+    variants = expand_query('who won the premier league', max_variants=5)
+    assert variants.count('won premier league') == 1
+    assert all(v.lower() != 'who won the premier league' for v in variants[1:])
+
+
+def test_headline_variant_survives_the_dedupe():
+    assert 'Artificial Intelligence (AI) Chips' in expand_query('AI chips', max_variants=4)
+    assert 'Tesla Earnings' in expand_query('tesla earnings', max_variants=4)
+    assert expand_query('Tesla Earnings', max_variants=4).count('Tesla Earnings') == 1